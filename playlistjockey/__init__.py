@@ -4,7 +4,37 @@
 
 - `Spotify`: class used to connect and extract songs from Spotify's API
 - `Tidal`: class used to connect and extract songs from Tidal's API
+- `AsyncSpotify`: asyncio counterpart of the Spotify class
+- `AsyncTidal`: asyncio counterpart of the Tidal class
+- `MixCache`: class used to store computed mixes, so unchanged playlists aren't mixed again
+- `GenreModel`: class used to score song genres on an artist similarity scale shared by all playlists
+- `LibraryIndex`: class used to build mixed sets of songs from a large feature library
+- `Transport`: class used to configure the HTTP connection pool shared by the Spotify and Tidal clients
+- `Tracer`: class used to record the API calls made while loading and updating playlists
 - `sort_playlist`: function used to call mixing algorithms
+- `merge_playlists`: function used to merge several playlists into one without duplicate songs, and mix the result
+- `iter_mix`: generator used to mix a playlist one song at a time for live queues
+- `hierarchical_sort_playlist`: function used to mix very large playlists cluster by cluster
+- `enrich_genres`: function used to fetch genres only once they are needed, optionally in the background
+- `score_playlist`: function used to check the compatibility of every song transition in a playlist order
+- `save_playlist`: function used to save a playlist DataFrame in a columnar format
+- `load_playlist`: function used to load a saved playlist DataFrame
 """
 
-from .main import Spotify, Tidal, sort_playlist, optimal_sort_playlist
+from .main import (
+    Spotify,
+    Tidal,
+    sort_playlist,
+    optimal_sort_playlist,
+    merge_playlists,
+    iter_mix,
+)
+from .hierarchy import hierarchical_sort_playlist
+from .scoring import score_playlist
+from .cache import MixCache
+from .genres import GenreModel, enrich_genres
+from .library import LibraryIndex
+from .storage import save_playlist, load_playlist
+from .transport import Transport
+from .tracing import Tracer
+from .aio import AsyncSpotify, AsyncTidal
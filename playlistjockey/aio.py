@@ -0,0 +1,703 @@
+# playlistjockey/aio.py
+
+"""Module containing asyncio counterparts of the Spotify and Tidal classes.
+
+The async clients call the Spotify and Tidal Web APIs directly with httpx, so every request runs on the event loop, and thousands of track
+lookups are in flight at once under a semaphore instead of being bounded by a thread pool. Requests use the connection pool size, timeouts,
+retries and backoff of the Spotify object's `Transport`, and are recorded as spans by its `Tracer`, grouped per playlist. Songs are looked up
+in batches where the API allows it, and results are assembled exactly like the blocking API, so the returned DataFrames can be passed straight
+into `sort_playlist`.
+
+Tokens are taken from the Spotify and Tidal objects the async clients wrap. Refreshing them is the only blocking call left, and it runs in a
+thread. Close a client with `aclose()`, or use it as an async context manager, to close its connections. Requires httpx, installed with
+"pip install playlistjockey[async]".
+
+The module contains the following classes:
+
+- `AsyncSpotify(spotify, concurrency=16)`: Async client for pulling and pushing playlists to and from Spotify.
+    - `get_playlist_features(self, playlist_id, genres=False, compact=False)`: Pull in all required features of songs in a given playlist.
+    - `update_playlist(self, playlist_id, playlist_df)`: Overwrites the songs and order of the given playlist ID, using the songs in the given playlist DataFrame.
+    - `aclose(self)`: Closes the client's connections.
+- `AsyncTidal(tidal, concurrency=16)`: Async client for pulling and pushing playlists to and from Tidal.
+    - `get_playlist_features(self, playlist_id, genres=False, compact=False)`: Pull in all required features of songs in a given playlist.
+    - `update_playlist(self, playlist_id, playlist_df)`: Overwrites the songs and order of the given playlist ID, using the songs in the given playlist DataFrame.
+    - `aclose(self)`: Closes the client's connections.
+"""
+
+import asyncio
+import contextlib
+import email.utils
+import html
+import time
+
+from playlistjockey import main, tracing, utils
+from playlistjockey.transport import RETRY_STATUSES
+from playlistjockey.spotify import extract as sp_extract
+from playlistjockey.tidal import extract as td_extract
+
+SPOTIFY_API_URL = "https://api.spotify.com/v1/"
+
+# Largest number of IDs accepted by each of Spotify's batch endpoints
+TRACKS_BATCH_SIZE = 50
+AUDIO_FEATURES_BATCH_SIZE = 100
+ARTISTS_BATCH_SIZE = 50
+
+
+def _import_httpx():
+    """Helper function to import httpx, which is only required for the async clients."""
+    try:
+        import httpx
+    except ImportError:
+        raise ImportError(
+            'The async clients require httpx. Install it with "pip install playlistjockey[async]".'
+        )
+
+    return httpx
+
+
+def _batches(items, size):
+    """Helper function to split a list into consecutive batches of the given size."""
+    return [items[i : i + size] for i in range(0, len(items), size)]
+
+
+def _retry_after(response):
+    """Helper function to read how many seconds a throttled response asks to wait, if it says."""
+    value = response.headers.get("Retry-After")
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        retry_at = email.utils.parsedate_to_datetime(value)
+        return max(retry_at.timestamp() - time.time(), 0)
+
+
+class _AsyncAPI:
+    """Base class sending the requests of one provider through an httpx client, with the transport's retry policy, recording each request
+    as a span.
+
+    Args:
+        client (httpx.AsyncClient object): Client the requests are sent with.
+        transport (playlistjockey.transport.Transport object): Transport whose retries and backoff are applied.
+        tracer (playlistjockey.tracing.Tracer object): Tracer recording the requests, if any.
+        semaphore (asyncio.Semaphore object): Semaphore bounding the number of requests in flight.
+    """
+
+    provider = None
+    base_url = None
+
+    def __init__(self, client, transport, tracer, semaphore):
+        self._client = client
+        self._transport = transport
+        self._tracer = tracer
+        self._semaphore = semaphore
+        self._auth_lock = asyncio.Lock()
+
+    async def _auth_headers(self, expired=None):
+        """Helper function to get the authorization headers, refreshing the token if the given headers were rejected as expired."""
+        raise NotImplementedError
+
+    def _params(self, params):
+        """Helper function to add the parameters the provider expects on every request."""
+        return params
+
+    def _span(self, endpoint):
+        """Helper function to record a request as a span, or to count it in a throwaway span without a tracer."""
+        if self._tracer is None:
+            return contextlib.nullcontext({"bytes": 0, "retries": 0, "requests": 0})
+        return self._tracer.span(self.provider, endpoint)
+
+    def _backoff(self, retry):
+        """Helper function to compute the backoff before the given retry, like urllib3: none before the first, doubling after that."""
+        if retry <= 1:
+            return 0
+        return self._transport.backoff_factor * 2 ** (retry - 1)
+
+    async def request(
+        self, endpoint, method, path, params=None, headers=None, **kwargs
+    ):
+        """Send a request to the provider, retrying failed connections and throttled requests (429/5xx) like the transport does, and
+        refreshing an expired token once.
+
+        Args:
+            endpoint (str): Name of the endpoint, recorded in the request's span.
+            method (str): HTTP method.
+            path (str): Path of the endpoint, relative to the provider's API URL.
+            params (dict): Query parameters.
+            headers (dict): Headers, besides the authorization headers.
+            **kwargs: Other arguments of httpx.AsyncClient.request, such as json or data.
+
+        Returns:
+            response (httpx.Response object): The successful response.
+        """
+        httpx = _import_httpx()
+        retries = 0
+        refreshed = False
+        async with self._semaphore:
+            with self._span(endpoint) as span:
+                auth_headers = await self._auth_headers()
+                while True:
+                    try:
+                        response = await self._client.request(
+                            method,
+                            self.base_url + path,
+                            params=self._params(params or {}),
+                            headers=dict(headers or {}, **auth_headers),
+                            **kwargs,
+                        )
+                    except (httpx.ConnectError, httpx.ConnectTimeout):
+                        if retries >= self._transport.retries:
+                            raise
+                        retries += 1
+                        span["retries"] += 1
+                        await asyncio.sleep(self._backoff(retries))
+                        continue
+
+                    if response.status_code == 401 and not refreshed:
+                        refreshed = True
+                        auth_headers = await self._auth_headers(expired=auth_headers)
+                        continue
+                    if (
+                        response.status_code in RETRY_STATUSES
+                        and retries < self._transport.retries
+                    ):
+                        retries += 1
+                        span["retries"] += 1
+                        delay = _retry_after(response)
+                        await asyncio.sleep(
+                            self._backoff(retries) if delay is None else delay
+                        )
+                        continue
+                    break
+
+                span["requests"] += 1
+                span["bytes"] += len(response.content)
+                response.raise_for_status()
+
+        return response
+
+    async def get(self, endpoint, path, params=None):
+        """Send a GET request to the provider and return its decoded JSON body."""
+        response = await self.request(endpoint, "GET", path, params)
+        return response.json()
+
+
+class _SpotifyAPI(_AsyncAPI):
+    """Requests to the Spotify Web API, authorized with the token of a spotipy client."""
+
+    provider = "spotify"
+    base_url = SPOTIFY_API_URL
+
+    def __init__(self, sp, client, transport, tracer, semaphore):
+        super().__init__(client, transport, tracer, semaphore)
+        self._auth_manager = sp.auth_manager
+        self._token = None
+        self._expires_at = 0
+
+    async def _auth_headers(self, expired=None):
+        async with self._auth_lock:
+            # spotipy refreshes the token a minute before it expires, so it is fetched again from then on
+            if self._token is None or time.time() >= self._expires_at - 60:
+                self._token = await asyncio.to_thread(
+                    self._auth_manager.get_access_token, as_dict=False
+                )
+                token_info = self._auth_manager.cache_handler.get_cached_token() or {}
+                self._expires_at = token_info.get("expires_at", time.time() + 120)
+
+            return {"Authorization": "Bearer " + self._token}
+
+    async def playlist_track_ids(self, playlist_id):
+        """Collects the IDs of all tracks in a playlist, fetching the remaining pages concurrently once the first page reveals the total."""
+        path = "playlists/{}/tracks".format(sp_extract.get_playlist_id(playlist_id))
+        params = {
+            "fields": sp_extract.PLAYLIST_ITEM_FIELDS,
+            "limit": sp_extract.PAGE_SIZE,
+        }
+
+        first_page = await self.get("playlist_items", path, params)
+        offsets = range(sp_extract.PAGE_SIZE, first_page["total"], sp_extract.PAGE_SIZE)
+        pages = [first_page] + list(
+            await asyncio.gather(
+                *[
+                    self.get("playlist_items", path, dict(params, offset=i))
+                    for i in offsets
+                ]
+            )
+        )
+
+        song_ids = []
+        for page in pages:
+            utils.show_tracks(page, song_ids)
+
+        return song_ids
+
+    async def _batched(self, endpoint, path, key, ids, size):
+        """Helper function to fetch objects by ID from a batch endpoint, all batches at once.
+
+        Returns:
+            found (dict): Object of each ID that was found.
+            errors (dict): Error of each ID whose batch failed.
+        """
+        batches = _batches(ids, size)
+        results = await asyncio.gather(
+            *[self.get(endpoint, path, {"ids": ",".join(i)}) for i in batches],
+            return_exceptions=True,
+        )
+
+        found = {}
+        errors = {}
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                errors.update(dict.fromkeys(batch, repr(result)))
+                continue
+            for song_id, item in zip(batch, result[key]):
+                if item is not None:
+                    found[song_id] = item
+
+        return found, errors
+
+    async def tracks(self, track_ids):
+        """Fetches the track objects of the given tracks, 50 tracks per request."""
+        return await self._batched(
+            "tracks", "tracks", "tracks", track_ids, TRACKS_BATCH_SIZE
+        )
+
+    async def audio_features(self, track_ids):
+        """Fetches the audio features objects of the given tracks, 100 tracks per request."""
+        return await self._batched(
+            "audio_features",
+            "audio-features",
+            "audio_features",
+            track_ids,
+            AUDIO_FEATURES_BATCH_SIZE,
+        )
+
+    async def _artist_genres(self, artist_id, artist_info):
+        """Helper function to combine the genres of an artist and its related artists."""
+        related = await self.get(
+            "artist_related_artists", "artists/{}/related-artists".format(artist_id)
+        )
+        return sp_extract.remember_artist_genres(
+            artist_id, artist_info, related["artists"]
+        )
+
+    async def artist_genres(self, artist_ids):
+        """Collects the genres of the given artists and their related artists. Artists already requested by this process aren't requested
+        again.
+
+        Returns:
+            genres (dict): Genres of each artist whose genres could be collected.
+        """
+        genres = {}
+        unknown = []
+        for i in dict.fromkeys(artist_ids):
+            if i in sp_extract._artist_genres:
+                genres[i] = sp_extract._artist_genres[i]
+            else:
+                unknown.append(i)
+
+        artists, _ = await self._batched(
+            "artists", "artists", "artists", unknown, ARTISTS_BATCH_SIZE
+        )
+        results = await asyncio.gather(
+            *[self._artist_genres(i, artist) for i, artist in artists.items()],
+            return_exceptions=True,
+        )
+        for artist_id, result in zip(artists, results):
+            if not isinstance(result, Exception):
+                genres[artist_id] = result
+
+        return genres
+
+    async def track_genres(self, tracks):
+        """Collects the genres of the artists of the given track objects, and their related artists.
+
+        Returns:
+            genres (dict): Genre list of each track ID whose artists' genres could all be collected.
+        """
+        artist_genres = await self.artist_genres(
+            [a["id"] for track in tracks.values() for a in track["artists"]]
+        )
+
+        genres = {}
+        for track_id, track in tracks.items():
+            artist_ids = [a["id"] for a in track["artists"]]
+            if all(i in artist_genres for i in artist_ids):
+                genres[track_id] = list(
+                    {g for i in artist_ids for g in artist_genres[i]}
+                )
+
+        return genres
+
+    async def search(self, query, match):
+        """Runs a track search query and matches its results."""
+        results = await self.get("search", "search", {"q": query, "type": "track"})
+        return match(results["tracks"]["items"])
+
+
+class _TidalAPI(_AsyncAPI):
+    """Requests to the Tidal API, authorized with the session of a tidalapi client."""
+
+    provider = "tidal"
+
+    def __init__(self, td, client, transport, tracer, semaphore):
+        super().__init__(client, transport, tracer, semaphore)
+        self._td = td
+        self.base_url = td.config.api_v1_location
+
+    async def _auth_headers(self, expired=None):
+        async with self._auth_lock:
+            headers = {
+                "Authorization": "{} {}".format(
+                    self._td.token_type, self._td.access_token
+                )
+            }
+            # Only the first request rejected with the current token refreshes it
+            if expired is not None and expired == headers:
+                await asyncio.to_thread(self._td.token_refresh, self._td.refresh_token)
+                headers["Authorization"] = "{} {}".format(
+                    self._td.token_type, self._td.access_token
+                )
+
+            return headers
+
+    def _params(self, params):
+        return dict(
+            params, countryCode=self._td.country_code, sessionId=self._td.session_id
+        )
+
+    async def playlist(self, playlist_id):
+        """Fetches a playlist object, along with its ETag, which is required to modify the playlist."""
+        response = await self.request(
+            "playlist", "GET", "playlists/{}".format(playlist_id)
+        )
+        return response.json(), response.headers.get("etag")
+
+    async def playlist_media(self, playlist_id, total):
+        """Collects all media items in a playlist, tracks and videos alike, fetching all pages at once."""
+        path = "playlists/{}/items".format(playlist_id)
+        pages = await asyncio.gather(
+            *[
+                self.get(
+                    "playlist_items",
+                    path,
+                    {"limit": td_extract.PAGE_SIZE, "offset": offset},
+                )
+                for offset in range(0, total, td_extract.PAGE_SIZE)
+            ]
+        )
+
+        return [i for page in pages for i in page["items"]]
+
+
+class _AsyncClient:
+    """Base class holding the httpx client and semaphore shared by the requests of an async client."""
+
+    def __init__(self, transport, tracer, concurrency):
+        httpx = _import_httpx()
+        self.concurrency = concurrency
+        self.transport = transport
+        self.tracer = tracer
+        connect_timeout, read_timeout = transport.timeout
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=transport.pool_size,
+                max_keepalive_connections=transport.pool_size,
+            ),
+            headers={"Accept-Encoding": "gzip, deflate"},
+        )
+        self._semaphore = asyncio.Semaphore(concurrency)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def aclose(self):
+        """Closes the client's connections. The client can't be used afterwards."""
+        await self._client.aclose()
+
+
+def _assemble(song_ids, loaded, failed):
+    """Helper function to report the songs that failed to load, and put the loaded songs in playlist order, keeping songs that appear more
+    than once at every position."""
+    main._report_failures(failed)
+    return [(i, loaded[i]) for i in song_ids if i in loaded]
+
+
+class AsyncSpotify(_AsyncClient):
+    """Async client for pulling and pushing playlists to and from Spotify.
+
+    Args:
+        spotify (playlistjockey.main.Spotify object): Spotify object by calling the playlistjockey.Spotify class. Its token, transport
+            settings and tracer are used.
+        concurrency (int): Maximum number of requests in flight. Keep this at or below the pool size of the Spotify object's transport.
+
+    Attributes:
+        sp (spotipy.client.Spotify object): Spotify API client used to connect to your account.
+    """
+
+    def __init__(self, spotify, concurrency=16):
+        super().__init__(spotify.transport, spotify.tracer, concurrency)
+        self.spotify = spotify
+        self.sp = spotify.sp
+        self._api = _SpotifyAPI(
+            self.sp, self._client, self.transport, self.tracer, self._semaphore
+        )
+
+    @tracing.traced_run("spotify")
+    async def get_playlist_features(self, playlist_id, genres=False, compact=False):
+        """Pull in all required features of songs in a given playlist.
+
+        Args:
+            playlist_id (str): Unique Spotify playlist ID or shared link.
+            genres (bool): Also collect the genres of each song's artists, adding the "genres" and "artist_similarity" columns required by the genre mix. Otherwise genres are
+                fetched once the genre mix first needs them, or with enrich_genres.
+            compact (bool): Return the playlist using the compact dtype layout from `utils.compact_playlist`.
+
+        Returns:
+            playlist_df (pd.DataFrame): DataFrame of all tracks and their features in the inputted playlist. To be used as input into the sort_playlist function.
+        """
+        song_ids = await self._api.playlist_track_ids(playlist_id)
+        unique_ids = list(dict.fromkeys(song_ids))
+
+        # Fetch the track and audio features objects of all songs at once
+        (tracks, failed), (audio, audio_failed) = await asyncio.gather(
+            self._api.tracks(unique_ids), self._api.audio_features(unique_ids)
+        )
+        failed.update(audio_failed)
+        track_genres = {}
+        if genres:
+            track_genres = await self._api.track_genres(tracks)
+
+        loaded = {}
+        for i in unique_ids:
+            if i in failed:
+                continue
+            if i not in tracks or i not in audio or (genres and i not in track_genres):
+                failed[i] = "Not found"
+                continue
+            loaded[i] = sp_extract.track_features_from(tracks[i], audio[i])
+            if genres:
+                loaded[i]["genres"] = track_genres[i]
+
+        feature_store = _assemble(song_ids, loaded, failed)
+
+        return main._build_playlist_df(feature_store, genres, compact, self.sp)
+
+    @tracing.traced_run("spotify")
+    async def update_playlist(self, playlist_id, playlist_df):
+        """Overwrites the songs and order of the given playlist ID, using the songs in the given playlist DataFrame.
+
+        Args:
+            playlist_id (str): Unique Spotify playlist ID or shared link.
+            playlist_df (pd.DataFrame): DataFrame containing the new tracks and order the playlist will be in. This is intended to be the returned DataFrame from the sort_playlist function.
+        """
+        playlist_id = sp_extract.get_playlist_id(playlist_id)
+        path = "playlists/{}/tracks".format(playlist_id)
+        uris = ["spotify:track:" + i for i in playlist_df["track_id"]]
+
+        # Replace the songs with the first 100, then add the rest in order, 100 songs at a time
+        batches = _batches(uris, 100) or [[]]
+        await self._api.request(
+            "playlist_replace_items", "PUT", path, json={"uris": batches[0]}
+        )
+        for batch in batches[1:]:
+            await self._api.request(
+                "playlist_add_items", "POST", path, json={"uris": batch}
+            )
+
+        playlist = await self._api.get(
+            "playlist", "playlists/{}".format(playlist_id), {"fields": "description"}
+        )
+        desc_keep = html.unescape(playlist["description"] or "").split("(", 1)[0]
+        await self._api.request(
+            "playlist_change_details",
+            "PUT",
+            "playlists/{}".format(playlist_id),
+            json={"description": desc_keep + " (Mixed by playlistjockey)"},
+        )
+
+
+class AsyncTidal(_AsyncClient):
+    """Async client for pulling and pushing playlists to and from Tidal.
+
+    Args:
+        tidal (playlistjockey.main.Tidal object): Tidal object by calling the playlistjockey.Tidal class. Its session, transport settings,
+            tracer and parallel_search option are used.
+        concurrency (int): Maximum number of requests in flight. Keep this at or below the pool size of the Tidal object's transport.
+
+    Attributes:
+        sp (spotipy.client.Spotify object): Spotify API client used to connect to your account.
+        td (tidalapi.session.Session object): Tidal API client used to connect to your account.
+    """
+
+    def __init__(self, tidal, concurrency=16):
+        super().__init__(tidal.transport, tidal.tracer, concurrency)
+        self.tidal = tidal
+        self.sp = tidal.sp
+        self.td = tidal.td
+        self._sp_api = _SpotifyAPI(
+            self.sp, self._client, self.transport, self.tracer, self._semaphore
+        )
+        self._td_api = _TidalAPI(
+            self.td, self._client, self.transport, self.tracer, self._semaphore
+        )
+
+    async def _spotify_id(self, isrc, title, artist):
+        """Helper function to identify a Tidal song in Spotify. If the Tidal object searches in parallel, all searches are issued at once and
+        the match of the highest precedence search wins, otherwise they are issued one at a time until one matches.
+        """
+        searches = td_extract.spotify_id_searches(isrc, title, artist)
+        if not self.tidal.parallel_search:
+            for query, match in searches:
+                result = await self._sp_api.search(query, match)
+                if result:
+                    return result
+            return None
+
+        tasks = [
+            asyncio.ensure_future(self._sp_api.search(query, match))
+            for query, match in searches
+        ]
+        try:
+            for task in tasks:
+                result = await task
+                if result:
+                    return result
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        return None
+
+    async def _match(self, item):
+        """Helper function to find the Spotify track of a Tidal media object from a playlist."""
+        media = item["item"]
+        artist = media.get("artist") or media["artists"][0]
+        isrc = media.get("isrc") if item["type"] == "track" else None
+
+        return await self._spotify_id(isrc, media["title"], artist["name"])
+
+    @tracing.traced_run("tidal")
+    async def get_playlist_features(self, playlist_id, genres=False, compact=False):
+        """Pull in all required features of songs in a given playlist.
+
+        Args:
+            playlist_id (str): Unique Tidal playlist ID or shared link.
+            genres (bool): Also collect the genres of each song's artists, adding the "genres" and "artist_similarity" columns required by the genre mix. Otherwise genres are
+                fetched once the genre mix first needs them, or with enrich_genres.
+            compact (bool): Return the playlist using the compact dtype layout from `utils.compact_playlist`.
+
+        Returns:
+            playlist_df (pd.DataFrame): DataFrame of all tracks and their features in the inputted playlist. To be used as input into the sort_playlist function.
+        """
+        playlist_id = td_extract.get_playlist_id(playlist_id)
+        playlist, _ = await self._td_api.playlist(playlist_id)
+        total = playlist["numberOfTracks"] + max(playlist.get("numberOfVideos", 0), 0)
+        items = await self._td_api.playlist_media(playlist_id, total)
+        song_ids = [i["item"]["id"] for i in items]
+        media = {i["item"]["id"]: i for i in items}
+
+        # Find every song in Spotify at once
+        matches = await asyncio.gather(
+            *[self._match(i) for i in media.values()], return_exceptions=True
+        )
+        failed = {}
+        sp_track_ids = {}
+        for media_id, result in zip(media, matches):
+            if isinstance(result, Exception):
+                failed[media_id] = repr(result)
+            elif result is None:
+                failed[media_id] = "Not found in Spotify"
+            else:
+                sp_track_ids[media_id] = result
+
+        # Then fetch the audio features, and genres, of the matched Spotify tracks
+        unique_sp_ids = list(dict.fromkeys(sp_track_ids.values()))
+        audio, _ = await self._sp_api.audio_features(unique_sp_ids)
+        track_genres = {}
+        if genres:
+            tracks, _ = await self._sp_api.tracks(unique_sp_ids)
+            track_genres = await self._sp_api.track_genres(tracks)
+
+        loaded = {}
+        for media_id, sp_track_id in sp_track_ids.items():
+            if sp_track_id not in audio or (genres and sp_track_id not in track_genres):
+                failed[media_id] = "Features not found in Spotify"
+                continue
+            item = media[media_id]["item"]
+            loaded[media_id] = td_extract.song_features_from(
+                media_id,
+                sp_track_id,
+                item["title"],
+                [a["name"] for a in item["artists"]],
+                item.get("isrc") if media[media_id]["type"] == "track" else None,
+                item["duration"],
+                item["popularity"],
+                audio[sp_track_id],
+            )
+            if genres:
+                loaded[media_id]["genres"] = track_genres[sp_track_id]
+
+        feature_store = _assemble(song_ids, loaded, failed)
+
+        return main._build_playlist_df(
+            feature_store, genres, compact, self.sp, "sp_track_id"
+        )
+
+    @tracing.traced_run("tidal")
+    async def update_playlist(self, playlist_id, playlist_df):
+        """Overwrites the songs and order of the given playlist ID, using the songs in the given playlist DataFrame.
+
+        Args:
+            playlist_id (str): Unique Tidal playlist ID or shared link.
+            playlist_df (pd.DataFrame): DataFrame containing the new tracks and order the playlist will be in. This is intended to be the returned DataFrame from the sort_playlist function.
+        """
+        playlist_id = td_extract.get_playlist_id(playlist_id)
+        path = "playlists/{}".format(playlist_id)
+        playlist, etag = await self._td_api.playlist(playlist_id)
+
+        # Remove the previous order from the end, 100 songs at a time. Every change needs the playlist's latest ETag
+        total = playlist["numberOfTracks"] + max(playlist.get("numberOfVideos", 0), 0)
+        for end in range(total, 0, -100):
+            indices = ",".join(str(i) for i in range(max(end - 100, 0), end))
+            await self._td_api.request(
+                "remove_by_indices",
+                "DELETE",
+                path + "/items/" + indices,
+                headers={"If-None-Match": etag},
+            )
+            _, etag = await self._td_api.playlist(playlist_id)
+
+        # Add the new song order 100 songs at a time
+        media_ids = [str(int(i)) for i in playlist_df["track_id"].dropna()]
+        for position, batch in zip(
+            range(0, len(media_ids), 100), _batches(media_ids, 100)
+        ):
+            await self._td_api.request(
+                "add",
+                "POST",
+                path + "/items",
+                data={
+                    "onArtifactNotFound": "SKIP",
+                    "trackIds": ",".join(batch),
+                    "toIndex": position,
+                    "onDupes": "SKIP",
+                },
+                headers={"If-None-Match": etag},
+            )
+            _, etag = await self._td_api.playlist(playlist_id)
+
+        # Update playlist description
+        description = html.unescape(playlist.get("description") or "")
+        if description.find("(Mixed by playlistjockey.com)") == -1:
+            description = description + " (Mixed by playlistjockey.com)"
+        await self._td_api.request(
+            "edit",
+            "POST",
+            path,
+            data={"title": playlist["title"], "description": description},
+        )
@@ -0,0 +1,184 @@
+# playlistjockey/cache.py
+
+"""Module containing the cache used to skip re-computing mixes of playlists that haven't changed.
+
+Mixes are keyed by a fingerprint of the song features the mixing algorithms read, the mix, its options and the random seed, so sorting the
+same songs the same way again returns the stored order instead of mixing them again. Only the order of the songs and the columns added by the
+mix are stored, and they are applied to the playlist df being sorted.
+
+The module contains the following classes and functions:
+
+- `fingerprint(playlist_df, mix, params=None, seed=None)`: Computes a stable fingerprint of a mix of a playlist.
+- `MixCache(maxsize=128, directory=None)`: Cache of computed mixes, kept in memory and optionally on disk.
+    - `get(self, playlist_df, mix, params=None, seed=None)`: Look up a stored mix of a playlist.
+    - `put(self, playlist_df, mix, mixed_df, params=None, seed=None)`: Store a mix of a playlist.
+    - `clear(self)`: Remove all stored mixes.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+
+import pandas as pd
+
+from playlistjockey import utils
+
+# Columns of a playlist df that the mixing algorithms read
+FINGERPRINT_COLUMNS = [
+    "artists",
+    "key",
+    "bpm",
+    "energy",
+    "danceability",
+    "popularity",
+    "artist_similarity",
+    "duration_s",
+]
+
+
+def _json_default(value):
+    """Helper function to serialize mix options such as numpy arrays."""
+    if hasattr(value, "tolist"):
+        return value.tolist()
+    return repr(value)
+
+
+def _join_artists(artists):
+    """Helper function to join a song's artist names into one string, treating a missing artist list as empty."""
+    if artists is None or isinstance(artists, float):
+        return ""
+    return "\x1f".join(artists)
+
+
+def fingerprint(playlist_df, mix, params=None, seed=None):
+    """Computes a stable fingerprint of a mix of a playlist, from the songs' index labels and the feature columns the mixing algorithms read,
+    in playlist order, along with the mix, its options and the random seed. Compact and regular playlist dfs of the same songs share a
+    fingerprint."""
+    digest = hashlib.sha256()
+    settings = {"mix": mix, "params": params or {}, "seed": seed}
+    digest.update(json.dumps(settings, sort_keys=True, default=_json_default).encode())
+
+    digest.update(
+        pd.util.hash_pandas_object(pd.Series(playlist_df.index), index=False)
+        .to_numpy()
+        .tobytes()
+    )
+    for column in FINGERPRINT_COLUMNS:
+        if column not in playlist_df:
+            continue
+        values = playlist_df[column]
+        if column == "artists":
+            values = values.map(_join_artists)
+        elif column == "key":
+            values = pd.Series(utils.camelot_codes(values))
+        else:
+            values = values.astype(float)
+        digest.update(column.encode())
+        digest.update(
+            pd.util.hash_pandas_object(values, index=False).to_numpy().tobytes()
+        )
+
+    return digest.hexdigest()
+
+
+class MixCache:
+    """Cache of computed mixes, keeping the most recently used ones in memory and, if a directory is given, every one on disk.
+
+    Args:
+        maxsize (int): Maximum number of mixes kept in memory. The least recently used mix is evicted first.
+        directory (str): Directory mixes are also written to, so they can be reused by later processes. Mixes are only kept in memory if None.
+
+    Attributes:
+        hits (int): Number of lookups that found a stored mix.
+        misses (int): Number of lookups that didn't.
+    """
+
+    def __init__(self, maxsize=128, directory=None):
+        self.maxsize = maxsize
+        self.directory = directory
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        """Helper function to locate the file of a given fingerprint."""
+        return os.path.join(self.directory, re.sub(r"[^0-9a-f]", "", key) + ".json")
+
+    def _remember(self, key, entry):
+        """Helper function to keep an entry in memory, evicting the least recently used entries beyond maxsize."""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def _lookup(self, key):
+        """Helper function to find an entry in memory, then on disk."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+
+        if self.directory is None or not os.path.exists(self._path(key)):
+            return None
+        with open(self._path(key)) as entry_file:
+            entry = json.load(entry_file)
+        self._remember(key, entry)
+
+        return entry
+
+    def get(self, playlist_df, mix, params=None, seed=None):
+        """Look up a stored mix of a playlist.
+
+        Returns:
+            mixed_df (pd.DataFrame): The songs of playlist_df in the stored order, with the columns added by the mix. None if the mix isn't
+                stored.
+        """
+        entry = self._lookup(fingerprint(playlist_df, mix, params, seed))
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+
+        mixed_df = playlist_df.loc[entry["order"]].copy()
+        for column, values in entry["columns"].items():
+            mixed_df[column] = values
+
+        return mixed_df
+
+    def put(self, playlist_df, mix, mixed_df, params=None, seed=None):
+        """Store a mix of a playlist: the order of its songs, and the columns added by the mix."""
+        key = fingerprint(playlist_df, mix, params, seed)
+        columns = [
+            i
+            for i in mixed_df.columns
+            if i not in playlist_df.columns or i == "select_type"
+        ]
+        entry = {
+            "order": mixed_df.index.tolist(),
+            "columns": {i: mixed_df[i].tolist() for i in columns},
+        }
+        self._remember(key, entry)
+
+        if self.directory is not None:
+            fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+            with os.fdopen(fd, "w") as entry_file:
+                json.dump(entry, entry_file)
+            os.replace(temp_path, self._path(key))
+
+    def clear(self):
+        """Remove all stored mixes, from memory and disk."""
+        with self._lock:
+            self._entries.clear()
+        if self.directory is not None:
+            for name in os.listdir(self.directory):
+                if name.endswith(".json"):
+                    os.remove(os.path.join(self.directory, name))
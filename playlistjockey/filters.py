@@ -2,22 +2,33 @@
 
 """Provide the filters used by the various mixing algorithms to identify compatible songs.
 
-The module contains the following functions:
+The module contains the following classes and functions:
 
 - `artist_filter(donor_df, recipient_df)`: Filter the donor_df for artists that have been recently played.
 - `key_filter(donor_df, recipient_df)`: Filters donor_df for songs that have compatible keys with the last song in recipient_df.
-- `bpm_filter(donor_df, recipient_df)`: Filters donor_df for songs within 10% difference in tempo from the last song in recipient_df, half and double time included.
+- `bpm_filter(donor_df, recipient_df, bpm_index=None)`: Filters donor_df for songs within 10% difference in tempo from the last song in recipient_df, half and double time included.
+- `BpmIndex(donor_df)`: Sorted index of the tempos in a playlist, answering bpm_filter's tempo windows as range lookups.
 - `plus_minus_1_filter(donor_df, recipient_df, column)`: Filters donor_df for 1 value difference in inputted quantitative column from the last song in recipient_df.
 - `equal_filter(donor_df, recipient_df, column)`: Filters donor_df for the same value in inputted quantitative column from the last song in recipient_df.
+
+Each filter has a matching `*_mask` function with the same arguments, returning a boolean array over donor_df instead of a DataFrame subset.
+These are the building blocks of the rules in rules.py.
 """
 
 import pandas as pd
+import numpy as np
+import math
 
 from collections import Counter
 
+from playlistjockey import utils
 
-def artist_filter(donor_df, recipient_df):
-    """Filter the donor_df for artists that have been recently played. This ensures the same artists aren't being played consecutively."""
+# Tempo windows accepted by bpm_filter, as ratios of the previous song's bpm: normal, double and half time
+BPM_WINDOWS = [(0.9, 1.1), (1.8, 2.2), (0.45, 0.55)]
+
+
+def artist_mask(donor_df, recipient_df):
+    """Marks the songs in donor_df whose artists haven't been recently played in recipient_df."""
     # Calculate max artist count to song percentage
     donor_artists = [i for j in donor_df["artists"] for i in j]
     recipient_artists = [i for j in recipient_df["artists"] for i in j]
@@ -30,98 +41,163 @@ def artist_filter(donor_df, recipient_df):
     prev_songs = int((1 - max_artist_count_ratio) * 5)
 
     # Capture recently played artists
-    prev_artists = []
+    prev_artists = set()
     for i in range(1, prev_songs + 1):
         try:
-            prev_artists += recipient_df["artists"].iloc[-i]
+            prev_artists.update(recipient_df["artists"].iloc[-i])
         except:
             pass
 
-    # Filter out donor_df for songs without those artists
-    donor_df = donor_df[
-        (
-            ~donor_df.apply(
-                lambda x: any(i in prev_artists for i in x["artists"]), axis=1
-            )
-        )
-    ]
+    # Mark songs without those artists
+    return np.array(
+        [not any(i in prev_artists for i in j) for j in donor_df["artists"]],
+        dtype=bool,
+    )
+
+
+def artist_filter(donor_df, recipient_df):
+    """Filter the donor_df for artists that have been recently played. This ensures the same artists aren't being played consecutively."""
+    donor_df = donor_df[artist_mask(donor_df, recipient_df)]
 
     return donor_df
 
 
+def key_mask(donor_df, recipient_df):
+    """Marks the songs in donor_df that have compatible keys with the last song in recipient_df."""
+    prev_code = utils.camelot_code(recipient_df["key"].iloc[-1])
+
+    # Look up the compatibility of every donor key with the previous key in one gather
+    codes = utils.camelot_codes(donor_df["key"])
+    return utils.KEY_COMPATIBILITY[prev_code][codes] & (codes >= 0)
+
+
 def key_filter(donor_df, recipient_df):
     """Filters donor_df for songs that have compatible keys with the last song in recipient_df."""
-    prev_camelot = recipient_df.iloc[-1]["key"]
-
-    key_mix_dict = {
-        "1A": ["1A", "1B", "2A", "12A"],
-        "1B": ["1B", "1A", "2B", "12B"],
-        "2A": ["2A", "2B", "3A", "1A"],
-        "2B": ["2B", "2A", "3B", "1B"],
-        "3A": ["3A", "3B", "4A", "2A"],
-        "3B": ["3B", "3A", "4B", "2B"],
-        "4A": ["4A", "4B", "5A", "3A"],
-        "4B": ["4B", "4A", "5B", "3B"],
-        "5A": ["5A", "5B", "6A", "4A"],
-        "5B": ["5B", "5A", "6B", "4B"],
-        "6A": ["6A", "6B", "7A", "5A"],
-        "6B": ["6B", "6A", "7B", "5B"],
-        "7A": ["7A", "7B", "8A", "6A"],
-        "7B": ["7B", "7A", "8B", "6B"],
-        "8A": ["8A", "8B", "9A", "7A"],
-        "8B": ["8B", "8A", "9B", "7B"],
-        "9A": ["9A", "9B", "10A", "8A"],
-        "9B": ["9B", "9A", "10B", "8B"],
-        "10A": ["10A", "10B", "11A", "9A"],
-        "10B": ["10B", "10A", "11B", "9B"],
-        "11A": ["11A", "11B", "12A", "10A"],
-        "11B": ["11B", "11A", "12B", "10B"],
-        "12A": ["12A", "12B", "1A", "11A"],
-        "12B": ["12B", "12A", "1B", "11B"],
-    }
-
-    donor_df = donor_df[donor_df["key"].isin(key_mix_dict[prev_camelot])]
+    donor_df = donor_df[key_mask(donor_df, recipient_df)]
 
     return donor_df
 
 
-def bpm_filter(donor_df, recipient_df):
-    """Filters donor_df for songs within 10% difference in tempo from the last song in recipient_df, half and double time included."""
-    prev_bpm = recipient_df.iloc[-1]["bpm"]
-
-    # Songs +- 10% speed
-    donor_df_1 = donor_df[
-        (donor_df["bpm"] >= prev_bpm * 0.9) & (donor_df["bpm"] <= prev_bpm * 1.1)
-    ]
-    # Songs +- 10% at double time
-    donor_df_2 = donor_df[
-        (donor_df["bpm"] >= prev_bpm * 1.8) & (donor_df["bpm"] <= prev_bpm * 2.2)
-    ]
-    # Songs +- 10% at half time
-    donor_df_3 = donor_df[
-        (donor_df["bpm"] >= prev_bpm * 0.45) & (donor_df["bpm"] <= prev_bpm * 0.55)
-    ]
+def _bound(column, value, upper=False):
+    """Helper function to round a filter bound to an integer for integer columns, so compact columns are compared without upcasting."""
+    if pd.api.types.is_integer_dtype(column):
+        if upper:
+            return math.floor(value)
+        return math.ceil(value)
+    return value
+
+
+def bpm_filter(donor_df, recipient_df, bpm_index=None):
+    """Filters donor_df for songs within 10% difference in tempo from the last song in recipient_df, half and double time included. Songs are
+    returned window by window, normal time first, without duplicates. If a BpmIndex of the playlist is supplied, the windows are found with
+    binary searches instead of comparing every song's tempo."""
+    prev_bpm = float(recipient_df["bpm"].iloc[-1])
+
+    if bpm_index is not None:
+        labels = pd.Index(bpm_index.window_labels(prev_bpm))
+        donor_df = donor_df.loc[labels.intersection(donor_df.index, sort=False)]
+        return donor_df
+
+    # Songs +- 10% speed, at double time, and at half time
+    bpm = donor_df["bpm"]
+    windows = []
+    for low, high in BPM_WINDOWS:
+        windows.append(
+            donor_df[
+                (bpm >= _bound(bpm, prev_bpm * low))
+                & (bpm <= _bound(bpm, prev_bpm * high, True))
+            ]
+        )
 
-    donor_df = pd.concat([donor_df_1, donor_df_2, donor_df_3])
+    donor_df = pd.concat(windows)
+    donor_df = donor_df[~donor_df.index.duplicated()]
 
     return donor_df
 
 
+def bpm_mask(donor_df, recipient_df, bpm_index=None):
+    """Marks the songs in donor_df within 10% difference in tempo from the last song in recipient_df, half and double time included."""
+    prev_bpm = float(recipient_df["bpm"].iloc[-1])
+
+    if bpm_index is not None:
+        return donor_df.index.isin(bpm_index.window_labels(prev_bpm))
+
+    bpm = donor_df["bpm"]
+    mask = np.zeros(len(donor_df), dtype=bool)
+    for low, high in BPM_WINDOWS:
+        mask |= (
+            (bpm >= _bound(bpm, prev_bpm * low))
+            & (bpm <= _bound(bpm, prev_bpm * high, True))
+        ).to_numpy()
+
+    return mask
+
+
+class BpmIndex:
+    """Sorted index of the tempos in a playlist, answering bpm_filter's three tempo windows as range lookups. Build it once from the donor_df
+    of a mix, and remove songs from it as they are moved out of the donor_df.
+
+    Args:
+        donor_df (pd.DataFrame): DataFrame of songs, with unique index labels.
+    """
+
+    def __init__(self, donor_df):
+        bpms = donor_df["bpm"].to_numpy(dtype=float)
+        self._order = np.argsort(bpms, kind="stable")
+        self._bpms = bpms[self._order]
+        self._labels = donor_df.index.to_numpy()
+        self._positions = {label: i for i, label in enumerate(self._labels)}
+        self._present = np.ones(len(bpms), dtype=bool)
+
+    def __len__(self):
+        return int(self._present.sum())
+
+    def remove(self, label):
+        """Remove a song from the index, given its index label."""
+        self._present[self._positions[label]] = False
+
+    def window_labels(self, prev_bpm):
+        """Returns the labels of the songs still in the index that fall in the normal, double and half time windows of prev_bpm, window by
+        window, each in the playlist's original order."""
+        windows = []
+        for low, high in BPM_WINDOWS:
+            start = np.searchsorted(self._bpms, prev_bpm * low, side="left")
+            stop = np.searchsorted(self._bpms, prev_bpm * high, side="right")
+            positions = np.sort(self._order[start:stop])
+            windows.append(positions[self._present[positions]])
+
+        # Drop songs found in more than one window, keeping their first window
+        positions = np.concatenate(windows)
+        _, first = np.unique(positions, return_index=True)
+        positions = positions[np.sort(first)]
+
+        return self._labels[positions]
+
+
+def plus_minus_1_mask(donor_df, recipient_df, column):
+    """Marks the songs in donor_df within 1 value difference in inputted quantitative column from the last song in recipient_df."""
+    prev_value = recipient_df[column].iloc[-1]
+    values = donor_df[column]
+
+    return ((values >= prev_value - 1) & (values <= prev_value + 1)).to_numpy()
+
+
 def plus_minus_1_filter(donor_df, recipient_df, column):
     """Filters donor_df for 1 value difference in inputted quantitative column from the last song in recipient_df."""
-    prev_value = recipient_df.iloc[-1][column]
-
-    donor_df = donor_df[
-        (donor_df[column] >= prev_value - 1) & (donor_df[column] <= prev_value + 1)
-    ]
+    donor_df = donor_df[plus_minus_1_mask(donor_df, recipient_df, column)]
 
     return donor_df
 
 
+def equal_mask(donor_df, recipient_df, column):
+    """Marks the songs in donor_df with the same value in inputted quantitative column as the last song in recipient_df."""
+    prev_value = recipient_df[column].iloc[-1]
+
+    return (donor_df[column] == prev_value).to_numpy()
+
+
 def equal_filter(donor_df, recipient_df, column):
     """Filters donor_df for the same value in inputted quantitative column from the last song in recipient_df."""
-    prev_value = recipient_df.iloc[-1][column]
-
-    donor_df = donor_df[donor_df["column"] == prev_value]
+    donor_df = donor_df[equal_mask(donor_df, recipient_df, column)]
 
     return donor_df
@@ -0,0 +1,456 @@
+# playlistjockey/genres.py
+
+"""Module containing the genre model used to place songs on a shared artist similarity scale.
+
+Rather than fitting a new decomposition of every playlist's genres, one model is kept in the user's cache directory and shared by all
+playlists, so the artist similarity of songs from different playlists can be compared. The model keeps a global genre vocabulary and the
+distinct genre combinations it has seen, and projects songs onto the first component of an incremental PCA over them. Scoring a playlist
+only projects its songs: unseen genres and combinations are queued, and folded in by a refit, run in a background thread once enough of them
+have been queued. Until then, the decomposition and scale don't change, so every playlist scored in between is scored on the same scale.
+
+Each fit keeps its component's largest loading positive, so a refit doesn't invert the scale, but it does move it. Score playlists again
+with `transform` after a refit to compare them.
+
+The model is stored as numpy arrays in `model.npz`, with its vocabulary and combinations as JSON in `model.json`.
+
+The module contains the following classes and functions:
+
+- `GenreModel(directory=None, refit_after=250, max_combinations=50000)`: Genre vocabulary and decomposition persisted on disk.
+    - `observe(self, genres)`: Queue the unseen genres and genre combinations of some songs, to be folded in by the next refit.
+    - `transform(self, genres)`: Project the genres of some songs onto an artist similarity score from 0 to 10.
+    - `refit(self, background=False)`: Fit the decomposition again over the whole vocabulary and every stored combination.
+- `default_model()`: The genre model stored in the user's cache directory, shared within a process.
+- `set_genre_source(playlist_df, sp, id_column="track_id")`: Records the Spotify client and ID column genres of a playlist df can be
+    fetched with.
+- `enrich_genres(playlist_df, client=None, background=False, model=None, max_workers=8)`: Fetches the genres of the songs that don't have
+    them yet, and scores their artist similarity.
+- `ensure_genres(playlist_df, client=None)`: Enriches a copy of a playlist df with genres if it doesn't have them yet, for the consumers of
+    artist similarity.
+"""
+
+import contextvars
+import json
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.decomposition import IncrementalPCA
+
+from playlistjockey import utils
+from playlistjockey.spotify import extract as sp_extract
+
+# Number of combinations projected or fitted at once
+BATCH_SIZE = 1024
+
+
+def _combination(song_genres):
+    """Helper function to turn a song's genre list, which is missing for songs loaded without genres, into a sorted tuple."""
+    if song_genres is None or isinstance(song_genres, float):
+        return ()
+    return tuple(sorted(set(song_genres)))
+
+
+def _oriented(component):
+    """Helper function to fix the sign of a fitted component, which a fit may flip, by making its largest loading positive."""
+    if component[np.argmax(np.abs(component))] < 0:
+        return -component
+    return component
+
+
+def _write_atomic(path, write, mode):
+    """Helper function to write a file through a temporary file, replacing the stored one in a single step."""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    with os.fdopen(fd, mode) as model_file:
+        write(model_file)
+    os.replace(temp_path, path)
+
+
+class GenreModel:
+    """Genre vocabulary and decomposition persisted on disk, used to score songs on an artist similarity scale shared by all playlists.
+
+    Args:
+        directory (str): Directory the model is stored in. Defaults to the "genres" folder of the user's cache directory.
+        refit_after (int): Number of unseen genre combinations queued since the last fit that starts a background refit.
+        max_combinations (int): Maximum number of distinct genre combinations kept to refit the model with. The oldest ones are dropped first.
+
+    Attributes:
+        vocabulary (dict): Column of each known genre.
+    """
+
+    def __init__(self, directory=None, refit_after=250, max_combinations=50000):
+        if directory is None:
+            directory = utils.cache_dir("genres")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.refit_after = refit_after
+        self.max_combinations = max_combinations
+
+        self.vocabulary = {}
+        self._combinations = {}
+        self._pending = {}
+        self._component = None
+        self._mean = None
+        self._bounds = None
+        self._lock = threading.RLock()
+        self._refit_thread = None
+        self._load()
+
+    def _path(self, extension):
+        return os.path.join(self.directory, "model" + extension)
+
+    def _load(self):
+        """Helper function to read the stored model, if any."""
+        if not os.path.exists(self._path(".json")):
+            return
+        with open(self._path(".json")) as model_file:
+            state = json.load(model_file)
+        self.vocabulary = state["vocabulary"]
+        self._combinations = dict.fromkeys(tuple(i) for i in state["combinations"])
+        self._pending = dict.fromkeys(tuple(i) for i in state["pending"])
+
+        if not os.path.exists(self._path(".npz")):
+            return
+        with np.load(self._path(".npz"), allow_pickle=False) as arrays:
+            component, mean, bounds = (
+                arrays["component"],
+                arrays["mean"],
+                arrays["bounds"],
+            )
+
+        # A fit over more genres than the stored vocabulary wasn't saved along with it, so it is fitted again
+        if len(component) <= len(self.vocabulary):
+            self._component, self._mean = component, mean
+            self._bounds = (float(bounds[0]), float(bounds[1]))
+
+    def _save(self, fit=False):
+        """Helper function to write the vocabulary and combinations, and the fit if it changed, each replacing the stored file in a single
+        step. The fit is written before the vocabulary it uses."""
+        with self._lock:
+            state = {
+                "vocabulary": self.vocabulary,
+                "combinations": [list(i) for i in self._combinations],
+                "pending": [list(i) for i in self._pending],
+            }
+            if fit:
+                arrays = {
+                    "component": self._component,
+                    "mean": self._mean,
+                    "bounds": np.array(self._bounds),
+                }
+                _write_atomic(self._path(".npz"), lambda f: np.savez(f, **arrays), "wb")
+            _write_atomic(self._path(".json"), lambda f: json.dump(state, f), "w")
+
+    def _encode(self, combinations, n_features):
+        """Helper function to one-hot encode genre combinations over the first n_features genres of the vocabulary."""
+        encoded = np.zeros((len(combinations), n_features))
+        for row, combination in enumerate(combinations):
+            for genre in combination:
+                column = self.vocabulary.get(genre)
+                if column is not None and column < n_features:
+                    encoded[row, column] = 1
+        return encoded
+
+    def _project(self, component, mean, combinations):
+        """Helper function to project genre combinations onto a fitted component, in batches."""
+        projected = [np.zeros(0)]
+        for i in range(0, len(combinations), BATCH_SIZE):
+            encoded = self._encode(combinations[i : i + BATCH_SIZE], len(component))
+            projected.append((encoded - mean) @ component)
+        return np.concatenate(projected)
+
+    def _fit(self):
+        """Helper function to fit a new decomposition over the whole vocabulary and the stored combinations.
+
+        Returns:
+            fitted (tuple): The fitted component, mean and bounds, and the queued combinations the fit folded in. None if there are too few
+                genres or combinations to fit.
+        """
+        with self._lock:
+            combinations = list(self._combinations)
+            folded = list(self._pending)
+            n_features = len(self.vocabulary)
+        if n_features < 2 or len(combinations) < 2:
+            return None
+
+        # Split the combinations into batches of similar size, as every partial fit needs at least as many rows as components
+        pca = IncrementalPCA(n_components=1)
+        n_batches = -(-len(combinations) // BATCH_SIZE)
+        for batch in np.array_split(np.arange(len(combinations)), n_batches):
+            pca.partial_fit(self._encode([combinations[i] for i in batch], n_features))
+        component = _oriented(pca.components_[0].copy())
+        mean = pca.mean_.copy()
+        projected = self._project(component, mean, combinations)
+
+        return component, mean, (float(projected.min()), float(projected.max())), folded
+
+    def _swap(self, fitted):
+        """Helper function to replace the decomposition with a newly fitted one. Combinations queued while it was fitted stay queued, and
+        start another refit once there are enough of them."""
+        if fitted is None:
+            return
+        component, mean, bounds, folded = fitted
+        with self._lock:
+            self._component, self._mean, self._bounds = component, mean, bounds
+            for combination in folded:
+                self._pending.pop(combination, None)
+            stale = len(self._pending)
+        self._save(fit=True)
+
+        if stale >= self.refit_after:
+            self.refit(background=True)
+
+    def refit(self, background=False):
+        """Fit the decomposition again over the whole vocabulary and every stored combination, folding in the queued genres and combinations.
+        Songs keep being scored with the previous decomposition until the refit is done. Scores from before the refit aren't comparable with
+        scores from after it.
+
+        Args:
+            background (bool): Refit in a background thread. Only one background refit runs at a time.
+
+        Returns:
+            thread (threading.Thread): The thread running the refit, if background. None otherwise.
+        """
+        if not background:
+            self._swap(self._fit())
+            return None
+
+        with self._lock:
+            if self._refit_thread is not None and self._refit_thread.is_alive():
+                return self._refit_thread
+            self._refit_thread = threading.Thread(
+                target=lambda: self._swap(self._fit()), daemon=True
+            )
+            self._refit_thread.start()
+
+            return self._refit_thread
+
+    def observe(self, genres):
+        """Queue the unseen genres and genre combinations of some songs, to be folded in by the next refit. The decomposition isn't changed, so
+        scores stay comparable. A model that hasn't been fitted yet is fitted right away, once it has seen at least two genres and two
+        combinations. Otherwise a background refit is started once enough combinations are queued.
+
+        Args:
+            genres (iterable): Genre list of each song.
+
+        Returns:
+            self (GenreModel): The model.
+        """
+        with self._lock:
+            added = False
+            for song_genres in genres:
+                combination = _combination(song_genres)
+                if not combination or combination in self._combinations:
+                    continue
+                for genre in combination:
+                    self.vocabulary.setdefault(genre, len(self.vocabulary))
+                self._combinations[combination] = None
+                self._pending[combination] = None
+                added = True
+
+            # Drop the oldest combinations beyond the limit
+            while len(self._combinations) > self.max_combinations:
+                oldest = next(iter(self._combinations))
+                self._combinations.pop(oldest)
+                self._pending.pop(oldest, None)
+
+            fitted = self._component is not None
+            stale = len(self._pending)
+
+        # A model without a decomposition is fitted right away, otherwise queued combinations are folded in the background
+        if not fitted:
+            self.refit()
+            if added and self._component is None:
+                self._save()
+        elif added:
+            self._save()
+            if stale >= self.refit_after:
+                self.refit(background=True)
+
+        return self
+
+    def transform(self, genres):
+        """Project the genres of some songs onto an artist similarity score from 0 to 10, shared by all playlists scored with the same fit.
+        Genres queued since the last fit are ignored until the next refit.
+
+        Args:
+            genres (iterable): Genre list of each song.
+
+        Returns:
+            similarity (np.ndarray): Artist similarity score of each song.
+        """
+        combinations = [_combination(i) for i in genres]
+        with self._lock:
+            component, mean, bounds = self._component, self._mean, self._bounds
+        if component is None:
+            return np.zeros(len(combinations), dtype=int)
+
+        projected = self._project(component, mean, combinations)
+        low, high = bounds
+        scaled = np.clip((projected - low) / max(high - low, 1e-9), 0, 1)
+
+        return np.around(np.around(scaled, 3) * 10).astype(int)
+
+
+_default_model = None
+_default_lock = threading.Lock()
+
+
+def default_model():
+    """The genre model stored in the user's cache directory, loaded once and shared within a process."""
+    global _default_model
+    with _default_lock:
+        if _default_model is None or _default_model.directory != utils.cache_dir(
+            "genres"
+        ):
+            _default_model = GenreModel()
+
+        return _default_model
+
+
+# Spotify clients that playlist dfs can fetch their genres with, keyed by the name recorded in the df's attrs. Clients are kept for the life of
+# the process, so a df can always reach the client it was loaded with, and each client is recorded under a single name
+_genre_sources = {}
+_genre_source_names = {}
+_genre_sources_lock = threading.Lock()
+
+
+def set_genre_source(playlist_df, sp, id_column="track_id"):
+    """Records the Spotify client and the column of Spotify track IDs that the genres of a playlist df can be fetched with, so they can be
+    fetched once they are needed. Only the client's name is stored in the df's attrs, so copies of the df don't copy the client. pandas drops
+    attrs in some operations, such as concatenating dfs with different attrs, so consumers of genres also accept a client explicitly.
+    """
+    with _genre_sources_lock:
+        name = _genre_source_names.get(id(sp))
+        if name is None:
+            name = "source-{}".format(len(_genre_sources))
+            _genre_sources[name] = sp
+            _genre_source_names[id(sp)] = name
+    playlist_df.attrs["genre_source"] = name
+    playlist_df.attrs["genre_ids"] = id_column
+
+    return playlist_df
+
+
+def _has_genres(song_genres):
+    """Helper function to check whether a song's genres were fetched. Songs loaded without genres have a missing value."""
+    return song_genres is not None and not isinstance(song_genres, float)
+
+
+def enrich_genres(
+    playlist_df, client=None, background=False, model=None, max_workers=8
+):
+    """Fetches the genres of the songs that don't have them yet, and scores the artist similarity of every song, updating playlist_df in
+    place. Genres of each artist are only requested once per process. In the background, a copy of playlist_df is enriched instead, so the
+    playlist can keep being used while the genres are fetched.
+
+    Args:
+        playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
+        client (playlistjockey.main.Spotify or playlistjockey.main.Tidal object): Client to fetch genres with. Defaults to the client the
+            playlist was loaded with.
+        background (bool): Fetch the genres in a background thread, enriching a copy of playlist_df. playlist_df itself is left unchanged.
+        model (playlistjockey.genres.GenreModel object): Genre model used to score artist similarity. Defaults to the shared model.
+        max_workers (int): Number of songs whose genres are fetched at the same time.
+
+    Returns:
+        playlist_df (pd.DataFrame): The enriched playlist df. If background, a concurrent.futures.Future resolving to the enriched copy
+            instead.
+    """
+    if client is not None:
+        sp = getattr(client, "sp", client)
+    else:
+        sp = _genre_sources.get(playlist_df.attrs.get("genre_source"))
+    if sp is None:
+        raise KeyError(
+            "No Spotify client to fetch genres with. Pass a client, or load the playlist with get_playlist_features."
+        )
+
+    if background:
+        executor = ThreadPoolExecutor(max_workers=1)
+        future = executor.submit(
+            contextvars.copy_context().run,
+            enrich_genres,
+            playlist_df.copy(),
+            sp,
+            False,
+            model,
+            max_workers,
+        )
+        executor.shutdown(wait=False)
+        return future
+
+    id_column = playlist_df.attrs.get("genre_ids", "track_id")
+    if id_column not in playlist_df or playlist_df[id_column].isna().all():
+        id_column = "sp_track_id" if "sp_track_id" in playlist_df else "track_id"
+
+    # Only fetch the songs that don't have genres yet, once per song
+    genres = pd.Series(None, index=playlist_df.index, dtype=object)
+    if "genres" in playlist_df:
+        genres = playlist_df["genres"].astype(object)
+    missing = [
+        i
+        for i in playlist_df.index
+        if not _has_genres(genres[i]) and isinstance(playlist_df.at[i, id_column], str)
+    ]
+    song_ids = list(dict.fromkeys(playlist_df.loc[missing, id_column]))
+
+    def get_genres(song_id):
+        try:
+            return sp_extract.get_track_genres(sp, song_id)
+        except Exception:
+            return None
+
+    if len(song_ids) > 0:
+        contexts = [contextvars.copy_context() for i in song_ids]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            fetched = dict(
+                zip(
+                    song_ids,
+                    executor.map(
+                        lambda context, song_id: context.run(get_genres, song_id),
+                        contexts,
+                        song_ids,
+                    ),
+                )
+            )
+        genres = genres.copy()
+        for i in missing:
+            genres[i] = fetched[playlist_df.at[i, id_column]]
+
+    # Score every song on the shared scale, keeping the compact layout of compact playlist dfs
+    if model is None:
+        model = default_model()
+    playlist_df["genres"] = genres
+    similarity = model.observe(genres).transform(genres)
+    if "energy" in playlist_df and playlist_df["energy"].dtype == np.int8:
+        similarity = similarity.astype(np.int8)
+    playlist_df["artist_similarity"] = similarity
+
+    return playlist_df
+
+
+def ensure_genres(playlist_df, client=None):
+    """Enriches a copy of a playlist df with genres if it doesn't have artist similarity scores yet. Used by the genre mix and the other
+    consumers of artist similarity, so genres are only fetched once they are needed. playlist_df itself is left unchanged.
+
+    Args:
+        playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
+        client (playlistjockey.main.Spotify or playlistjockey.main.Tidal object): Client to fetch genres with. Defaults to the client the
+            playlist was loaded with.
+
+    Returns:
+        playlist_df (pd.DataFrame): The playlist df if it already has artist similarity scores, otherwise an enriched copy.
+    """
+    if (
+        "artist_similarity" in playlist_df
+        and playlist_df["artist_similarity"].notna().all()
+    ):
+        return playlist_df
+    if client is None and playlist_df.attrs.get("genre_source") not in _genre_sources:
+        raise KeyError(
+            '"artist_similarity" column not in data. Set genres=True in get_playlist_features function, or pass a client to fetch genres with.'
+        )
+
+    return enrich_genres(playlist_df.copy(), client)
@@ -0,0 +1,226 @@
+# playlistjockey/hierarchy.py
+
+"""Module containing the hierarchical mode used to mix very large playlists.
+
+Instead of mixing the whole playlist as one pool, songs are clustered by key, bpm, energy and, when present, artist similarity. The clusters
+are put in order, each cluster is mixed on its own in a separate process, and the mixed clusters are stitched together. As the clusters have a
+bounded size, the total time grows roughly linearly with the size of the playlist.
+
+The module contains the following functions:
+
+- `cluster_playlist(playlist_df, cluster_size=500, seed=None)`: Groups the songs of a playlist into clusters of similar songs.
+- `hierarchical_sort_playlist(playlist_df, mix, cluster_size=500, max_workers=None, client=None, **kwargs)`: Sorts a large playlist by mixing clusters of
+    similar songs in parallel, then stitching them together.
+"""
+
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from sklearn.cluster import MiniBatchKMeans
+
+from playlistjockey import genres, mixes, scoring, utils
+
+
+def _cluster_features(playlist_df):
+    """Helper function to embed each song as a point, so that songs with compatible keys, bpms and energy levels lie close together."""
+    # Camelot keys sit on a wheel, so place them on a circle, with the two modes a small step apart
+    codes = utils.camelot_codes(playlist_df["key"]).astype(float)
+    position, mode = np.divmod(codes, 2)
+    angle = 2 * np.pi * position / 12
+    features = [np.cos(angle), np.sin(angle), mode * 0.5]
+
+    # Tempos are compatible at half and double time, so place them on a circle that wraps around once per octave
+    bpm = np.log2(playlist_df["bpm"].to_numpy(dtype=float).clip(1))
+    features += [np.cos(2 * np.pi * bpm), np.sin(2 * np.pi * bpm)]
+
+    features.append(playlist_df["energy"].to_numpy(dtype=float) / 10)
+    if "artist_similarity" in playlist_df:
+        features.append(playlist_df["artist_similarity"].to_numpy(dtype=float) / 10)
+
+    return np.nan_to_num(np.column_stack(features))
+
+
+def cluster_playlist(playlist_df, cluster_size=500, seed=None):
+    """Groups the songs of a playlist into clusters of similar songs.
+
+    Args:
+        playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
+        cluster_size (int): Average number of songs per cluster.
+        seed (int): Seed of the clustering, for reproducible clusters.
+
+    Returns:
+        labels (np.ndarray): Cluster of each song, in playlist_df's order.
+        centers (np.ndarray): Center of each cluster in the embedding used to cluster songs.
+    """
+    features = _cluster_features(playlist_df)
+    n_clusters = max(math.ceil(len(playlist_df) / cluster_size), 1)
+
+    kmeans = MiniBatchKMeans(
+        n_clusters=n_clusters,
+        batch_size=max(1024, cluster_size),
+        n_init=3,
+        random_state=seed,
+    )
+    labels = kmeans.fit_predict(features)
+
+    return labels, kmeans.cluster_centers_
+
+
+def _chain_clusters(centers, energy):
+    """Helper function to order clusters so that each cluster is followed by the nearest cluster not yet placed, starting from the least
+    energetic one."""
+    distances = np.linalg.norm(centers[:, None] - centers[None, :], axis=2)
+    order = [int(np.argmin(energy))]
+    placed = np.zeros(len(centers), dtype=bool)
+    placed[order[0]] = True
+    while len(order) < len(centers):
+        candidates = np.where(placed, np.inf, distances[order[-1]])
+        order.append(int(np.argmin(candidates)))
+        placed[order[-1]] = True
+
+    return order
+
+
+def _curve_clusters(energy, mix):
+    """Helper function to order clusters along the shape of the party or setlist mix: the most energetic clusters in the middle of the
+    playlist for a party, and at its ends for a setlist."""
+    ranked = list(np.argsort(energy, kind="stable"))
+    if mix == "setlist":
+        ranked = ranked[::-1]
+
+    # Alternate the ranked clusters between the front and the back of the order
+    front = ranked[0::2]
+    back = ranked[1::2]
+
+    return [int(i) for i in front + back[::-1]]
+
+
+def _mix_cluster(cluster_df, mix, seed, kwargs):
+    """Helper function to mix a single cluster, run in a worker process."""
+    with utils.seeded_random(seed):
+        return getattr(mixes, mix + "_mix")(cluster_df, **kwargs)
+
+
+def _transition_labels(cluster_df, mix):
+    """Helper function to label each transition of a cluster, in its current order, with the select that would have made it."""
+    scores_df = scoring.score_playlist(cluster_df)
+    best = scores_df[scoring.BEST_TRANSITIONS[mix]].all(axis=1).to_numpy()
+    basic = scores_df[scoring.BASIC_TRANSITIONS].any(axis=1).to_numpy()
+    grades = basic.astype(int) + (best & basic).astype(int)
+
+    return np.array(["random", "basic", mix])[grades]
+
+
+def _stitch(mixed, mix, playlist_df, reverse=True):
+    """Helper function to join mixed clusters, labelling the transition at each boundary. If reverse, a cluster is reversed when its last song
+    makes a better transition from the end of the playlist so far than its first song does.
+    """
+    parts = [mixed[0]]
+    for cluster_df in mixed[1:]:
+        ends = [parts[-1].index[-1], cluster_df.index[0], cluster_df.index[-1]]
+        grades = scoring.transition_grades(playlist_df.loc[ends], mix)
+        grade = grades[0, 1]
+        cluster_df = cluster_df.copy()
+        select_type = cluster_df.columns.get_loc("select_type")
+        if reverse and grades[0, 2] > grades[0, 1]:
+            # Every transition of a reversed cluster runs the other way, so label them again
+            cluster_df = cluster_df.iloc[::-1]
+            cluster_df.iloc[1:, select_type] = _transition_labels(cluster_df, mix)
+            grade = grades[0, 2]
+        cluster_df.iloc[0, select_type] = ["random", "basic", mix][grade]
+        parts.append(cluster_df)
+
+    return pd.concat(parts)
+
+
+def hierarchical_sort_playlist(
+    playlist_df, mix, cluster_size=500, max_workers=None, client=None, **kwargs
+):
+    """Sorts a large playlist by mixing clusters of similar songs in parallel, then stitching them together.
+
+    Songs are clustered by key, bpm, energy and, when present, artist similarity. For the "dj" and "genre" mixes, each cluster is followed by
+    the most similar remaining cluster. For the "party" and "setlist" mixes, clusters are ordered by energy along the mix's shape, and each
+    cluster is fitted to its own stretch of the mix's energy curve. Mixed clusters are joined so that each boundary makes the more compatible
+    of the two possible transitions.
+
+    Args:
+        playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
+        mix (str): String identifying which mixing algorithm you would like to use to sort the playlist. Options so far include "dj", "party",
+            "setlist", and "genre".
+        cluster_size (int): Average number of songs per cluster. Playlists with fewer songs are mixed as a whole.
+        max_workers (int): Number of processes used to mix clusters. Defaults to the number of CPUs. If 1, clusters are mixed in this process.
+        client (playlistjockey.main.Spotify or playlistjockey.main.Tidal object): Client to fetch genres with, if the "genre" mix needs them.
+            Defaults to the client the playlist was loaded with.
+        **kwargs: Options passed on to the mixing algorithm, such as beam_width and depth for the "dj" and "genre" mixes.
+
+    Returns:
+        df (pd.DataFrame): DataFrame with the updated sorting of songs.
+    """
+    if mix not in scoring.BEST_TRANSITIONS:
+        raise ValueError("Unknown mix: {}".format(mix))
+
+    # Fetch genres here, as worker processes can't reach the client the playlist was loaded with
+    df = playlist_df.copy()
+    if mix == "genre":
+        df = genres.ensure_genres(df, client)
+    if len(df) <= cluster_size:
+        return getattr(mixes, mix + "_mix")(df, **kwargs)
+
+    labels, _ = cluster_playlist(df, cluster_size, seed=random.getrandbits(32))
+    clusters = [df[labels == i] for i in np.unique(labels)]
+    energy = np.array([i["energy"].astype(float).mean() for i in clusters])
+
+    # Put the clusters in order
+    if mix in ("party", "setlist"):
+        order = _curve_clusters(energy, mix)
+    else:
+        centers = np.array([_cluster_features(i).mean(axis=0) for i in clusters])
+        order = _chain_clusters(centers, energy)
+    clusters = [clusters[i] for i in order]
+
+    # Give each party or setlist cluster its stretch of the mix's energy curve
+    cluster_kwargs = [kwargs] * len(clusters)
+    if mix in ("party", "setlist"):
+        curve = kwargs.get("curve", mix)
+        if isinstance(curve, str):
+            curve = {"party": mixes.party_curve, "setlist": mixes.setlist_curve}[curve](
+                len(df)
+            )
+        curve = np.interp(
+            np.linspace(0, 1, len(df)), np.linspace(0, 1, len(curve)), curve
+        )
+        bounds = np.cumsum([0] + [len(i) for i in clusters])
+        cluster_kwargs = [
+            dict(kwargs, curve=curve[bounds[i] : bounds[i + 1]])
+            for i in range(len(clusters))
+        ]
+
+    # Mix the clusters in parallel, seeding each one so the result is reproducible
+    seeds = [random.getrandbits(32) for _ in clusters]
+    if max_workers == 1:
+        mixed = list(
+            map(_mix_cluster, clusters, [mix] * len(clusters), seeds, cluster_kwargs)
+        )
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            mixed = list(
+                executor.map(
+                    _mix_cluster,
+                    clusters,
+                    [mix] * len(clusters),
+                    seeds,
+                    cluster_kwargs,
+                )
+            )
+
+    # Clusters fitted to a stretch of an energy curve have to keep their direction
+    df = _stitch(mixed, mix, df, reverse=mix not in ("party", "setlist"))
+
+    # Calculate a moving average to observe the behavior of the energy levels
+    if mix in ("party", "setlist"):
+        df["ma_energy"] = df["energy"].rolling(len(df) // 10).mean()
+
+    return df
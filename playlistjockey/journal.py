@@ -0,0 +1,92 @@
+# playlistjockey/journal.py
+
+"""Module containing the journal used to checkpoint playlist feature loading.
+
+Each completed or failed song is appended to a JSON lines file keyed by the playlist ID, so a load that is interrupted can resume where it
+left off instead of starting over.
+
+The module contains the following classes:
+
+- `Journal(path)`: Append-only record of the songs loaded from a playlist.
+    - `for_playlist(provider, playlist_id, directory=None)`: Open the journal of a given playlist, by default in the user's cache directory.
+    - `load(self)`: Read the features of all songs completed so far, and the errors of songs that failed.
+    - `record(self, song_id, features)`: Checkpoint the features of a completed song.
+    - `record_failure(self, song_id, error)`: Record a song that could not be loaded.
+    - `clear(self)`: Remove the journal once a playlist has been loaded completely.
+"""
+
+import json
+import os
+import re
+import threading
+
+from playlistjockey import utils
+
+
+class Journal:
+    """Append-only record of the songs loaded from a playlist.
+
+    Args:
+        path (str): Location of the journal file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_playlist(cls, provider, playlist_id, directory=None):
+        """Open the journal of a given playlist, by default in the user's cache directory."""
+        if directory is None:
+            directory = utils.cache_dir("journal")
+        name = re.sub(r"[^A-Za-z0-9_-]", "_", "{}-{}".format(provider, playlist_id))
+        return cls(os.path.join(directory, name + ".jsonl"))
+
+    def load(self):
+        """Read the features of all songs completed so far, and the errors of songs that failed.
+
+        Returns:
+            completed (dict): Features of each completed song, keyed by song ID.
+            failed (dict): Last error of each song that failed and has not been completed since, keyed by song ID.
+        """
+        completed = {}
+        failed = {}
+        if not os.path.exists(self.path):
+            return completed, failed
+
+        with open(self.path) as journal_file:
+            for line in journal_file:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # A partially written last line means the process died mid-write
+                    continue
+                if "features" in entry:
+                    completed[entry["id"]] = entry["features"]
+                    failed.pop(entry["id"], None)
+                else:
+                    failed[entry["id"]] = entry["error"]
+
+        return completed, failed
+
+    def _append(self, entry):
+        """Helper function to append an entry and flush it to disk."""
+        with self._lock:
+            with open(self.path, "a") as journal_file:
+                journal_file.write(json.dumps(entry) + "\n")
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+
+    def record(self, song_id, features):
+        """Checkpoint the features of a completed song."""
+        self._append({"id": song_id, "features": features})
+
+    def record_failure(self, song_id, error):
+        """Record a song that could not be loaded."""
+        self._append({"id": song_id, "error": error})
+
+    def clear(self):
+        """Remove the journal once a playlist has been loaded completely."""
+        with self._lock:
+            if os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,212 @@
+# playlistjockey/library.py
+
+"""Module containing the library index used to build sets from a large feature library.
+
+A library is a DataFrame of song features, like a playlist df, that can hold hundreds of thousands of songs. Rather than mixing the whole
+library, a `LibraryIndex` keeps each camelot key's songs sorted by tempo, so the songs that can follow a given song are found with a few binary
+searches, and a set is built by walking from song to compatible song.
+
+The module contains the following classes:
+
+- `LibraryIndex(library_df)`: Index over the keys, bpms, energy levels and artists of a feature library.
+    - `candidates(self, label)`: Positions of the songs with a compatible key and bpm that can follow the given song.
+    - `build_set(self, mix, n_songs=None, duration_s=None, seed=None)`: Builds a mixed set of songs from the library.
+"""
+
+import math
+
+import numpy as np
+import pandas as pd
+
+from playlistjockey import filters, mixes, utils
+
+# Number of previous songs whose artists can't be repeated
+RECENT_ARTISTS = 3
+
+
+class LibraryIndex:
+    """Index over the keys, bpms, energy levels and artists of a feature library, used to build sets without mixing the whole library.
+
+    Args:
+        library_df (pd.DataFrame): DataFrame containing songs with required columns, and unique index labels. Sets following the "genre" mix
+            also require the artist_similarity column.
+
+    Attributes:
+        library_df (pd.DataFrame): The indexed library.
+    """
+
+    def __init__(self, library_df):
+        self.library_df = library_df
+        self._codes = utils.camelot_codes(library_df["key"])
+        self._bpm = library_df["bpm"].to_numpy(dtype=float)
+        self._energy = library_df["energy"].to_numpy(dtype=float)
+        self._duration = library_df["duration_s"].to_numpy(dtype=float)
+        self._similarity = None
+        if "artist_similarity" in library_df:
+            self._similarity = library_df["artist_similarity"].to_numpy(dtype=float)
+
+        # Code each song by its lead artist, to rule out recently played artists without looking at every artist list
+        self._artists = library_df["artists"].to_numpy()
+        self._lead_artist, _ = pd.factorize(
+            pd.Series([i[0] if len(i) else None for i in self._artists])
+        )
+
+        # Songs of each camelot key, and all songs, sorted by bpm
+        self._by_key = [self._sorted_by_bpm(self._codes == i) for i in range(24)]
+        self._all = self._sorted_by_bpm(np.ones(len(library_df), dtype=bool))
+
+    def __len__(self):
+        return len(self.library_df)
+
+    def _sorted_by_bpm(self, mask):
+        """Helper function to sort the positions of the masked songs by bpm."""
+        positions = np.flatnonzero(mask)
+        order = np.argsort(self._bpm[positions], kind="stable")
+        return self._bpm[positions][order], positions[order]
+
+    def _candidates(self, position, keys=True):
+        """Helper function to find the positions of the songs within the bpm windows of the song at the given position, in a compatible key
+        if keys."""
+        prev_bpm = self._bpm[position]
+        groups = [self._all]
+        if keys and self._codes[position] >= 0:
+            compatible = utils.KEY_COMPATIBILITY[self._codes[position]]
+            groups = [self._by_key[i] for i in np.flatnonzero(compatible)]
+
+        found = []
+        for bpms, positions in groups:
+            for low, high in filters.BPM_WINDOWS:
+                start = np.searchsorted(bpms, prev_bpm * low, side="left")
+                stop = np.searchsorted(bpms, prev_bpm * high, side="right")
+                found.append(positions[start:stop])
+
+        return np.concatenate(found)
+
+    def candidates(self, label):
+        """Positions of the songs with a compatible key and bpm that can follow the song with the given index label."""
+        return self._candidates(self.library_df.index.get_loc(label))
+
+    def _pick(self, candidates, used, recent, rng, target=None, column=None, prev=None):
+        """Helper function to pick the next song out of the candidate positions, returning None if none are left.
+
+        Candidates that were already used or share a lead artist with a recent song are skipped. If a target energy is given, the song closest to
+        it is picked. Otherwise, if a column is given, a random song within 1 of the previous song's value is picked.
+        """
+        candidates = candidates[~used[candidates]]
+        candidates = candidates[~np.isin(self._lead_artist[candidates], recent["lead"])]
+        if column is not None:
+            candidates = candidates[np.abs(column[candidates] - column[prev]) <= 1]
+        if target is not None and len(candidates):
+            distance = np.abs(self._energy[candidates] - target)
+            candidates = candidates[distance == distance.min()]
+
+        # Pick a random candidate, checking its full artist list against the recent artists
+        picks = rng.choice(
+            len(candidates), size=min(len(candidates), 10), replace=False
+        )
+        for position in candidates[picks]:
+            if not recent["artists"].intersection(self._artists[position]):
+                return int(position)
+
+        return None
+
+    def build_set(self, mix, n_songs=None, duration_s=None, seed=None):
+        """Builds a mixed set of songs from the library, by walking from each song to a compatible one.
+
+        Each next song has a compatible key and bpm, and an artist that wasn't played in the last few songs. For the "dj" mix its energy is
+        within 1 of the previous song's, and for the "genre" mix its artist similarity is. For the "party" and "setlist" mixes, the song closest
+        to the mix's energy curve is picked instead. When no such song is left, the energy rule is dropped, then the key rule, and finally a
+        random song is picked.
+
+        Args:
+            mix (str): String identifying which mixing algorithm the set should follow. Options so far include "dj", "party", "setlist", and
+                "genre".
+            n_songs (int): Number of songs in the set.
+            duration_s (float): Length of the set in seconds, used if n_songs isn't given. The set ends with the song that reaches it.
+            seed (int): Seed of the random picks, for reproducible sets.
+
+        Returns:
+            set_df (pd.DataFrame): DataFrame with the songs of the set, in order, with the select type of each song.
+        """
+        if n_songs is None and duration_s is None:
+            raise ValueError("Supply either n_songs or duration_s.")
+
+        # Fetching genres for a whole library would take a request per artist, so the library has to be enriched up front
+        if mix == "genre" and self._similarity is None:
+            raise ValueError(
+                'The "genre" mix requires a library with an artist_similarity column. Enrich the library with enrich_genres, or load it '
+                "with genres=True, before indexing it."
+            )
+        rng = np.random.default_rng(seed)
+
+        # Estimate the length of the set, to lay out the energy curve
+        length = n_songs
+        if length is None:
+            length = math.ceil(duration_s / np.nanmedian(self._duration))
+        length = min(length, len(self))
+
+        targets = None
+        if mix in ("party", "setlist"):
+            curve = {"party": mixes.party_curve, "setlist": mixes.setlist_curve}[mix](
+                max(length, 2)
+            )
+            low, high = np.nanpercentile(self._energy, [5, 95])
+            curve = (curve - curve.min()) / max(curve.max() - curve.min(), 1e-9)
+            targets = low + curve * (high - low)
+        column = {"dj": self._energy, "genre": self._similarity}.get(mix)
+
+        used = np.zeros(len(self), dtype=bool)
+        positions, select_types = [], []
+        total_s = 0.0
+        while len(positions) < len(self):
+            if n_songs is not None and len(positions) >= n_songs:
+                break
+            if n_songs is None and total_s >= duration_s:
+                break
+
+            step = len(positions)
+            target = None if targets is None else targets[min(step, len(targets) - 1)]
+            recent_positions = positions[-RECENT_ARTISTS:]
+            recent = {
+                "lead": self._lead_artist[recent_positions],
+                "artists": {a for i in recent_positions for a in self._artists[i]},
+            }
+
+            position = None
+            if step == 0:
+                select_type = "start"
+                position = self._pick(
+                    np.arange(len(self)), used, recent, rng, target=target
+                )
+            else:
+                prev = positions[-1]
+                for select_type, keys, rule in [
+                    (mix, True, True),
+                    ("basic", True, False),
+                    ("basic", False, False),
+                ]:
+                    position = self._pick(
+                        self._candidates(prev, keys),
+                        used,
+                        recent,
+                        rng,
+                        target=target if rule else None,
+                        column=column if rule else None,
+                        prev=prev,
+                    )
+                    if position is not None:
+                        break
+
+            if position is None:
+                select_type = "random"
+                position = int(rng.choice(np.flatnonzero(~used)))
+
+            used[position] = True
+            positions.append(position)
+            select_types.append(select_type)
+            total_s += np.nan_to_num(self._duration[position])
+
+        set_df = self.library_df.iloc[positions].copy()
+        set_df["select_type"] = select_types
+
+        return set_df
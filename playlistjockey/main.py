@@ -4,26 +4,191 @@
 
 The module contains the following classes and functions:
 
-- `sort_playlist(playlist_df, mix)`: Sorts the songs in a playlist df using a specified mixing algorithm.
-- `Spotify(client_id, client_secret, redirect_uri)`: Class used for pulling and pushing playlists to and from Spotify.
-    - `get_playlist_features(self, playlist_id, genres=False)`: Pull in all required features of songs in a given playlist.
+- `sort_playlist(playlist_df, mix, cache=None, seed=None, client=None, **kwargs)`: Sorts the songs in a playlist df using a specified mixing algorithm.
+- `merge_playlists(sources, mix=None, max_workers=None, cache=None, seed=None, **kwargs)`: Merges several playlists into one without duplicate
+    songs, optionally sorting it.
+- `iter_mix(playlist_df, mix, client=None)`: Generator that mixes a playlist one song at a time, accepting feedback on skipped, pinned and removed songs.
+- `Spotify(client_id, client_secret, redirect_uri, transport=None, tracer=None)`: Class used for pulling and pushing playlists to and from Spotify.
+    - `get_playlist_features(self, playlist_id, genres=False, compact=False, checkpoint=False, snapshots=False, refresh_after=None)`: Pull in all required features of songs in a given playlist.
     - `update_playlist(self, playlist_id, playlist_df)`: Overwrites the songs and order of the given playlist ID, using the songs in the given playlist DataFrame.
-- `Tidal(spotify)`: Class used for pulling and pushing playlists to and from Tidal.
-    - `get_playlist_features(self, playlist_id, genres=False)`: Pull in all required features of songs in a given playlist.
+- `Tidal(spotify, transport=None, token_store=None, interactive=True, tracer=None, parallel_search=False)`: Class used for pulling and pushing playlists to and from Tidal.
+    - `get_playlist_features(self, playlist_id, genres=False, compact=False, checkpoint=False, snapshots=False, refresh_after=None)`: Pull in all required features of songs in a given playlist.
     - `update_playlist(self, playlist_id, playlist_df)`: Overwrites the songs and order of the given playlist ID, using the songs in the given playlist DataFrame.
 """
 
 import pandas as pd
 import numpy as np
+import contextvars
+import functools
+import hashlib
 import html
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.decomposition import PCA
-
-from playlistjockey import utils, mixes
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from playlistjockey import utils, filters, mixes, scoring, selects, tracing
+from playlistjockey import genres as genres_model
+from playlistjockey.journal import Journal
+from playlistjockey.snapshots import SnapshotStore
+from playlistjockey.transport import Transport
 from playlistjockey.spotify import connect as sp_connect, extract as sp_extract
 from playlistjockey.tidal import connect as td_connect, extract as td_extract
 
 
+def _load_features(song_ids, get_features, prefix, journal=None, genres=False):
+    """Helper function to extract the features of each song, checkpointing them to the journal and skipping songs that fail. If genres,
+    songs checkpointed without genres are loaded again. Songs that appear more than once are loaded once, and kept at every position.
+
+    Returns:
+        feature_store (list): (song ID, features) pair of each loaded song, in playlist order.
+    """
+    completed = {}
+    if journal is not None:
+        completed, _ = journal.load()
+
+    loaded = {}
+    failed = {}
+    for n, song_id in enumerate(song_ids):
+        utils.progress_bar(n + 1, len(song_ids), prefix=prefix)
+        if song_id in loaded or song_id in failed:
+            continue
+
+        # Songs checkpointed by a previous run don't need to be loaded again, unless they are missing required genres
+        if song_id in completed and (not genres or "genres" in completed[song_id]):
+            loaded[song_id] = completed[song_id]
+            continue
+
+        try:
+            features = get_features(song_id)
+        except Exception as e:
+            failed[song_id] = repr(e)
+            if journal is not None:
+                journal.record_failure(song_id, failed[song_id])
+            continue
+
+        loaded[song_id] = features
+        if journal is not None:
+            journal.record(song_id, features)
+
+    _report_failures(failed)
+    if not failed and journal is not None:
+        journal.clear()
+
+    return [(i, loaded[i]) for i in song_ids if i in loaded]
+
+
+def _load_changed_features(
+    store,
+    provider,
+    playlist_id,
+    snapshot_id,
+    get_song_ids,
+    get_features,
+    get_popularity,
+    prefix,
+    genres=False,
+    journal=None,
+    refresh_after=None,
+):
+    """Helper function to only load the songs added since the playlist's last stored snapshot, refreshing volatile features when they are due.
+
+    Returns:
+        feature_store (list): (song ID, features) pair of each song, in playlist order.
+    """
+    state = store.load(provider, playlist_id)
+
+    # An unchanged snapshot means the stored song list is still current
+    if (
+        state is not None
+        and snapshot_id is not None
+        and state["snapshot_id"] == snapshot_id
+    ):
+        song_ids = state["song_ids"]
+        known, fetched_at = state["features"], state["fetched_at"]
+    else:
+        song_ids = get_song_ids()
+        known, fetched_at = {}, {}
+        if state is not None:
+            known, fetched_at = state["features"], state["fetched_at"]
+
+    # Only load added songs, and songs stored without genres if they are now required
+    missing = [
+        i
+        for i in dict.fromkeys(song_ids)
+        if i not in known or (genres and "genres" not in known[i])
+    ]
+    loaded = dict(_load_features(missing, get_features, prefix, journal, genres))
+
+    # Gather the features of each song, which drops removed songs
+    now = time.time()
+    features = {}
+    for i in dict.fromkeys(song_ids):
+        if i in loaded:
+            features[i] = loaded[i]
+            fetched_at[i] = now
+        elif i in known:
+            features[i] = known[i]
+
+    # Refresh volatile features of songs that were fetched too long ago
+    if refresh_after is not None:
+        stale = [
+            i
+            for i in features
+            if i not in loaded and now - fetched_at[i] >= refresh_after
+        ]
+        if len(stale) > 0:
+            for i, popularity in get_popularity(stale).items():
+                features[i]["popularity"] = popularity
+                fetched_at[i] = now
+
+    store.save(provider, playlist_id, snapshot_id, song_ids, features, fetched_at)
+
+    # Assemble the features in playlist order, keeping songs that appear more than once
+    return [(i, features[i]) for i in song_ids if i in features]
+
+
+def _report_failures(failed):
+    """Helper function to report the songs that were skipped because they could not be loaded."""
+    if failed:
+        print(
+            "\nSkipped {} songs that could not be loaded: {}".format(
+                len(failed), ", ".join(str(i) for i in failed)
+            )
+        )
+
+
+def _add_artist_similarity(playlist_df, model=None):
+    """Helper function to score the songs' genres on the shared artist similarity scale from 0 to 10, queueing their unseen genres for the
+    genre model's next refit."""
+    if model is None:
+        model = genres_model.default_model()
+
+    model.observe(playlist_df["genres"])
+    playlist_df["artist_similarity"] = model.transform(playlist_df["genres"])
+
+    return playlist_df
+
+
+def _build_playlist_df(
+    feature_store, genres=False, compact=False, sp=None, id_column="track_id"
+):
+    """Helper function to assemble the extracted (song ID, features) pairs, in playlist order, into a playlist df. If a Spotify client is
+    given, it is recorded as the source that genres can be fetched with later, from the Spotify track IDs in id_column.
+    """
+    playlist_df = pd.DataFrame([features for _, features in feature_store])
+
+    # A playlist where every song failed to load has no genres to score
+    if genres and len(playlist_df) > 0:
+        playlist_df = _add_artist_similarity(playlist_df)
+
+    if compact:
+        playlist_df = utils.compact_playlist(playlist_df)
+
+    if sp is not None:
+        genres_model.set_genre_source(playlist_df, sp, id_column)
+
+    return playlist_df
+
+
 def _get_mix(mix):
     """Helper function to define which mixing technique to use."""
     if mix == "dj":
@@ -38,80 +203,338 @@ def _get_mix(mix):
     return mix_algorhythm
 
 
-def sort_playlist(playlist_df, mix):
+def sort_playlist(playlist_df, mix, cache=None, seed=None, client=None, **kwargs):
     """Sorts the songs in a playlist df using a specified mixing algorithm.
 
     Args:
         playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
         mix (str): String identifying which mixing algorithm you would like to use to sort the playlist. Options so far include "dj", "party", "setlist", and "genre".
+        cache (playlistjockey.cache.MixCache object): Cache of computed mixes. If the same songs were already sorted with the same mix, options
+            and seed, the stored order is returned. Only used when a seed is given, as unseeded mixes are random.
+        seed (int): Seed of the random song selection, for reproducible mixes.
+        client (playlistjockey.main.Spotify or playlistjockey.main.Tidal object): Client to fetch genres with, if the "genre" mix needs them.
+            Defaults to the client the playlist was loaded with.
+        **kwargs: Options passed on to the mixing algorithm, such as beam_width and depth for the "dj" and "genre" mixes.
 
     Returns:
         df (pd.DataFrame): DataFrame with the updated sorting of songs.
     """
-    # Establish a copy of playlist_df
-    df = playlist_df.copy()
-
     # Identify which mix algorhythm to utilize
     mix_algorhythm = _get_mix(mix)
 
+    # Reuse a stored mix of the same songs
+    if cache is not None and seed is not None:
+        df = cache.get(playlist_df, mix, kwargs, seed)
+        if df is not None:
+            return df
+
+    # Establish a copy of playlist_df, fetching genres on first use
+    df = playlist_df.copy()
+    if mix == "genre":
+        df = genres_model.ensure_genres(df, client)
+
     # Apply the mix and return
-    df = mix_algorhythm(df)
+    with utils.seeded_random(seed):
+        df = mix_algorhythm(df, **kwargs)
+
+    if cache is not None and seed is not None:
+        cache.put(playlist_df, mix, df, kwargs, seed)
 
     return df
 
 
-def optimal_sort_playlist(playlist_df, mix, n=None):
+def optimal_sort_playlist(playlist_df, mix, n=None, cache=None, seed=None, client=None):
     """Sort the songs in a playlist df many times using a specified mixing algorithm to find an optimal order.
 
     Args:
         playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
         mix (str): String identifying which mixing algorithm you would like to use to sort the playlist. Options so far include "dj", "party", "setlist", and "genre".
         n (int): Specifies how many sorting iterations you want to run. Default is the number of songs in the supplied playlist_df.
+        cache (playlistjockey.cache.MixCache object): Cache of computed mixes. If the same songs were already optimized with the same mix,
+            iterations and seed, the stored order is returned. Only used when a seed is given.
+        seed (int): Seed of the random song selection, for reproducible optimizations.
+        client (playlistjockey.main.Spotify or playlistjockey.main.Tidal object): Client to fetch genres with, if the "genre" mix needs them.
+            Defaults to the client the playlist was loaded with.
 
     Returns:
         df (pd.DataFrame): DataFrame with the updated sorting of songs.
     """
-    # Call the mix algorhythm once to get the best select type
-    _get_mix(mix)(playlist_df)
-    best_select = _get_mix(mix).select_order[0][1]
+    # Validate the mix before running any iterations
+    _get_mix(mix)
 
     # If not explicitly inputted, set iterations to song count
     if not n:
         n = len(playlist_df)
 
-    # Sort the playlist n times, caputring how many best and random selects are made
-    mix_store = []
-    for i in range(n):
-        utils.progress_bar(
-            i + 1,
-            n,
-            prefix="Running iterations of {} algorhythm:".format(mix),
-        )
-        df = sort_playlist(playlist_df, mix)
-        n_best = len(df[df["select_type"] == best_select])
-        n_random = len(df[df["select_type"] == "random"])
-        mix_peformance = {
-            "n_best": n_best,
-            "n_random": n_random,
-            "diff": n_best - n_random,
-            "df": df,
-        }
-        mix_store.append(mix_peformance)
-    results = pd.DataFrame(mix_store)
-
-    # Sort the results to get the optimal song order
-    results = results.sort_values(by="diff", ascending=False)
-
-    # Grab the best sorted df and return
-    best_sort = results.head(1)
-    sorted_df = best_sort["df"].item()
+    # Reuse a stored optimization of the same songs
+    use_cache = cache is not None and seed is not None
+    if use_cache:
+        df = cache.get(playlist_df, "optimal_" + mix, {"n": n}, seed)
+        if df is not None:
+            return df
+
+    # Fetch genres once, rather than on every iteration
+    mix_df = playlist_df
+    if mix == "genre":
+        mix_df = genres_model.ensure_genres(playlist_df, client)
+
+    # Sort the playlist n times, scoring each order's transitions and keeping only the best order so far
+    best_df = None
+    best_performance = None
+    with utils.seeded_random(seed):
+        for i in range(n):
+            utils.progress_bar(
+                i + 1,
+                n,
+                prefix="Running iterations of {} algorhythm:".format(mix),
+            )
+            df = sort_playlist(mix_df, mix)
+            mix_performance = scoring.mix_performance(scoring.score_playlist(df), mix)
+            if (
+                best_performance is None
+                or mix_performance["diff"] > best_performance["diff"]
+            ):
+                best_df = df
+                best_performance = mix_performance
+
     print(
         "\nMixing optimized, found iteration with {} {} and {} random song transitions.".format(
-            best_sort["n_best"].item(), best_select, best_sort["n_random"].item()
+            best_performance["n_best"], mix, best_performance["n_random"]
         )
     )
 
-    return sorted_df
+    if use_cache:
+        cache.put(playlist_df, "optimal_" + mix, best_df, {"n": n}, seed)
+
+    return best_df
+
+
+def _song_keys(playlist_df):
+    """Helper function to identify each song across playlists and services, both by its ISRC and by a hash of its cleaned title and lead
+    artist.
+
+    Returns:
+        isrc_keys (pd.Series): ISRC key of each song, missing for songs without one.
+        name_keys (pd.Series): Title and lead artist key of each song.
+    """
+    isrcs = [None] * len(playlist_df)
+    if "isrc" in playlist_df:
+        isrcs = playlist_df["isrc"].tolist()
+
+    isrc_keys = []
+    name_keys = []
+    for isrc, title, artists in zip(
+        isrcs, playlist_df["title"], playlist_df["artists"]
+    ):
+        isrc_keys.append(
+            "isrc:" + isrc.upper() if isinstance(isrc, str) and isrc else None
+        )
+        artist = ""
+        if artists is not None and not isinstance(artists, float) and len(artists):
+            artist = artists[0]
+        name = "{}\x1f{}".format(
+            utils.clean_title(str(title)).lower().strip(),
+            utils.clean_artist(str(artist)).lower().strip(),
+        )
+        name_keys.append("name:" + hashlib.sha1(name.encode()).hexdigest())
+
+    return pd.Series(isrc_keys, dtype=object), pd.Series(name_keys, dtype=object)
+
+
+def _duplicated_songs(playlist_df):
+    """Helper function to flag each song that matches an earlier song of the playlist df by ISRC, or by its cleaned title and lead artist, so
+    a song with an ISRC in one service and none in the other is still matched."""
+    isrc_keys, name_keys = _song_keys(playlist_df)
+    duplicated = isrc_keys.notna() & isrc_keys.duplicated()
+    duplicated |= name_keys.duplicated()
+
+    return duplicated.to_numpy()
+
+
+def _load_playlist(source):
+    """Helper function to load a (client, playlist_id) pair, passing already loaded playlist dfs through."""
+    if isinstance(source, pd.DataFrame):
+        return source
+    client, playlist_id = source
+    return client.get_playlist_features(playlist_id)
+
+
+def merge_playlists(
+    sources, mix=None, max_workers=None, cache=None, seed=None, **kwargs
+):
+    """Merges several playlists into one, dropping songs that appear more than once, and optionally sorts the merged playlist.
+
+    Playlists are loaded concurrently. Songs are matched by ISRC or by their cleaned title and lead artist, so the same song from a Spotify
+    and a Tidal playlist is only kept once, even if only one of them has an ISRC, like Tidal videos and songs restored from journals or
+    snapshots written before ISRCs were collected. The first occurrence of each song is kept.
+
+    Args:
+        sources (list): Playlists to merge, each either a (client, playlist_id) pair, where client is a Spotify or Tidal object, or an already
+            loaded playlist df.
+        mix (str): String identifying which mixing algorithm to sort the merged playlist with. Options so far include "dj", "party", "setlist",
+            and "genre". The merged playlist is returned in playlist order if None.
+        max_workers (int): Number of playlists loaded at the same time. Defaults to the number of playlists.
+        cache (playlistjockey.cache.MixCache object): Cache of computed mixes, passed on to sort_playlist.
+        seed (int): Seed of the random song selection, passed on to sort_playlist.
+        **kwargs: Options passed on to the mixing algorithm.
+
+    Returns:
+        df (pd.DataFrame): DataFrame with the songs of all playlists, without duplicates.
+    """
+    if mix is not None:
+        _get_mix(mix)
+
+    # Each playlist loads in a copy of the caller's context, so tracing spans stay attributed to their playlist
+    contexts = [contextvars.copy_context() for i in sources]
+    with ThreadPoolExecutor(
+        max_workers=max_workers or max(len(sources), 1)
+    ) as executor:
+        playlists = list(
+            executor.map(
+                lambda context, source: context.run(_load_playlist, source),
+                contexts,
+                sources,
+            )
+        )
+
+    # Spotify and Tidal playlists keep their Spotify IDs in different columns, so gather them in one column to fetch genres with later
+    genre_sources = [i.attrs for i in playlists if "genre_source" in i.attrs]
+    id_columns = {i["genre_ids"] for i in genre_sources}
+    if len(id_columns) > 1:
+        playlists = [
+            (
+                i.assign(sp_track_id=i["track_id"])
+                if i.attrs.get("genre_ids") == "track_id"
+                else i
+            )
+            for i in playlists
+        ]
+        id_columns = {"sp_track_id"}
+
+    # Keep the first occurrence of each song
+    df = pd.concat(playlists, ignore_index=True)
+    df = df[~_duplicated_songs(df)]
+    df = df.reset_index(drop=True)
+
+    # Playlists scored before a refit of the genre model are on an older scale, so score every song with genres again on the current one
+    if "artist_similarity" in df:
+        scored = df["artist_similarity"].notna()
+        df.loc[scored, "artist_similarity"] = genres_model.default_model().transform(
+            df.loc[scored, "genres"]
+        )
+
+    if len(genre_sources) > 0:
+        df.attrs.update(
+            genre_source=genre_sources[0]["genre_source"], genre_ids=id_columns.pop()
+        )
+
+    if mix is not None:
+        df = sort_playlist(df, mix, cache=cache, seed=seed, **kwargs)
+
+    return df
+
+
+def _select_next(donor_df, recipient_df, select_order, bpm_index):
+    """Helper function to pick the next song with the first select of a mix's select order that finds one."""
+    for select, select_type in select_order:
+        if select_type == "random" or len(recipient_df) == 0:
+            next_song_index = selects.random_select_song(donor_df)
+        else:
+            next_song_index = select(donor_df, recipient_df, bpm_index)
+        if next_song_index is not None:
+            return next_song_index, select_type
+
+    return None, None
+
+
+def _curve_bucket(donor_df, recipient_df, mix):
+    """Helper function to find the songs that belong in the next slot of a party or setlist mix's energy curve.
+
+    The remaining songs are matched to the remaining slots of the curve by rank, so the next slot gets the songs with the energy level of the
+    same rank among the remaining songs as the slot's target among the remaining targets.
+    """
+    curve = {"party": mixes.party_curve, "setlist": mixes.setlist_curve}[mix](
+        len(recipient_df) + len(donor_df)
+    )
+    targets = curve[len(recipient_df) :]
+    rank = int((targets < targets[0]).sum())
+
+    energy = donor_df["energy"].to_numpy(dtype=float)
+    slot_energy = np.sort(energy)[rank]
+
+    return donor_df[energy == slot_energy]
+
+
+def iter_mix(playlist_df, mix, client=None):
+    """Generator that mixes a playlist one song at a time, yielding each song as soon as it is selected, for live queues.
+
+    Songs are picked with the same selects as the mix in `sort_playlist`. For the "party" and "setlist" mixes, each song is picked among the
+    remaining songs whose energy fits the next slot of the mix's energy curve. Since every pick is made from the songs still remaining, feedback
+    only changes the rest of the mix. Feedback is sent to the generator as an (action, song index) tuple:
+
+    - `("skip", None)`: The last yielded song wasn't played. It stays available, and a different song is yielded in its place.
+    - `("pin", index)`: The last yielded song was played, and the song with the given index is queued to play next.
+    - `("remove", index)`: The last yielded song was played, and the song with the given index is removed from the remaining songs.
+
+    Args:
+        playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
+        mix (str): String identifying which mixing algorithm you would like to use to sort the playlist. Options so far include "dj", "party", "setlist", and "genre".
+        client (playlistjockey.main.Spotify or playlistjockey.main.Tidal object): Client to fetch genres with, if the "genre" mix needs them.
+            Defaults to the client the playlist was loaded with.
+
+    Yields:
+        song (pd.Series): The next song, with the select type that picked it. Its name is the song's index in playlist_df.
+    """
+    # Validate the mix before yielding any songs
+    _get_mix(mix)
+
+    donor_df = playlist_df.copy()
+    if mix == "genre":
+        donor_df = genres_model.ensure_genres(donor_df, client)
+    donor_df["select_type"] = ""
+    recipient_df = donor_df.iloc[0:0].copy()
+    bpm_index = filters.BpmIndex(donor_df)
+    select_order = mixes.SELECT_ORDERS[mix]
+
+    pinned = []
+    skipped = None
+    while len(donor_df) != 0:
+        # Songs pinned by the listener come first
+        if pinned:
+            next_song_index, select_type = pinned.pop(0), "pinned"
+        else:
+            # Don't offer a skipped song again straight away, unless it is the only one left
+            pool_df = donor_df
+            if skipped is not None and len(donor_df) > 1:
+                pool_df = donor_df.drop(skipped)
+            if mix in ("party", "setlist"):
+                pool_df = _curve_bucket(pool_df, recipient_df, mix)
+            next_song_index, select_type = _select_next(
+                pool_df, recipient_df, select_order, bpm_index
+            )
+
+        song = donor_df.loc[next_song_index].copy()
+        song["select_type"] = select_type
+        feedback = yield song
+
+        action, index = feedback if feedback is not None else (None, None)
+        if action == "skip":
+            skipped = next_song_index
+            continue
+        skipped = None
+
+        donor_df, recipient_df = utils.move_song(
+            donor_df, recipient_df, next_song_index, select_type
+        )
+        bpm_index.remove(next_song_index)
+
+        if action == "pin" and index in donor_df.index and index not in pinned:
+            pinned.append(index)
+        elif action == "remove" and index in donor_df.index:
+            donor_df = donor_df.drop(index)
+            bpm_index.remove(index)
+            if index in pinned:
+                pinned.remove(index)
 
 
 class Spotify:
@@ -121,64 +544,95 @@ class Spotify:
         client_id (str): Your Client ID generated from your Spotify application.
         client_secret (str): Your Client Secret ID generated from your Spotify application.
         redirect_uri (str): Your Redirect URI set from your Spotify application.
+        transport (playlistjockey.transport.Transport object): HTTP transport shared with any Tidal object created from this one. Defaults to a new Transport.
+        tracer (playlistjockey.tracing.Tracer object): Records the endpoint, latency, bytes and retries of every Spotify call, grouped per playlist.
 
     Attributes:
         sp (spotipy.client.Spotify object): Spotify API client used to connect to your account.
+        transport (playlistjockey.transport.Transport object): HTTP transport used by the Spotify API client.
+        tracer (playlistjockey.tracing.Tracer object): Tracer recording the Spotify calls, if any.
     """
 
-    def __init__(self, client_id, client_secret, redirect_uri):
-        self.sp = sp_connect.connect_spotify(client_id, client_secret, redirect_uri)
+    def __init__(
+        self, client_id, client_secret, redirect_uri, transport=None, tracer=None
+    ):
+        if transport is None:
+            transport = Transport()
+        self.transport = transport
+        self.tracer = tracer
+        if tracer is not None:
+            tracer.instrument(transport)
+        self.sp = tracing.traced(
+            sp_connect.connect_spotify(
+                client_id, client_secret, redirect_uri, transport
+            ),
+            tracer,
+            "spotify",
+        )
 
-    def get_playlist_features(self, playlist_id, genres=False):
+    @tracing.traced_run("spotify")
+    def get_playlist_features(
+        self,
+        playlist_id,
+        genres=False,
+        compact=False,
+        checkpoint=False,
+        snapshots=False,
+        refresh_after=None,
+    ):
         """Pull in all required features of songs in a given playlist.
 
         Args:
             playlist_id (str): Unique Spotify playlist ID or shared link. This can be acquired by selecting a playlist and selecting the "copy link to playlist" option under share.
+            genres (bool): Also collect the genres of each song's artists, adding the "genres" and "artist_similarity" columns required by the genre mix. Otherwise genres are
+                fetched once the genre mix first needs them, or with enrich_genres.
+            compact (bool): Return the playlist using the compact dtype layout from `utils.compact_playlist`, which uses a fraction of the memory.
+            checkpoint (bool): Checkpoint each loaded song to a journal in the user's cache directory, so an interrupted load resumes where it
+                left off. Songs that fail to load are skipped and retried on the next call.
+            snapshots (bool): Remember the playlist's snapshot and song features in the user's cache directory. Unchanged playlists are then
+                returned without loading any songs, and changed playlists only load the songs that were added.
+            refresh_after (int): When using snapshots, refresh the popularity of stored songs fetched more than this many seconds ago.
 
         Returns:
             playlist_df (pd.DataFrame): DataFrame of all tracks and their features in the inputted playlist. To be used as input into the sort_playlist function.
         """
-        # Get playlist object
-        playlist = self.sp.playlist(playlist_id)
-        playlist_tracks = playlist["tracks"]
-
-        # First, get all song IDs for feature extraction
-        song_ids = []
-        utils.show_tracks(playlist_tracks, song_ids)
-        while playlist_tracks["next"]:
-            playlist_tracks = self.sp.next(playlist_tracks)
-            utils.show_tracks(playlist_tracks, song_ids)
-
-        # Now iterate through each song to get required features
-        feature_store = []
-        for i in song_ids:
-            utils.progress_bar(
-                len(feature_store) + 1,
-                len(song_ids),
-                prefix="Loading songs from {}:".format(playlist["name"]),
+        # Get playlist name and snapshot
+        playlist = self.sp.playlist(playlist_id, fields="name,snapshot_id")
+        playlist_key = sp_extract.get_playlist_id(playlist_id)
+
+        # Resume from the playlist's journal if checkpointing
+        journal = None
+        if checkpoint:
+            journal = Journal.for_playlist("spotify", playlist_key)
+
+        # Get all song IDs, then iterate through each song to get required features
+        get_features = functools.partial(
+            sp_extract.get_track_features, self.sp, genres=genres
+        )
+        prefix = "Loading songs from {}:".format(playlist["name"])
+        if snapshots:
+            feature_store = _load_changed_features(
+                SnapshotStore(),
+                "spotify",
+                playlist_key,
+                playlist["snapshot_id"],
+                lambda: sp_extract.get_playlist_track_ids(self.sp, playlist_id),
+                get_features,
+                lambda i: sp_extract.get_popularity(self.sp, i),
+                prefix,
+                genres,
+                journal,
+                refresh_after,
             )
-            feature_store.append(sp_extract.get_track_features(self.sp, i, genres))
-        playlist_df = pd.DataFrame(feature_store)
-
-        if genres:
-            # Explode and scale genres
-            dummies = playlist_df["genres"].explode().str.get_dummies()
-            dummies = dummies.groupby(level=0).sum()
-            dummies = MinMaxScaler().fit_transform(dummies)
-
-            # Apply PCA to identify similar song groupings
-            pca = PCA(n_components=1)
-            log_pca = pca.fit_transform(dummies)
-            pca_feature_importance = np.around(MinMaxScaler().fit_transform(log_pca), 3)
-
-            # Add into df
-            playlist_df["artist_similarity"] = pca_feature_importance
-            playlist_df["artist_similarity"] = playlist_df["artist_similarity"].apply(
-                lambda x: round(x * 10)
+        else:
+            song_ids = sp_extract.get_playlist_track_ids(self.sp, playlist_id)
+            feature_store = _load_features(
+                song_ids, get_features, prefix, journal, genres
             )
 
-        return playlist_df
+        return _build_playlist_df(feature_store, genres, compact, self.sp)
 
+    @tracing.traced_run("spotify")
     def update_playlist(self, playlist_id, playlist_df):
         """Overwrites the songs and order of the given playlist ID, using the songs in the given playlist DataFrame.
 
@@ -220,77 +674,131 @@ class Tidal:
 
     Args:
         spotify (playlistjockey.main.Spotify object): Spotify object by calling the playlistjockey.Spotify class.
+        transport (playlistjockey.transport.Transport object): HTTP transport used by the Tidal API client. Defaults to the Spotify object's transport.
+        token_store (object): Where Tidal tokens are loaded from and saved to, see `playlistjockey.tidal.connect`. Defaults to Tidal tokens set in the
+            environment, otherwise a token file in the user's config directory.
+        interactive (bool): Open a browser login when no valid Tidal tokens are available. If False, a ConnectionError is raised instead.
+        tracer (playlistjockey.tracing.Tracer object): Records the endpoint, latency, bytes and retries of every Tidal call, grouped per playlist.
+            Defaults to the Spotify object's tracer.
+        parallel_search (bool): Issue the ISRC and title and artist searches used to find each Tidal song in Spotify concurrently, so unmatched
+            songs cost a single round trip instead of up to five. Searches share one thread pool, no larger than the connection pool of the
+            Spotify object's transport.
 
     Attributes:
         sp (spotipy.client.Spotify object): Spotify API client used to connect to your account.
         td (tidalapi.session.Session object): Tidal API client used to connect to your account.
+        transport (playlistjockey.transport.Transport object): HTTP transport used by the Tidal API client.
+        tracer (playlistjockey.tracing.Tracer object): Tracer recording the Spotify and Tidal calls, if any.
     """
 
-    def __init__(self, spotify):
+    def __init__(
+        self,
+        spotify,
+        transport=None,
+        token_store=None,
+        interactive=True,
+        tracer=None,
+        parallel_search=False,
+    ):
+        self.parallel_search = parallel_search
+
+        # Searches go to Spotify, so they are bounded by the Spotify transport's connection pool
+        self._search_executor = None
+        if parallel_search:
+            self._search_executor = ThreadPoolExecutor(
+                max_workers=spotify.transport.pool_size
+            )
+        if transport is None:
+            transport = spotify.transport
+        if tracer is None:
+            tracer = spotify.tracer
+        self.transport = transport
+        self.tracer = tracer
+        if tracer is not None:
+            tracer.instrument(transport)
         self.sp = spotify.sp
-        self.td = td_connect.connect()
+        self.td = tracing.traced(
+            td_connect.connect(transport, token_store, interactive), tracer, "tidal"
+        )
 
-    def get_playlist_features(self, playlist_id, genres=False):
+    @tracing.traced_run("tidal")
+    def get_playlist_features(
+        self,
+        playlist_id,
+        genres=False,
+        compact=False,
+        checkpoint=False,
+        snapshots=False,
+        refresh_after=None,
+    ):
         """Pull in all required features of songs in a given playlist.
 
         Args:
             playlist_id (str): Unique Tidal playlist ID or shared link. This can be acquired by selecting the "copy link to playlist" option under share.
+            genres (bool): Also collect the genres of each song's artists, adding the "genres" and "artist_similarity" columns required by the genre mix. Otherwise genres are
+                fetched once the genre mix first needs them, or with enrich_genres.
+            compact (bool): Return the playlist using the compact dtype layout from `utils.compact_playlist`, which uses a fraction of the memory.
+            checkpoint (bool): Checkpoint each loaded song to a journal in the user's cache directory, so an interrupted load resumes where it
+                left off. Songs that fail to load are skipped and retried on the next call.
+            snapshots (bool): Remember the playlist's snapshot and song features in the user's cache directory. Unchanged playlists are then
+                returned without loading any songs, and changed playlists only load the songs that were added.
+            refresh_after (int): When using snapshots, refresh the popularity of stored songs fetched more than this many seconds ago.
 
         Returns:
             playlist_df (pd.DataFrame): DataFrame of all tracks and their features in the inputted playlist. To be used as input into the sort_playlist function.
         """
         # If playlist_id is a shared link, strip out the playlist id
-        if playlist_id[:6] == "https:":
-            playlist_id = playlist_id.split("/")[5]
+        playlist_id = td_extract.get_playlist_id(playlist_id)
 
-        # Pull in the playlist tracks
+        # Pull in the playlist
         playlist = self.td.playlist(playlist_id)
-        media = playlist.tracks()
-
-        # If there are videos, pull them in instead using the items func
-        if playlist.num_videos > 0:
-            # Add media 100 items at a time
-            q = len(media) // 100
-            media = []
-
-            offset = 0
-            for i in range(q + 1):
-                media.extend(playlist.items(offset=offset))
-                offset += 100
-
-        # Now iterate through each song to get required features
-        feature_store = []
-        for i in media:
-            utils.progress_bar(
-                len(feature_store) + 1,
-                len(media),
-                prefix="Loading songs from {}:".format(playlist.name),
-            )
-            feature_store.append(
-                td_extract.get_song_features(self.sp, self.td, i.id, genres)
-            )
 
-        playlist_df = pd.DataFrame(feature_store)
+        # Resume from the playlist's journal if checkpointing
+        journal = None
+        if checkpoint:
+            journal = Journal.for_playlist("tidal", playlist_id)
+
+        # Get all media, then iterate through each song to get required features, using the media objects already paged in
+        media = {}
 
-        if genres:
-            # Explode and scale genres
-            dummies = playlist_df["genres"].explode().str.get_dummies()
-            dummies = dummies.groupby(level=0).sum()
-            dummies = MinMaxScaler().fit_transform(dummies)
+        def get_song_ids():
+            playlist_media = td_extract.get_playlist_media(playlist)
+            media.update((i.id, i) for i in playlist_media)
+            return [i.id for i in playlist_media]
 
-            # Apply PCA to identify similar song groupings
-            pca = PCA(n_components=1)
-            log_pca = pca.fit_transform(dummies)
-            pca_feature_importance = np.around(MinMaxScaler().fit_transform(log_pca), 3)
+        def get_features(i):
+            return td_extract.get_song_features(
+                self.sp, self.td, media.get(i, i), genres, self._search_executor
+            )
 
-            # Add into df
-            playlist_df["artist_similarity"] = pca_feature_importance
-            playlist_df["artist_similarity"] = playlist_df["artist_similarity"].apply(
-                lambda x: round(x * 10)
+        prefix = "Loading songs from {}:".format(playlist.name)
+        if snapshots:
+            snapshot_id = None
+            if playlist.last_updated is not None:
+                snapshot_id = playlist.last_updated.isoformat()
+            feature_store = _load_changed_features(
+                SnapshotStore(),
+                "tidal",
+                playlist_id,
+                snapshot_id,
+                get_song_ids,
+                get_features,
+                lambda i: td_extract.get_popularity(self.td, i),
+                prefix,
+                genres,
+                journal,
+                refresh_after,
+            )
+        else:
+            feature_store = _load_features(
+                get_song_ids(), get_features, prefix, journal, genres
             )
 
-        return playlist_df
+        return _build_playlist_df(
+            feature_store, genres, compact, self.sp, "sp_track_id"
+        )
 
+    @tracing.traced_run("tidal")
     def update_playlist(self, playlist_id, playlist_df):
         """Overwrites the songs and order of the given playlist ID, using the songs in the given playlist DataFrame.
 
@@ -300,8 +808,7 @@ class Tidal:
 
         """
         # If playlist_id is a shared link, strip out the playlist id
-        if playlist_id[:6] == "https:":
-            playlist_id = playlist_id.split("/")[5]
+        playlist_id = td_extract.get_playlist_id(playlist_id)
 
         # Get playlist object
         playlist = self.td.playlist(playlist_id)
@@ -4,34 +4,238 @@
 
 The module contains the following classes and functions:
 
-- `dj_mix(donor_df)`: Mixing algorithm that sorts a playlist like a DJ: utilizing compatible keys, bpms, and energy features.
-- `party_mix(donor_df)`: Mixing algorithm that puts the most party appropriate songs in the middle of the playlist.
-- `setlist_mix(donor_df)`: Mixing algorithm that puts the most energetic and popular songs at the beginning and end of the playlist.
-- `genre_mix(donor_df)`: Mixing algorithm that sorts a playlist by grouping genres together.
+- `dj_mix(donor_df, beam_width=None, depth=None)`: Mixing algorithm that sorts a playlist like a DJ: utilizing compatible keys, bpms, and energy features.
+- `party_mix(donor_df, curve=None)`: Mixing algorithm that puts the most party appropriate songs in the middle of the playlist.
+- `setlist_mix(donor_df, curve=None)`: Mixing algorithm that puts the most energetic and popular songs at the beginning and end of the playlist.
+- `genre_mix(donor_df, beam_width=None, depth=None)`: Mixing algorithm that sorts a playlist by grouping genres together.
+- `party_curve(n)`: Target energy curve of the party mix.
+- `setlist_curve(n)`: Target energy curve of the setlist mix.
 """
 
 import pandas as pd
+import numpy as np
 
-from playlistjockey import selects, utils
+from playlistjockey import filters, genres, scoring, selects, utils
 
+# Selects each mix tries in order to pick the next song, with the select type each records
+SELECT_ORDERS = {
+    "dj": [
+        [selects.dj_select_song, "dj"],
+        [selects.basic_select_song, "basic"],
+        [selects.random_select_song, "random"],
+    ],
+    "party": [
+        [selects.party_select_song, "party"],
+        [selects.dj_select_song, "dj"],
+        [selects.basic_select_song, "basic"],
+        [selects.random_select_song, "random"],
+    ],
+    "setlist": [
+        [selects.setlist_select_song, "setlist"],
+        [selects.dj_select_song, "dj"],
+        [selects.basic_select_song, "basic"],
+        [selects.random_select_song, "random"],
+    ],
+    "genre": [
+        [selects.genre_select_song, "genre"],
+        [selects.basic_select_song, "basic"],
+        [selects.random_select_song, "random"],
+    ],
+}
+
+
+def _expand_beams(weights, last, used, scores, beam_width, steps):
+    """Helper function to grow beams of partial orders by the given number of steps, keeping the beam_width highest scoring ones after every
+    step. All expansions of a step are scored at once, as a beams x songs matrix.
+
+    Returns:
+        path (list): Songs added by the highest scoring beam, in order.
+    """
+    n = len(weights)
+    history = []
+    for _ in range(steps):
+        # Score every unused song as the next song of every beam
+        candidates = scores[:, None] + weights[last]
+        candidates[used] = -1
+        candidates = candidates.ravel()
+
+        # Keep the best expansions, ties going to earlier beams and songs
+        k = min(beam_width, int((candidates >= 0).sum()))
+        top = np.argsort(-candidates, kind="stable")[:k]
+        parents, songs = np.divmod(top, n)
+
+        used = used[parents]
+        used[np.arange(k), songs] = True
+        scores = candidates[top]
+        last = songs
+        history.append((parents, songs))
+
+    # Trace the best beam back through its parents
+    path = []
+    beam = 0
+    for parents, songs in reversed(history):
+        path.append(int(songs[beam]))
+        beam = parents[beam]
+
+    return path[::-1]
+
+
+def _beam_mix(donor_df, mix, beam_width, depth=None):
+    """Helper function to build a playlist order with a deterministic beam search over the transition grades of a mix.
+
+    Partial orders are scored by their number of best select transitions, then by their number of transitions with at least one compatible
+    feature. The search starts from the song the fewest other songs can compatibly transition into. Without a depth, beam_width partial orders
+    are grown to full length and the best one is returned. With a depth, each song is committed by looking depth songs ahead with a beam
+    search from the order so far.
+    """
+    if len(donor_df) == 0:
+        return donor_df
+
+    grades = scoring.transition_grades(donor_df, mix)
+    n = len(grades)
+
+    # Weigh best transitions above any number of basic ones, so beams are compared on best transitions first
+    weights = (grades == 2).astype(np.int64) * n + (grades >= 1)
+
+    start = int(np.argmin((grades >= 1).sum(axis=0)))
+    order = [start]
+    used = np.zeros(n, dtype=bool)
+    used[start] = True
+
+    if depth is None:
+        order += _expand_beams(
+            weights, np.array([start]), used[None], np.zeros(1), beam_width, n - 1
+        )
+    else:
+        while len(order) < n:
+            path = _expand_beams(
+                weights,
+                np.array([order[-1]]),
+                used[None],
+                np.zeros(1),
+                beam_width,
+                min(depth, n - len(order)),
+            )
+            order.append(path[0])
+            used[path[0]] = True
+
+    order = np.array(order, dtype=int)
+    return _ordered_df(donor_df, order, grades[order[:-1], order[1:]], mix)
+
+
+def _ordered_df(donor_df, order, transitions, mix):
+    """Helper function to put the songs of donor_df in the given order of positions, labelling each transition with the select that would
+    have made it, given the grade of each transition."""
+    order = np.array(order, dtype=int)
+    labels = np.array(["random", "basic", mix])[transitions]
+
+    recipient_df = donor_df.iloc[order].copy()
+    recipient_df["select_type"] = np.concatenate([["start"], labels])
+
+    return recipient_df
+
+
+def party_curve(n):
+    """Target energy curve of the party mix: rising from the first song to a peak at the halfway point, then falling back down."""
+    x = np.linspace(0, 1, n)
+    return np.minimum(x, 1 - x)
+
+
+def setlist_curve(n):
+    """Target energy curve of the setlist mix: falling from the first song to a floor at the halfway point, then building back up."""
+    return -party_curve(n)
+
+
+def _curve_mix(donor_df, mix, curve, secondary):
+    """Helper function to order a playlist along a target energy curve.
+
+    Songs are assigned to slots by matching the songs ranked by energy (then by the secondary column) to the slots ranked by target energy.
+    This assignment is optimal for any convex cost of the difference between a song's energy and its slot's target, such as the squared error,
+    so no general assignment solver is needed. Songs of equal energy are interchangeable under that cost, so each slot is then filled, from
+    first to last, with the song of its energy that makes the best transition from the song before it.
+    """
+    n = len(donor_df)
+    if isinstance(curve, str):
+        if curve not in ("party", "setlist"):
+            raise ValueError("Unknown curve: {}".format(curve))
+    else:
+        curve = np.asarray(curve)
+        if curve.ndim != 1 or len(curve) == 0 or curve.dtype.kind not in "iuf":
+            raise ValueError(
+                'The curve must be "party", "setlist", or a non-empty 1-D array of target energy levels.'
+            )
+
+    # An empty playlist has no slots to fill
+    if n == 0:
+        return donor_df.assign(
+            select_type=pd.Series(dtype=object), ma_energy=pd.Series(dtype=float)
+        )
+
+    if isinstance(curve, str):
+        curve = {"party": party_curve, "setlist": setlist_curve}[curve](n)
+    curve = curve.astype(float)
+    if len(curve) != n:
+        # Stretch or shrink the curve to one target per song
+        curve = np.interp(np.linspace(0, 1, n), np.linspace(0, 1, len(curve)), curve)
+
+    # Rank matching: the k-th lowest energy song goes to the k-th lowest target slot
+    energy = donor_df["energy"].to_numpy(dtype=float)
+    songs = np.lexsort((donor_df[secondary].to_numpy(dtype=float), energy))
+    slots = np.argsort(curve, kind="stable")
+    matched = np.empty(n, dtype=int)
+    matched[slots] = songs
+
+    # Group the songs by energy, in the order of the slots they were matched to
+    buckets = {}
+    energy_codes, _ = pd.factorize(donor_df["energy"])
+    for song in matched:
+        buckets.setdefault(energy_codes[song], []).append(song)
+
+    # Fill the slots in order, picking the most compatible song of each slot's energy, grading only the transitions from the previous song
+    grader = scoring.TransitionGrader(donor_df, mix)
+    order = []
+    for song in matched:
+        bucket = buckets[energy_codes[song]]
+        pick = 0
+        if order:
+            pick = int(np.argmax(grader.grades([order[-1]], bucket)[0]))
+        order.append(bucket.pop(pick))
+
+    recipient_df = _ordered_df(donor_df, order, grader.consecutive(order), mix)
+
+    # Calculate a moving average to observe the behavior of the energy levels
+    recipient_df["ma_energy"] = (
+        recipient_df["energy"].rolling(len(recipient_df) // 10).mean()
+    )
+
+    return recipient_df
+
+
+def dj_mix(donor_df, beam_width=None, depth=None):
+    """Mixing algorithm that sorts a playlist like a DJ: utilizing compatible keys, bpms, and energy features.
+
+    By default songs are picked one at a time, at random among the compatible ones. If a beam_width is given, the order is instead built with a
+    deterministic beam search that keeps the beam_width orders with the most DJ transitions, looking depth songs ahead per song if a depth is
+    given.
+    """
+    if beam_width:
+        return _beam_mix(donor_df, "dj", beam_width, depth)
 
-def dj_mix(donor_df):
-    """Mixing algorithm that sorts a playlist like a DJ: utilizing compatible keys, bpms, and energy features."""
     # Establish the recipient df that will be the playlist's new order
-    recipient_df = pd.DataFrame(columns=donor_df.columns)
+    recipient_df = donor_df.iloc[0:0].copy()
+
+    # Index the tempos of the playlist, to speed up filtering for compatible bpms
+    bpm_index = filters.BpmIndex(donor_df)
 
     # Begin by randomly selecting the first song
     song_1_index = selects.random_select_song(donor_df)
     donor_df, recipient_df = utils.move_song(
         donor_df, recipient_df, song_1_index, "random"
     )
+    bpm_index.remove(song_1_index)
 
     # Define the order in which to select songs
-    dj_mix.select_order = [
-        [selects.dj_select_song, "dj"],
-        [selects.basic_select_song, "basic"],
-        [selects.random_select_song, "random"],
-    ]
+    dj_mix.select_order = SELECT_ORDERS["dj"]
 
     # Fill the rest of the playlist
     while len(donor_df) != 0:
@@ -39,60 +243,66 @@ def dj_mix(donor_df):
             if select_type == "random":
                 next_song_index = select(donor_df)
             else:
-                next_song_index = select(donor_df, recipient_df)
-            if next_song_index:
+                next_song_index = select(donor_df, recipient_df, bpm_index)
+            if next_song_index is not None:
                 break
 
         donor_df, recipient_df = utils.move_song(
             donor_df, recipient_df, next_song_index, select_type
         )
+        bpm_index.remove(next_song_index)
 
     return recipient_df
 
 
-def party_mix(donor_df):
+def party_mix(donor_df, curve=None):
     """Mixing algorithm that puts the most party appropriate songs in the middle of the playlist. This allows your playlist to compliment the typical flow of a party: starting at a
     low level of energy, building to a peak at the halfway point, then gradually lowering the energy back down.
+
+    By default the playlist is grown from the peak outwards, one compatible song at a time. If a curve is given, songs are instead assigned to
+    follow it in one pass, preferring compatible transitions between songs of equal energy. The curve is either "party", "setlist", or an
+    array of target energy levels, which is stretched to the length of the playlist.
     """
+    if curve is not None:
+        return _curve_mix(donor_df, "party", curve, "danceability")
+
     # Establish two recipient DataFrames
-    rec_front_half = pd.DataFrame(columns=donor_df.columns)
+    rec_front_half = donor_df.iloc[0:0].copy()
     rec_back_half = rec_front_half.copy()
 
     # Sort the donor_df by energy and danceability
-    donor_df.sort_values(by=["energy", "danceability"], ascending=False, inplace=True)
+    donor_df = donor_df.sort_values(by=["energy", "danceability"], ascending=False)
+    bpm_index = filters.BpmIndex(donor_df)
 
     # Grab the most hype song to establish the end of the first half of the playlist
     peak_index = donor_df.head(1).index[0]
     donor_df, rec_front_half = utils.move_song(
         donor_df, rec_front_half, peak_index, "peak"
     )
+    bpm_index.remove(peak_index)
 
     # Get a compatible song, use it to start the first song in the second half
     song_index = None
     while song_index is None:
-        song_index = selects.party_select_song(donor_df, rec_front_half)
-        if song_index:
+        song_index = selects.party_select_song(donor_df, rec_front_half, bpm_index)
+        if song_index is not None:
             select_type = "party"
             break
-        song_index = selects.dj_select_song(donor_df, rec_front_half)
-        if song_index:
+        song_index = selects.dj_select_song(donor_df, rec_front_half, bpm_index)
+        if song_index is not None:
             select_type = "dj"
             break
-        song_index = selects.basic_select_song(donor_df, rec_front_half)
-        if song_index:
+        song_index = selects.basic_select_song(donor_df, rec_front_half, bpm_index)
+        if song_index is not None:
             select_type = "basic"
             break
     donor_df, rec_back_half = utils.move_song(
         donor_df, rec_back_half, song_index, select_type
     )
+    bpm_index.remove(song_index)
 
     # Now fill the remainder of the songs into the two halves
-    party_mix.select_order = [
-        [selects.party_select_song, "party"],
-        [selects.dj_select_song, "dj"],
-        [selects.basic_select_song, "basic"],
-        [selects.random_select_song, "random"],
-    ]
+    party_mix.select_order = SELECT_ORDERS["party"]
 
     i = 3
     while len(donor_df) != 0:
@@ -105,13 +315,14 @@ def party_mix(donor_df):
             if select_type == "random":
                 next_song_index = select(donor_df)
             else:
-                next_song_index = select(donor_df, recipient_df)
-            if next_song_index:
+                next_song_index = select(donor_df, recipient_df, bpm_index)
+            if next_song_index is not None:
                 break
 
         donor_df, recipient_df = utils.move_song(
             donor_df, recipient_df, next_song_index, select_type
         )
+        bpm_index.remove(next_song_index)
 
         # Ensure updates are correctly overwritten
         if (i % 2) == 0:
@@ -133,49 +344,54 @@ def party_mix(donor_df):
     return recipient_df
 
 
-def setlist_mix(donor_df):
+def setlist_mix(donor_df, curve=None):
     """Mixing algorithm that puts the most energetic and popular songs at the beginning and end of the playlist. This allows your playlist to compliment the typical flow of a concert:
     Starting with high levels of energy, saving the least energetic song for the midpoint, then building the energy back up for the grand finale.
+
+    By default the playlist is grown from the floor outwards, one compatible song at a time. If a curve is given, songs are instead assigned to
+    follow it in one pass, preferring compatible transitions between songs of equal energy. The curve is either "setlist", "party", or an
+    array of target energy levels, which is stretched to the length of the playlist.
     """
+    if curve is not None:
+        return _curve_mix(donor_df, "setlist", curve, "popularity")
+
     # Establish two recipient DataFrames
-    rec_front_half = pd.DataFrame(columns=donor_df.columns)
+    rec_front_half = donor_df.iloc[0:0].copy()
     rec_back_half = rec_front_half.copy()
 
     # Sort the donor_df by energy and popularity
-    donor_df.sort_values(by=["energy", "popularity"], inplace=True)
+    donor_df = donor_df.sort_values(by=["energy", "popularity"])
+    bpm_index = filters.BpmIndex(donor_df)
 
     # Grab the least energetic song to establish the end of the first half of the playlist
     peak_index = donor_df.head(1).index[0]
     donor_df, rec_front_half = utils.move_song(
         donor_df, rec_front_half, peak_index, "floor"
     )
+    bpm_index.remove(peak_index)
 
     # Get a compatible song, use it to start the first song in the second half
     song_index = None
     while song_index is None:
-        song_index = selects.setlist_select_song(donor_df, rec_front_half)
-        if song_index:
+        song_index = selects.setlist_select_song(donor_df, rec_front_half, bpm_index)
+        if song_index is not None:
             select_type = "setlist"
             break
-        song_index = selects.dj_select_song(donor_df, rec_front_half)
-        if song_index:
+        song_index = selects.dj_select_song(donor_df, rec_front_half, bpm_index)
+        if song_index is not None:
             select_type = "dj"
             break
-        song_index = selects.basic_select_song(donor_df, rec_front_half)
-        if song_index:
+        song_index = selects.basic_select_song(donor_df, rec_front_half, bpm_index)
+        if song_index is not None:
             select_type = "basic"
             break
     donor_df, rec_back_half = utils.move_song(
         donor_df, rec_back_half, song_index, select_type
     )
+    bpm_index.remove(song_index)
 
     # Now fill the remainder of the songs into the two halves
-    setlist_mix.select_order = [
-        [selects.setlist_select_song, "setlist"],
-        [selects.dj_select_song, "dj"],
-        [selects.basic_select_song, "basic"],
-        [selects.random_select_song, "random"],
-    ]
+    setlist_mix.select_order = SELECT_ORDERS["setlist"]
 
     i = 3
     while len(donor_df) != 0:
@@ -188,13 +404,14 @@ def setlist_mix(donor_df):
             if select_type == "random":
                 next_song_index = select(donor_df)
             else:
-                next_song_index = select(donor_df, recipient_df)
-            if next_song_index:
+                next_song_index = select(donor_df, recipient_df, bpm_index)
+            if next_song_index is not None:
                 break
 
         donor_df, recipient_df = utils.move_song(
             donor_df, recipient_df, next_song_index, select_type
         )
+        bpm_index.remove(next_song_index)
 
         # Ensure updates are correctly overwritten
         if (i % 2) == 0:
@@ -216,30 +433,35 @@ def setlist_mix(donor_df):
     return recipient_df
 
 
-def genre_mix(donor_df):
-    """Mixing algorithm that sorts a playlist by grouping genres together."""
+def genre_mix(donor_df, beam_width=None, depth=None):
+    """Mixing algorithm that sorts a playlist by grouping genres together.
 
-    # Ensure the artist_similarity variable is present
-    if "artist_similarity" not in donor_df:
-        raise KeyError(
-            '"artist_similarity" column not in data. Set genres=True in get_playlist_features function.'
-        )
+    By default songs are picked one at a time, at random among the compatible ones. If a beam_width is given, the order is instead built with a
+    deterministic beam search that keeps the beam_width orders with the most genre transitions, looking depth songs ahead per song if a depth
+    is given.
+    """
+
+    # Ensure the artist_similarity variable is present, fetching genres on first use
+    donor_df = genres.ensure_genres(donor_df)
+
+    if beam_width:
+        return _beam_mix(donor_df, "genre", beam_width, depth)
 
     # Establish the recipient df that will be the playlist's new order
-    recipient_df = pd.DataFrame(columns=donor_df.columns)
+    recipient_df = donor_df.iloc[0:0].copy()
+
+    # Index the tempos of the playlist, to speed up filtering for compatible bpms
+    bpm_index = filters.BpmIndex(donor_df)
 
     # Begin by randomly selecting the first song
     song_1_index = selects.random_select_song(donor_df)
     donor_df, recipient_df = utils.move_song(
         donor_df, recipient_df, song_1_index, "random"
     )
+    bpm_index.remove(song_1_index)
 
     # Define the order in which to select songs
-    genre_mix.select_order = [
-        [selects.genre_select_song, "genre"],
-        [selects.basic_select_song, "basic"],
-        [selects.random_select_song, "random"],
-    ]
+    genre_mix.select_order = SELECT_ORDERS["genre"]
 
     # Fill the rest of the playlist
     while len(donor_df) != 0:
@@ -247,12 +469,13 @@ def genre_mix(donor_df):
             if select_type == "random":
                 next_song_index = select(donor_df)
             else:
-                next_song_index = select(donor_df, recipient_df)
-            if next_song_index:
+                next_song_index = select(donor_df, recipient_df, bpm_index)
+            if next_song_index is not None:
                 break
 
         donor_df, recipient_df = utils.move_song(
             donor_df, recipient_df, next_song_index, select_type
         )
+        bpm_index.remove(next_song_index)
 
     return recipient_df
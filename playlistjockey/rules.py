@@ -0,0 +1,155 @@
+# playlistjockey/rules.py
+
+"""Module containing composable rules that select compatible songs in a single pass.
+
+Rules combine with `&` (and), `|` (or) and `~` (not). A combined rule marks the matching songs of the donor_df with one boolean mask,
+computed from one mask per rule over the remaining songs, so no DataFrame subsets are built along the way. Songs matching several branches
+of an or are only counted once. For example, `(Artist() & Key() & (Bpm() | PlusMinus1("energy"))).select(donor_df, recipient_df)` picks a
+random song by a different artist, in a compatible key, with a compatible tempo or energy level.
+
+The module contains the following classes:
+
+- `Rule`: Base class of all rules.
+    - `mask(self, donor_df, recipient_df, bpm_index=None)`: Marks the songs in the donor_df that match the rule.
+    - `filter(self, donor_df, recipient_df, bpm_index=None)`: Filters the donor_df for songs that match the rule.
+    - `select(self, donor_df, recipient_df, bpm_index=None)`: Select a random song from the donor_df that matches the rule.
+- `Artist()`: Matches songs whose artists haven't been recently played.
+- `Key()`: Matches songs with a compatible key.
+- `Bpm()`: Matches songs within 10% difference in tempo, half and double time included.
+- `PlusMinus1(column)`: Matches songs within 1 value difference in a quantitative column.
+- `Equal(column)`: Matches songs with the same value in a column.
+- `All(*rules)`: Matches songs that match every one of the rules.
+- `Any(*rules)`: Matches songs that match at least one of the rules.
+- `Not(rule)`: Matches songs that don't match the rule.
+"""
+
+import random
+
+import numpy as np
+
+from playlistjockey import filters
+
+
+class Rule:
+    """Base class of all rules. Subclasses implement `mask`, comparing the songs in the donor_df against the last song in the recipient_df."""
+
+    def mask(self, donor_df, recipient_df, bpm_index=None):
+        """Marks the songs in the donor_df that match the rule, returning a boolean array."""
+        raise NotImplementedError
+
+    def filter(self, donor_df, recipient_df, bpm_index=None):
+        """Filters the donor_df for songs that match the rule."""
+        return donor_df[self.mask(donor_df, recipient_df, bpm_index)]
+
+    def select(self, donor_df, recipient_df, bpm_index=None):
+        """Select a random song from the donor_df that matches the rule, returning None if none do."""
+        labels = donor_df.index[self.mask(donor_df, recipient_df, bpm_index)]
+        try:
+            next_song_index = random.choice(list(labels))
+        except:
+            next_song_index = None
+        return next_song_index
+
+    def __and__(self, other):
+        return All(self, other)
+
+    def __or__(self, other):
+        return Any(self, other)
+
+    def __invert__(self):
+        return Not(self)
+
+
+class Artist(Rule):
+    """Matches songs whose artists haven't been recently played, so the same artists aren't played consecutively."""
+
+    def mask(self, donor_df, recipient_df, bpm_index=None):
+        return filters.artist_mask(donor_df, recipient_df)
+
+
+class Key(Rule):
+    """Matches songs with a key compatible with the last song's key."""
+
+    def mask(self, donor_df, recipient_df, bpm_index=None):
+        return filters.key_mask(donor_df, recipient_df)
+
+
+class Bpm(Rule):
+    """Matches songs within 10% difference in tempo from the last song, half and double time included."""
+
+    def mask(self, donor_df, recipient_df, bpm_index=None):
+        return filters.bpm_mask(donor_df, recipient_df, bpm_index)
+
+
+class PlusMinus1(Rule):
+    """Matches songs within 1 value difference from the last song in a quantitative column.
+
+    Args:
+        column (str): Column to compare, such as "energy" or "danceability".
+    """
+
+    def __init__(self, column):
+        self.column = column
+
+    def mask(self, donor_df, recipient_df, bpm_index=None):
+        return filters.plus_minus_1_mask(donor_df, recipient_df, self.column)
+
+
+class Equal(Rule):
+    """Matches songs with the same value as the last song in a column.
+
+    Args:
+        column (str): Column to compare, such as "artist_similarity".
+    """
+
+    def __init__(self, column):
+        self.column = column
+
+    def mask(self, donor_df, recipient_df, bpm_index=None):
+        return filters.equal_mask(donor_df, recipient_df, self.column)
+
+
+class All(Rule):
+    """Matches songs that match every one of the rules. Rules after the first are skipped once no songs are left."""
+
+    def __init__(self, *rules):
+        # Flatten nested ands, so a & b & c is evaluated as one pass
+        self.rules = []
+        for rule in rules:
+            self.rules += rule.rules if isinstance(rule, All) else [rule]
+
+    def mask(self, donor_df, recipient_df, bpm_index=None):
+        mask = np.ones(len(donor_df), dtype=bool)
+        for rule in self.rules:
+            mask &= rule.mask(donor_df, recipient_df, bpm_index)
+            if not mask.any():
+                break
+        return mask
+
+
+class Any(Rule):
+    """Matches songs that match at least one of the rules. Songs matching several rules are only counted once."""
+
+    def __init__(self, *rules):
+        # Flatten nested ors, so a | b | c is evaluated as one pass
+        self.rules = []
+        for rule in rules:
+            self.rules += rule.rules if isinstance(rule, Any) else [rule]
+
+    def mask(self, donor_df, recipient_df, bpm_index=None):
+        mask = np.zeros(len(donor_df), dtype=bool)
+        for rule in self.rules:
+            mask |= rule.mask(donor_df, recipient_df, bpm_index)
+            if mask.all():
+                break
+        return mask
+
+
+class Not(Rule):
+    """Matches songs that don't match the rule."""
+
+    def __init__(self, rule):
+        self.rule = rule
+
+    def mask(self, donor_df, recipient_df, bpm_index=None):
+        return ~self.rule.mask(donor_df, recipient_df, bpm_index)
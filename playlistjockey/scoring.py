@@ -0,0 +1,244 @@
+# playlistjockey/scoring.py
+
+"""Module containing functions that score the transitions between consecutive songs of a playlist.
+
+The module contains the following classes and functions:
+
+- `score_playlist(playlist_df, order=None)`: Checks the compatibility of every transition in a playlist order.
+- `mix_performance(scores_df, mix)`: Counts how many transitions of a scored order meet the best select of a mix, and how many are random.
+- `TransitionGrader(playlist_df, mix)`: Grades the transitions between songs of a playlist against a mix's best select.
+    - `grades(self, sources, targets)`: Grade the transition from each song at positions sources to each song at positions targets.
+    - `consecutive(self, order)`: Grade the transitions between consecutive songs of an order of positions.
+- `transition_grades(playlist_df, mix)`: Grades the transition between every pair of songs in a playlist.
+"""
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from playlistjockey import filters, utils
+
+# Transition checks a transition must pass to meet the best select of each mix
+BEST_TRANSITIONS = {
+    "dj": ["artist", "key", "bpm", "energy"],
+    "party": ["artist", "key", "bpm", "energy_or_danceability"],
+    "setlist": ["artist", "energy", "popularity"],
+    "genre": ["artist", "key", "bpm", "genre"],
+}
+
+# Transition checks of the basic select: a transition that passes none of them could only have been picked at random
+BASIC_TRANSITIONS = ["key", "bpm", "energy", "danceability"]
+
+
+def _plus_minus_1(values, positions):
+    """Helper function to check which consecutive values are within 1 of each other."""
+    values = values.to_numpy(dtype=float)[positions]
+    return np.abs(values[1:] - values[:-1]) <= 1
+
+
+def score_playlist(playlist_df, order=None):
+    """Checks the compatibility of every transition in a playlist order, for all transitions at once.
+
+    Args:
+        playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
+        order (list): Index labels of the songs in playlist_df, in the order to score. Defaults to the order of playlist_df.
+
+    Returns:
+        scores_df (pd.DataFrame): DataFrame with one row per transition, indexed by the label of the song transitioned to. Holds boolean
+            "artist" (no shared artists), "key", "bpm", "energy", "danceability" and "energy_or_danceability" columns, "popularity" and "genre"
+            columns if the playlist has popularity and artist similarity features, and a "score" column counting the passed checks.
+    """
+    if order is None:
+        order = playlist_df.index
+    positions = playlist_df.index.get_indexer(order)
+    if (positions < 0).any():
+        raise KeyError("order contains songs that are not in playlist_df.")
+
+    # Compatible keys, looked up from the key compatibility matrix
+    codes = utils.camelot_codes(playlist_df["key"])[positions]
+    known = codes >= 0
+    key = utils.KEY_COMPATIBILITY[codes[:-1], codes[1:]] & known[:-1] & known[1:]
+
+    # Tempos within 10% at normal, double or half time
+    bpms = playlist_df["bpm"].to_numpy(dtype=float)[positions]
+    prev_bpm, next_bpm = bpms[:-1], bpms[1:]
+    bpm = np.zeros(max(len(positions) - 1, 0), dtype=bool)
+    for low, high in filters.BPM_WINDOWS:
+        bpm |= (next_bpm >= prev_bpm * low) & (next_bpm <= prev_bpm * high)
+
+    # Consecutive songs without any shared artists
+    artists = playlist_df["artists"].to_numpy()[positions]
+    artist = np.array(
+        [not set(a).intersection(b) for a, b in zip(artists[:-1], artists[1:])],
+        dtype=bool,
+    )
+
+    scores = {
+        "artist": artist,
+        "key": key,
+        "bpm": bpm,
+        "energy": _plus_minus_1(playlist_df["energy"], positions),
+        "danceability": _plus_minus_1(playlist_df["danceability"], positions),
+    }
+    scores["energy_or_danceability"] = scores["energy"] | scores["danceability"]
+    if "popularity" in playlist_df:
+        scores["popularity"] = _plus_minus_1(playlist_df["popularity"], positions)
+    if "artist_similarity" in playlist_df:
+        scores["genre"] = _plus_minus_1(playlist_df["artist_similarity"], positions)
+
+    scores_df = pd.DataFrame(scores, index=playlist_df.index[positions[1:]])
+    scores_df["score"] = scores_df.drop(columns="energy_or_danceability").sum(axis=1)
+
+    return scores_df
+
+
+def mix_performance(scores_df, mix):
+    """Counts how many transitions of a scored order meet the best select of a mix, and how many only a random select could have made.
+
+    Args:
+        scores_df (pd.DataFrame): Transition scores returned by score_playlist.
+        mix (str): String identifying the mixing algorithm the order was made with. Options so far include "dj", "party", "setlist", and "genre".
+
+    Returns:
+        performance (dict): Dict with the "n_best" and "n_random" transition counts, and their "diff".
+    """
+    n_best = int(scores_df[BEST_TRANSITIONS[mix]].all(axis=1).sum())
+    n_random = int((~scores_df[BASIC_TRANSITIONS].any(axis=1)).sum())
+
+    return {"n_best": n_best, "n_random": n_random, "diff": n_best - n_random}
+
+
+# Feature columns compared by the transition checks that test whether two values are within 1 of each other
+PLUS_MINUS_1_COLUMNS = {
+    "energy": "energy",
+    "danceability": "danceability",
+    "popularity": "popularity",
+    "genre": "artist_similarity",
+}
+
+
+class TransitionGrader:
+    """Grades the transitions between songs of a playlist against a mix's best select. The song features are prepared once, so the grades of
+    just the transitions needed can be computed, without the n x n matrices of every pair.
+
+    Args:
+        playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
+        mix (str): String identifying which mixing algorithm's best select to grade against. Options so far include "dj", "party", "setlist",
+            and "genre".
+    """
+
+    def __init__(self, playlist_df, mix):
+        self.mix = mix
+        self._codes = utils.camelot_codes(playlist_df["key"])
+        self._bpms = playlist_df["bpm"].to_numpy(dtype=float)
+
+        self._values = {
+            check: playlist_df[column].to_numpy(dtype=float)
+            for check, column in PLUS_MINUS_1_COLUMNS.items()
+            if column in playlist_df
+        }
+
+        # Songs share an artist if their rows in the song x artist incidence matrix overlap
+        names = {}
+        rows, cols = [], []
+        for row, song_artists in enumerate(playlist_df["artists"]):
+            for artist in song_artists:
+                rows.append(row)
+                cols.append(names.setdefault(artist, len(names)))
+        self._incidence = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int32), (rows, cols)),
+            shape=(len(playlist_df), max(len(names), 1)),
+        )
+
+    def _check(self, check, sources, targets):
+        """Helper function to run a transition check on the transitions from the songs at positions sources to the songs at positions targets.
+        Positions shaped as a column and a row check every pair, positions of equal length check each transition.
+        """
+        if check == "artist":
+            if sources.ndim == 2:
+                shared = (
+                    self._incidence[sources[:, 0]] @ self._incidence[targets[0]].T
+                ).toarray()
+            else:
+                overlap = self._incidence[sources].multiply(self._incidence[targets])
+                shared = np.asarray(overlap.sum(axis=1)).ravel()
+            return shared == 0
+
+        if check == "key":
+            source_codes, target_codes = self._codes[sources], self._codes[targets]
+            return (
+                utils.KEY_COMPATIBILITY[source_codes, target_codes]
+                & (source_codes >= 0)
+                & (target_codes >= 0)
+            )
+
+        if check == "bpm":
+            source_bpm, target_bpm = self._bpms[sources], self._bpms[targets]
+            compatible = np.zeros(np.broadcast(sources, targets).shape, dtype=bool)
+            for low, high in filters.BPM_WINDOWS:
+                compatible |= (target_bpm >= source_bpm * low) & (
+                    target_bpm <= source_bpm * high
+                )
+            return compatible
+
+        if check == "energy_or_danceability":
+            return self._check("energy", sources, targets) | self._check(
+                "danceability", sources, targets
+            )
+
+        values = self._values[check]
+        return np.abs(values[targets] - values[sources]) <= 1
+
+    def _grade(self, sources, targets):
+        """Helper function to grade transitions: 2 if they meet the mix's best select, 1 if they have at least one compatible feature, and 0 if
+        only a random select could make them. A song's transition to itself is graded 0.
+        """
+        checks = {}
+        for check in BEST_TRANSITIONS[self.mix] + BASIC_TRANSITIONS:
+            if check not in checks:
+                checks[check] = self._check(check, sources, targets)
+
+        best = np.logical_and.reduce([checks[i] for i in BEST_TRANSITIONS[self.mix]])
+        basic = np.logical_or.reduce([checks[i] for i in BASIC_TRANSITIONS])
+
+        grades = basic.astype(np.int8) + (best & basic).astype(np.int8)
+        grades[sources == targets] = 0
+
+        return grades
+
+    def grades(self, sources, targets):
+        """Grade the transition from each song at positions sources to each song at positions targets.
+
+        Returns:
+            grades (np.ndarray): len(sources) x len(targets) int8 matrix of grades.
+        """
+        sources = np.asarray(sources, dtype=int)
+        targets = np.asarray(targets, dtype=int)
+        return self._grade(sources[:, None], targets[None, :])
+
+    def consecutive(self, order):
+        """Grade the transitions between consecutive songs of an order of positions.
+
+        Returns:
+            grades (np.ndarray): int8 array with the grade of each of the len(order) - 1 transitions.
+        """
+        order = np.asarray(order, dtype=int)
+        return self._grade(order[:-1], order[1:])
+
+
+def transition_grades(playlist_df, mix):
+    """Grades the transition between every pair of songs in a playlist, for all pairs at once. Use a TransitionGrader to grade only some of
+    them.
+
+    Args:
+        playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
+        mix (str): String identifying which mixing algorithm's best select to grade against. Options so far include "dj", "party", "setlist",
+            and "genre".
+
+    Returns:
+        grades (np.ndarray): n x n int8 matrix grading the transition from the song in each row to the song in each column, in playlist_df's
+            order: 2 if it meets the mix's best select, 1 if it has at least one compatible feature, and 0 if only a random select could make
+            it. A song's transition to itself is graded 0.
+    """
+    positions = np.arange(len(playlist_df))
+    return TransitionGrader(playlist_df, mix).grades(positions, positions)
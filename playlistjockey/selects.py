@@ -1,21 +1,36 @@
 # playlistjockey/select.py
 
-"""Module containing functions that utilize filters.py to select compatible songs.
+"""Module containing functions that utilize the rules in rules.py to select compatible songs.
 
 The module contains the following classes and functions:
 
 - `random_select_song(donor_df)`: Select a random song from the donor_df.
-- `dj_select_song(donor_df, recipient_df)`: Select a compatible DJ song from the donor_df using the last song from the recipient_df.
-- `basic_select_song(donor_df, recipient_df)`: Select a song from the donor_df using the last song from the recipient_df that has at least one compatible feature.
-- `party_select_song(donor_df, recipient_df)`: Select a song from the donor_df using the last song from the recipient_df that has the maximum energy and/or danceability.
-- `setlist_select_song(donor_df, recipient_df)`: Select a song from the donor_df using the last song from the recipient_df that has the minimum energy and/or popularity.
-- `genre_select_song(donor_df, recipient_df)`: Select a song from the donor_df using the last song from the recipient_df that is from a similar genre.
+- `dj_select_song(donor_df, recipient_df, bpm_index=None)`: Select a compatible DJ song from the donor_df using the last song from the recipient_df.
+- `basic_select_song(donor_df, recipient_df, bpm_index=None)`: Select a song from the donor_df using the last song from the recipient_df that has at least one compatible feature.
+- `party_select_song(donor_df, recipient_df, bpm_index=None)`: Select a song from the donor_df using the last song from the recipient_df that has the maximum energy and/or danceability.
+- `setlist_select_song(donor_df, recipient_df, bpm_index=None)`: Select a song from the donor_df using the last song from the recipient_df that has the minimum energy and/or popularity.
+- `genre_select_song(donor_df, recipient_df, bpm_index=None)`: Select a song from the donor_df using the last song from the recipient_df that is from a similar genre.
+
+The bpm_index of each select is an optional filters.BpmIndex of the playlist being mixed, used to speed up tempo filtering.
 """
 
 import pandas as pd
 import random
 
-from playlistjockey import filters, utils
+from playlistjockey import utils
+from playlistjockey.rules import Artist, Bpm, Equal, Key, PlusMinus1
+
+# Rules each select uses to find compatible songs
+DJ_RULE = Artist() & Key() & Bpm() & PlusMinus1("energy")
+BASIC_RULE = Artist() & (
+    Key() | Bpm() | PlusMinus1("energy") | PlusMinus1("danceability")
+)
+PARTY_RULE = (
+    Artist() & Key() & Bpm() & (PlusMinus1("energy") | PlusMinus1("danceability"))
+)
+SETLIST_RULE = Artist() & PlusMinus1("energy") & PlusMinus1("popularity")
+GENRE_RULE = Artist() & Key() & Bpm() & Equal("artist_similarity")
+GENRE_FALLBACK_RULE = Artist() & Key() & Bpm() & PlusMinus1("artist_similarity")
 
 
 def random_select_song(donor_df):
@@ -27,6 +42,25 @@ def random_select_song(donor_df):
     return next_song_index
 
 
+def _top_song(donor_df, columns, lowest=False):
+    """Helper function to find the first song with the highest (or lowest) values in the given columns, compared in order. This picks the same
+    song as sorting donor_df by the columns and taking its first row, without sorting every candidate.
+    """
+    for column in columns:
+        values = donor_df[column]
+        best = values.min() if lowest else values.max()
+        if pd.isna(best):
+            continue
+        donor_df = donor_df[values == best]
+
+    try:
+        next_song_index = donor_df.index[0]
+    except:
+        next_song_index = None
+
+    return next_song_index
+
+
 def select_specific_song(donor_df, title):
     """Select a specific song by its title."""
     # Establish output
@@ -42,91 +76,49 @@ def select_specific_song(donor_df, title):
     return out
 
 
-def dj_select_song(donor_df, recipient_df):
+def dj_select_song(donor_df, recipient_df, bpm_index=None):
     """Select a compatible DJ song from the donor_df using the last song from the recipient_df."""
-    # Filter for songs with differeing artists, and compatible keys and bpms
-    donor_df = filters.artist_filter(donor_df, recipient_df)
-    donor_df = filters.key_filter(donor_df, recipient_df)
-    donor_df = filters.bpm_filter(donor_df, recipient_df)
-    donor_df = filters.plus_minus_1_filter(donor_df, recipient_df, "energy")
-
-    # Select a random compatible song as the next song
-    next_song_index = random_select_song(donor_df)
+    # Select a random song with a differing artist, and compatible key, bpm and energy as the next song
+    next_song_index = DJ_RULE.select(donor_df, recipient_df, bpm_index)
 
     return next_song_index
 
 
-def basic_select_song(donor_df, recipient_df):
+def basic_select_song(donor_df, recipient_df, bpm_index=None):
     """Select a song from the donor_df using the last song from the recipient_df that has at least one compatible feature."""
-    # Filter for differing artists
-    donor_df = filters.artist_filter(donor_df, recipient_df)
-
-    # In different dfs, filter for compatible keys, bpms, energy, danceability, and artist similarity
-    key_df = filters.key_filter(donor_df, recipient_df)
-    bpm_df = filters.bpm_filter(donor_df, recipient_df)
-    energy_df = filters.plus_minus_1_filter(donor_df, recipient_df, "energy")
-    dance_df = filters.plus_minus_1_filter(donor_df, recipient_df, "danceability")
-
-    # Combine the compatible dfs, and randomly select the next song
-    donor_df = pd.concat([key_df, bpm_df, energy_df, dance_df])
-    next_song_index = random_select_song(donor_df)
+    # Select a random song with a differing artist, and a compatible key, bpm, energy or danceability
+    next_song_index = BASIC_RULE.select(donor_df, recipient_df, bpm_index)
 
     return next_song_index
 
 
-def party_select_song(donor_df, recipient_df):
+def party_select_song(donor_df, recipient_df, bpm_index=None):
     """Select a song from the donor_df using the last song from the recipient_df that has the maximum energy and/or danceability."""
-    # Filter for songs with differeing artists, and compatible keys and bpms
-    donor_df = filters.artist_filter(donor_df, recipient_df)
-    donor_df = filters.key_filter(donor_df, recipient_df)
-    donor_df = filters.bpm_filter(donor_df, recipient_df)
-
-    # In different dfs, filter for compatible energy, dance, and similarity values
-    energy_df = filters.plus_minus_1_filter(donor_df, recipient_df, "energy")
-    dance_df = filters.plus_minus_1_filter(donor_df, recipient_df, "danceability")
-
-    # Combine the compatible song dfs, and select the song with the highest energy and danceability
-    donor_df = pd.concat([energy_df, dance_df])
-    donor_df.sort_values(by=["energy", "danceability"], ascending=False, inplace=True)
-    try:
-        next_song_index = donor_df.head(1).index[0]
-    except:
-        next_song_index = None
+    # Filter for songs with differeing artists, compatible keys and bpms, and compatible energy or danceability
+    donor_df = PARTY_RULE.filter(donor_df, recipient_df, bpm_index)
+
+    # Select the song with the highest energy and danceability
+    next_song_index = _top_song(donor_df, ["energy", "danceability"])
 
     return next_song_index
 
 
-def setlist_select_song(donor_df, recipient_df):
+def setlist_select_song(donor_df, recipient_df, bpm_index=None):
     """Select a song from the donor_df using the last song from the recipient_df that has the minimum energy and/or popularity."""
-    # Filter for songs with compatible energy and popularity
-    donor_df = filters.artist_filter(donor_df, recipient_df)
-    donor_df = filters.plus_minus_1_filter(donor_df, recipient_df, "energy")
-    donor_df = filters.plus_minus_1_filter(donor_df, recipient_df, "popularity")
+    # Filter for songs with differing artists, and compatible energy and popularity
+    donor_df = SETLIST_RULE.filter(donor_df, recipient_df, bpm_index)
 
     # Select the song wiht the lowest energy and popularity
-    donor_df.sort_values(by=["energy", "danceability"], inplace=True)
-    try:
-        next_song_index = donor_df.head(1).index[0]
-    except:
-        next_song_index = None
+    next_song_index = _top_song(donor_df, ["energy", "danceability"], lowest=True)
 
     return next_song_index
 
 
-def genre_select_song(donor_df, recipient_df):
+def genre_select_song(donor_df, recipient_df, bpm_index=None):
     """Select a song from the donor_df using the last song from the recipient_df that is from a similar genre."""
-    # Filter for songs with differeing artists, and compatible keys and bpms
-    donor_df = filters.artist_filter(donor_df, recipient_df)
-    donor_df = filters.key_filter(donor_df, recipient_df)
-    donor_df = filters.bpm_filter(donor_df, recipient_df)
-
-    try:
-        donor_df = filters.equal_filter(donor_df, recipient_df, "artist_similarity")
-        next_song_index = random_select_song(donor_df)
-    except:
-        donor_df = filters.plus_minus_1_filter(
-            donor_df, recipient_df, "artist_similarity"
-        )
-        next_song_index = random_select_song(donor_df)
+    # Prefer songs with the same artist similarity, falling back to songs within one value of it
+    next_song_index = GENRE_RULE.select(donor_df, recipient_df, bpm_index)
+    if next_song_index is None:
+        next_song_index = GENRE_FALLBACK_RULE.select(donor_df, recipient_df, bpm_index)
 
     return next_song_index
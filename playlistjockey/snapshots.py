@@ -0,0 +1,76 @@
+# playlistjockey/snapshots.py
+
+"""Module containing the store used to skip re-loading playlists that haven't changed.
+
+For each playlist the store remembers its last snapshot (Spotify's `snapshot_id`, or Tidal's last updated time), its song IDs, and the
+features of each song along with when they were fetched.
+
+The module contains the following classes:
+
+- `SnapshotStore(directory=None)`: Stores the last loaded state of each playlist, by default in the user's cache directory.
+    - `load(self, provider, playlist_id)`: Read the last loaded state of a playlist.
+    - `save(self, provider, playlist_id, snapshot_id, song_ids, features, fetched_at)`: Write the loaded state of a playlist.
+"""
+
+import json
+import os
+import re
+import tempfile
+
+from playlistjockey import utils
+
+
+class SnapshotStore:
+    """Stores the last loaded state of each playlist, by default in the user's cache directory.
+
+    Args:
+        directory (str): Directory the playlist states are written to.
+    """
+
+    def __init__(self, directory=None):
+        if directory is None:
+            directory = utils.cache_dir("snapshots")
+        self.directory = directory
+
+    def _path(self, provider, playlist_id):
+        """Helper function to locate the file of a given playlist."""
+        name = re.sub(r"[^A-Za-z0-9_-]", "_", "{}-{}".format(provider, playlist_id))
+        return os.path.join(self.directory, name + ".json")
+
+    def load(self, provider, playlist_id):
+        """Read the last loaded state of a playlist.
+
+        Returns:
+            state (dict): Dict containing the "snapshot_id", the "song_ids" in playlist order, and the "features" and "fetched_at" time of each
+                song keyed by song ID. None if the playlist hasn't been loaded before.
+        """
+        path = self._path(provider, playlist_id)
+        if not os.path.exists(path):
+            return None
+
+        with open(path) as state_file:
+            state = json.load(state_file)
+
+        # Song IDs are stored in lists, as Tidal's integer IDs can't be JSON keys
+        return {
+            "snapshot_id": state["snapshot_id"],
+            "song_ids": state["song_ids"],
+            "features": {i["id"]: i["features"] for i in state["songs"]},
+            "fetched_at": {i["id"]: i["fetched_at"] for i in state["songs"]},
+        }
+
+    def save(self, provider, playlist_id, snapshot_id, song_ids, features, fetched_at):
+        """Write the loaded state of a playlist, replacing the previous state atomically."""
+        state = {
+            "snapshot_id": snapshot_id,
+            "song_ids": song_ids,
+            "songs": [
+                {"id": i, "features": features[i], "fetched_at": fetched_at[i]}
+                for i in features
+            ],
+        }
+
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as state_file:
+            json.dump(state, state_file)
+        os.replace(temp_path, self._path(provider, playlist_id))
@@ -7,8 +7,8 @@ import os
 import spotipy
 
 
-def connect_spotify(client_id, client_secret, redirect_uri):
-    """Connects to Spotify's API using Spotipy."""
+def connect_spotify(client_id, client_secret, redirect_uri, transport=None):
+    """Connects to Spotify's API using Spotipy, sending requests through the given playlistjockey.transport.Transport when supplied."""
     os.environ["SPOTIPY_CLIENT_ID"] = client_id
     os.environ["SPOTIPY_CLIENT_SECRET"] = client_secret
     os.environ["SPOTIPY_REDIRECT_URI"] = redirect_uri
@@ -18,7 +18,19 @@ def connect_spotify(client_id, client_secret, redirect_uri):
               playlist-read-private,\
               playlist-read-collaborative"
 
-    auth_manager = spotipy.oauth2.SpotifyOAuth(scope=scopes)
-    sp = spotipy.Spotify(auth_manager=auth_manager)
+    if transport is None:
+        auth_manager = spotipy.oauth2.SpotifyOAuth(scope=scopes)
+        sp = spotipy.Spotify(auth_manager=auth_manager)
+    else:
+        auth_manager = spotipy.oauth2.SpotifyOAuth(
+            scope=scopes,
+            requests_session=transport.session,
+            requests_timeout=transport.timeout,
+        )
+        sp = spotipy.Spotify(
+            auth_manager=auth_manager,
+            requests_session=transport.session,
+            requests_timeout=transport.timeout,
+        )
 
     return sp
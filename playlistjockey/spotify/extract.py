@@ -1,49 +1,141 @@
 # playlistjockey/spotify/extract.py
 
-"""Function responsible for extracting required features from tracks."""
+"""Functions responsible for extracting playlist tracks and their required features."""
+
+import contextvars
+import re
+from concurrent.futures import ThreadPoolExecutor
 
-import pandas as pd
 from playlistjockey import utils
 
+# Only request the fields used when listing a playlist's tracks
+PLAYLIST_ITEM_FIELDS = "total,items(track(id))"
+PAGE_SIZE = 100
+
+
+def get_playlist_id(playlist_id):
+    """Strips a Spotify playlist ID out of a shared link or URI."""
+    playlist_id = playlist_id.split("?")[0].rstrip("/")
+    return re.split("[/:]", playlist_id)[-1]
+
+
+def get_playlist_track_ids(sp, playlist_id, max_workers=8):
+    """Collects the IDs of all tracks in a playlist, fetching the remaining pages concurrently once the first page reveals the total."""
+    # Get the first page, which also reveals how many tracks there are
+    first_page = sp.playlist_items(
+        playlist_id, fields=PLAYLIST_ITEM_FIELDS, limit=PAGE_SIZE
+    )
+    pages = [first_page]
+
+    # Fetch the remaining pages with a bounded pool, keeping them in playlist order
+    offsets = range(PAGE_SIZE, first_page["total"], PAGE_SIZE)
+    if len(offsets) > 0:
+        # Each page runs in a copy of the caller's context, so tracing spans stay attributed to the playlist
+        contexts = [contextvars.copy_context() for i in offsets]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pages.extend(
+                executor.map(
+                    lambda context, offset: context.run(
+                        sp.playlist_items,
+                        playlist_id,
+                        fields=PLAYLIST_ITEM_FIELDS,
+                        limit=PAGE_SIZE,
+                        offset=offset,
+                    ),
+                    contexts,
+                    offsets,
+                )
+            )
+
+    song_ids = []
+    for page in pages:
+        utils.show_tracks(page, song_ids)
+
+    return song_ids
+
+
+def get_popularity(sp, song_ids):
+    """Fetches the current popularity of the given songs, 50 songs per request."""
+    popularity = {}
+    for i in range(0, len(song_ids), 50):
+        for track in sp.tracks(song_ids[i : i + 50])["tracks"]:
+            if track is not None:
+                popularity[track["id"]] = round(track["popularity"] / 10)
+
+    return popularity
+
+
+# Genres of each artist and its related artists, keyed by Spotify artist ID, shared by all playlists loaded in this process
+_artist_genres = {}
 
-def get_track_features(sp, song_id, genres=False):
-    """Acquires all necessary song features for the mixing algorithms to consider."""
-    # Get basic and audio objects for the given track
-    basic_info = sp.track(song_id)
-    audio_info = sp.audio_features(song_id)
 
-    # Iterate and capture artists and their genres
+def remember_artist_genres(artist_id, artist_info, related_artists):
+    """Combines the genres of an artist object and its related artist objects, remembering them for later lookups of the artist."""
+    genres = set(artist_info["genres"])
+    for i in related_artists:
+        genres.update(i["genres"])
+
+    return _artist_genres.setdefault(artist_id, sorted(genres))
+
+
+def get_artist_genres(sp, artist_id):
+    """Collects the genres of an artist and its related artists, remembering them so each artist is only requested once."""
+    genres = _artist_genres.get(artist_id)
+    if genres is None:
+        genres = remember_artist_genres(
+            artist_id,
+            sp.artist(artist_id),
+            sp.artist_related_artists(artist_id)["artists"],
+        )
+
+    return genres
+
+
+def get_track_genres(sp, song_id, basic_info=None):
+    """Collects the genres of a Spotify track's artists and their related artists. basic_info is the track object, if already fetched."""
+    if basic_info is None:
+        basic_info = sp.track(song_id)
+
+    genres = []
+    for i in basic_info["artists"]:
+        genres += get_artist_genres(sp, i["id"])
+
+    return list(set(genres))  # remove duplicates
+
+
+def track_features_from(basic_info, audio_info):
+    """Packages a Spotify track object and its audio features object into the song features the mixing algorithms consider."""
+    # Iterate and capture artists
     artists = []
     for i in basic_info["artists"]:
         artists.append(i["name"])
 
     # Convert Spotify's key information to camelot
-    camelot = utils.spotify_key_to_camelot(audio_info[0]["key"], audio_info[0]["mode"])
+    camelot = utils.spotify_key_to_camelot(audio_info["key"], audio_info["mode"])
 
     # Package all features into a dict
-    song_features = {
+    return {
         "track_id": basic_info["id"],
         "title": basic_info["name"],
         "artists": artists,
+        "isrc": basic_info.get("external_ids", {}).get("isrc"),
         "duration_s": round(basic_info["duration_ms"] / 1000, 1),
         "key": camelot,
-        "bpm": round(audio_info[0]["tempo"]),
-        "energy": round(audio_info[0]["energy"] * 10),
-        "danceability": round(audio_info[0]["danceability"] * 10),
+        "bpm": round(audio_info["tempo"]),
+        "energy": round(audio_info["energy"] * 10),
+        "danceability": round(audio_info["danceability"] * 10),
         "popularity": round(basic_info["popularity"] / 10),
     }
 
+
+def get_track_features(sp, song_id, genres=False):
+    """Acquires all necessary song features for the mixing algorithms to consider."""
+    # Get basic and audio objects for the given track
+    basic_info = sp.track(song_id)
+    audio_info = sp.audio_features(song_id)
+    song_features = track_features_from(basic_info, audio_info[0])
+
     if genres:
-        # Collect the genres the track's artists, and their related artists
-        genres = []
-        for i in basic_info["artists"]:
-            genres.append(sp.artist(i["id"])["genres"])
-            for j in sp.artist_related_artists(i["id"])["artists"]:
-                genres.append(j["genres"])
-        genres = [i for sublist in genres for i in sublist]  # flatten genres
-        genres = list(set(genres))  # remove duplicates
-
-        # Attach to dict
-        song_features.update({"genres": genres})
+        song_features.update({"genres": get_track_genres(sp, song_id, basic_info)})
 
     return song_features
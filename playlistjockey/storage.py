@@ -0,0 +1,96 @@
+# playlistjockey/storage.py
+
+"""Module containing functions used to save and load playlist DataFrames in a columnar format.
+
+Playlists are written either as Arrow IPC files (`.arrow`, `.feather`) or as Parquet files (`.parquet`, `.pq`). List columns such as `artists` and
+`genres` are stored natively as Arrow list columns. Arrow IPC files are written uncompressed, so loading them memory-maps the file: the
+numeric feature columns of large libraries are read without copying, and their pages are shared between processes reading the same file.
+String and list columns are still converted to Python objects on load, as the filters and mixes work with plain strings and lists.
+
+The module contains the following functions:
+
+- `save_playlist(playlist_df, path)`: Save a playlist DataFrame, such as the output of `get_playlist_features` or `sort_playlist`, to disk.
+- `load_playlist(path, memory_map=True)`: Load a playlist DataFrame previously saved with `save_playlist`.
+"""
+
+import os
+
+LIST_COLUMNS = ["artists", "genres"]
+PARQUET_EXTENSIONS = (".parquet", ".pq")
+
+
+def _import_pyarrow():
+    """Helper function to import pyarrow, which is only required for saving and loading playlists."""
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(
+            'Saving and loading playlists requires pyarrow. Install it with "pip install playlistjockey[storage]".'
+        )
+
+    return pyarrow
+
+
+def _is_parquet(path):
+    """Helper function to determine the file format from the path's extension."""
+    return os.fspath(path).lower().endswith(PARQUET_EXTENSIONS)
+
+
+def save_playlist(playlist_df, path):
+    """Save a playlist DataFrame, such as the output of `get_playlist_features` or `sort_playlist`, to disk.
+
+    Args:
+        playlist_df (pd.DataFrame): DataFrame containing songs with required columns.
+        path (str): Location of the file to write. Paths ending in ".parquet" or ".pq" are written as Parquet, anything else as an Arrow IPC file.
+    """
+    pa = _import_pyarrow()
+
+    # Convert to an Arrow table, keeping the index so sorted orders survive the round trip
+    table = pa.Table.from_pandas(playlist_df, preserve_index=True)
+
+    if _is_parquet(path):
+        pa.parquet.write_table(table, path)
+    else:
+        # Leave the IPC file uncompressed so it can be memory-mapped when loading
+        with pa.OSFile(os.fspath(path), "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+
+
+def load_playlist(path, memory_map=True):
+    """Load a playlist DataFrame previously saved with `save_playlist`.
+
+    Args:
+        path (str): Location of the file to read.
+        memory_map (bool): Memory-map the file instead of reading it into memory. Numeric columns of Arrow IPC files are then backed directly by the
+            mapped file, which stays mapped until they are released. String and list columns are always copied into Python objects.
+
+    Returns:
+        playlist_df (pd.DataFrame): DataFrame of all tracks and their features, in the order they were saved.
+    """
+    pa = _import_pyarrow()
+
+    if _is_parquet(path):
+        table = pa.parquet.read_table(path, memory_map=memory_map)
+    else:
+        if memory_map:
+            source = pa.memory_map(os.fspath(path), "r")
+        else:
+            source = pa.OSFile(os.fspath(path), "r")
+        # Buffers read from a memory map keep the mapping alive after the file is closed
+        with source:
+            table = pa.ipc.open_file(source).read_all()
+
+    # Split blocks so numeric columns can reference the Arrow buffers without being consolidated
+    playlist_df = table.to_pandas(split_blocks=True)
+
+    # Arrow list columns come back as arrays, convert them back to the lists the filters expect
+    for column in LIST_COLUMNS:
+        if column in playlist_df:
+            playlist_df[column] = [
+                list(i) if i is not None else i for i in playlist_df[column]
+            ]
+
+    return playlist_df
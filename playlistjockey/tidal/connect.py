@@ -1,49 +1,344 @@
 # playlistjockey/tidal/connect.py
 
-"""Function responsible for connecting to Tidal's API. Creates config.ini file to store Tidal tokens."""
+"""Functions and classes responsible for connecting to Tidal's API and storing Tidal tokens.
+
+Tokens are read from a token store, which is either a `FileTokenStore` in the user's config directory, an `EnvTokenStore`, or any object
+supplied by the caller that implements `load()` and `save(tokens)`. Tokens are cached in-process, refreshed before they expire, and file
+stores are locked while they are refreshed, so many workers can start Tidal sessions concurrently without prompting to log in.
+"""
 
 import configparser
-import pkg_resources
+import contextlib
+import datetime
+import os
+import tempfile
+import threading
+import time
 
+import requests
 import tidalapi
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+    import msvcrt
+
+
+# Refresh access tokens this many seconds before they expire
+REFRESH_MARGIN_S = 300
+
+# Attempts made when Tidal throttles a login or refresh, waiting between attempts
+THROTTLED_ATTEMPTS = 3
+
+# Errors raised when Tidal rejects stored or refreshed tokens. tidalapi re-raises HTTP errors, such as a 401 for an expired or revoked
+# access token, as requests.HTTPError
+REJECTED_TOKEN_ERRORS = (
+    tidalapi.exceptions.AuthenticationError,
+    requests.HTTPError,
+    KeyError,
+    ValueError,
+)
+
+# Environment variables read by EnvTokenStore
+ENV_ACCESS_TOKEN = "PLAYLISTJOCKEY_TIDAL_ACCESS_TOKEN"
+ENV_REFRESH_TOKEN = "PLAYLISTJOCKEY_TIDAL_REFRESH_TOKEN"
+ENV_EXPIRY_TIME = "PLAYLISTJOCKEY_TIDAL_EXPIRY_TIME"
+
+# Location of the config file used by earlier versions, read when no token file exists yet
+LEGACY_CONFIG_PATH = os.path.join(os.path.dirname(__file__), "config.ini")
+
+# Tokens and sessions already loaded by this process
+_token_cache = {}
+_session_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _config_dir():
+    """Helper function to locate the user's playlistjockey config directory."""
+    if os.environ.get("PLAYLISTJOCKEY_CONFIG_DIR"):
+        return os.environ["PLAYLISTJOCKEY_CONFIG_DIR"]
+    if os.name == "nt" and os.environ.get("APPDATA"):
+        return os.path.join(os.environ["APPDATA"], "playlistjockey")
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(
+        os.path.expanduser("~"), ".config"
+    )
+    return os.path.join(base, "playlistjockey")
+
+
+@contextlib.contextmanager
+def _file_lock(path):
+    """Helper context manager holding an exclusive lock on a lock file next to the given path."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".lock", "a+") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _parse_expiry(value):
+    """Helper function to read an expiry time stored as an ISO string."""
+    if not value:
+        return None
+    expiry_time = datetime.datetime.fromisoformat(value)
+
+    # tidalapi works with naive UTC times
+    if expiry_time.tzinfo is not None:
+        expiry_time = expiry_time.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return expiry_time
+
+
+def _format_expiry(value):
+    """Helper function to store an expiry time as an ISO string."""
+    if value is None:
+        return ""
+    return value.isoformat()
+
+
+class FileTokenStore:
+    """Token store that keeps Tidal tokens in an ini file, by default in the user's config directory.
+
+    Args:
+        path (str): Location of the ini file. Defaults to "tidal.ini" in the playlistjockey config directory, which can be overridden with the
+            PLAYLISTJOCKEY_CONFIG_DIR environment variable.
+    """
+
+    def __init__(self, path=None):
+        self.legacy_path = LEGACY_CONFIG_PATH if path is None else None
+        self.path = path or os.path.join(_config_dir(), "tidal.ini")
+        self.key = ("file", os.path.abspath(self.path))
+
+    def load(self):
+        """Read the stored tokens, returning None if there are none."""
+        config = configparser.ConfigParser()
+        if len(config.read(self.path)) == 0:
+            if self.legacy_path is None or len(config.read(self.legacy_path)) == 0:
+                return None
+        if not config.has_option("tidal", "access_token"):
+            return None
+        if not config["tidal"]["access_token"]:
+            return None
+
+        return {
+            "token_type": config["tidal"].get("token_type", "Bearer"),
+            "access_token": config["tidal"]["access_token"],
+            "refresh_token": config["tidal"].get("refresh_token") or None,
+            "expiry_time": _parse_expiry(config["tidal"].get("expiry_time")),
+        }
+
+    def save(self, tokens):
+        """Write the tokens, replacing the file atomically so concurrent readers never see a partial file."""
+        config = configparser.ConfigParser()
+        config.add_section("tidal")
+        config.set("tidal", "token_type", tokens["token_type"])
+        config.set("tidal", "access_token", tokens["access_token"])
+        config.set("tidal", "refresh_token", tokens["refresh_token"] or "")
+        config.set("tidal", "expiry_time", _format_expiry(tokens["expiry_time"]))
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w") as configfile:
+            config.write(configfile)
+        os.replace(temp_path, self.path)
+
+    def lock(self):
+        """Lock the token file, so only one process refreshes or logs in at a time."""
+        return _file_lock(os.path.abspath(self.path))
+
+
+class EnvTokenStore:
+    """Token store that reads Tidal tokens from the PLAYLISTJOCKEY_TIDAL_ACCESS_TOKEN, PLAYLISTJOCKEY_TIDAL_REFRESH_TOKEN and
+    PLAYLISTJOCKEY_TIDAL_EXPIRY_TIME environment variables. Refreshed tokens are only saved to this process' environment.
+    """
+
+    key = ("env",)
 
-def first_time_connect():
-    """Establishes a config.ini file to store access tokens."""
-    # Establish config file
-    config = configparser.ConfigParser()
-    path = pkg_resources.resource_filename(__name__, "config.ini")
-    config.read(path)
+    def load(self):
+        """Read the tokens from the environment, returning None if there are none."""
+        if not os.environ.get(ENV_ACCESS_TOKEN):
+            return None
 
-    config.add_section("tidal")
-    config.set("tidal", "access_token", "")
-    config.set("tidal", "refresh_token", "")
+        return {
+            "token_type": "Bearer",
+            "access_token": os.environ[ENV_ACCESS_TOKEN],
+            "refresh_token": os.environ.get(ENV_REFRESH_TOKEN) or None,
+            "expiry_time": _parse_expiry(os.environ.get(ENV_EXPIRY_TIME)),
+        }
 
-    with open(path, "w") as configfile:
-        config.write(configfile)
+    def save(self, tokens):
+        """Write the tokens to this process' environment."""
+        os.environ[ENV_ACCESS_TOKEN] = tokens["access_token"]
+        os.environ[ENV_REFRESH_TOKEN] = tokens["refresh_token"] or ""
+        os.environ[ENV_EXPIRY_TIME] = _format_expiry(tokens["expiry_time"])
 
 
-def connect():
-    """Connects to Tidal's API using third party tidalapi package."""
-    config = configparser.ConfigParser()
-    path = pkg_resources.resource_filename(__name__, "config.ini")
-    if len(config.read(path)) == 0:
-        first_time_connect()
-    config.read(path)
+def default_token_store():
+    """Returns an EnvTokenStore if Tidal tokens are set in the environment, otherwise a FileTokenStore in the user's config directory."""
+    if os.environ.get(ENV_ACCESS_TOKEN):
+        return EnvTokenStore()
+    return FileTokenStore()
 
+
+def _store_key(token_store):
+    """Helper function to identify a token store in the in-process caches."""
+    return getattr(token_store, "key", ("object", id(token_store)))
+
+
+def _store_lock(token_store):
+    """Helper function to lock a token store, if it supports locking."""
+    if hasattr(token_store, "lock"):
+        return token_store.lock()
+    return contextlib.nullcontext()
+
+
+def _needs_refresh(tokens, refresh_margin):
+    """Helper function to check if an access token expires within the refresh margin."""
+    if tokens["expiry_time"] is None or tokens["refresh_token"] is None:
+        return False
+    margin = datetime.timedelta(seconds=refresh_margin)
+    # tidalapi keeps expiry times as naive UTC datetimes
+    now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    return tokens["expiry_time"] - margin <= now
+
+
+def _session_tokens(td):
+    """Helper function to read the tokens from a logged in session."""
+    return {
+        "token_type": td.token_type or "Bearer",
+        "access_token": td.access_token,
+        "refresh_token": td.refresh_token,
+        "expiry_time": td.expiry_time,
+    }
+
+
+def _new_session(transport=None):
+    """Creates a tidalapi session, sending requests through the given playlistjockey.transport.Transport when supplied."""
+    td = tidalapi.Session()
+    if transport is not None:
+        td.request_session = transport.session
+    return td
+
+
+def _throttled(call, *args, **kwargs):
+    """Helper function to make a call to Tidal, waiting and trying again when Tidal throttles it. Being throttled says nothing about the
+    tokens, so once the attempts run out the TooManyRequests error is raised rather than treating the tokens as rejected.
+    """
+    for attempt in range(THROTTLED_ATTEMPTS):
+        try:
+            return call(*args, **kwargs)
+        except tidalapi.exceptions.TooManyRequests as e:
+            if attempt == THROTTLED_ATTEMPTS - 1:
+                raise
+            time.sleep(e.retry_after if e.retry_after > 0 else 2**attempt)
+
+
+def _refresh(td, tokens, token_store):
+    """Helper function to renew an access token with its refresh token, saving the result to the token store."""
+    try:
+        refreshed = _throttled(td.token_refresh, tokens["refresh_token"])
+    except REJECTED_TOKEN_ERRORS:
+        refreshed = False
+    if not refreshed:
+        return None
+
+    # A refresh doesn't always return a new refresh token, so keep the stored one unless it was replaced
+    refreshed_tokens = _session_tokens(td)
+    tokens = dict(
+        tokens, **{k: v for k, v in refreshed_tokens.items() if v is not None}
+    )
+    token_store.save(tokens)
+    return tokens
+
+
+def _load_session(td, tokens):
+    """Helper function to log a session in with stored tokens, returning False if the tokens are rejected."""
     try:
-        access_token = config["tidal"]["access_token"]
-        refresh_token = config["tidal"]["refresh_token"]
-        td = tidalapi.Session()
-        td.load_oauth_session(
-            token_type="Bearer", access_token=access_token, refresh_token=refresh_token
+        return _throttled(
+            td.load_oauth_session,
+            token_type=tokens["token_type"],
+            access_token=tokens["access_token"],
+            refresh_token=tokens["refresh_token"],
+            expiry_time=tokens["expiry_time"],
         )
-    except:
-        print("Tidal session requires refresh:")
-        td = tidalapi.Session()
-        td.login_oauth_simple()
-        config["tidal"]["access_token"] = td.access_token
-        config["tidal"]["refresh_token"] = td.refresh_token
-        with open(path, "w") as configfile:
-            config.write(configfile)
+    except REJECTED_TOKEN_ERRORS:
+        return False
+
+
+def connect(
+    transport=None,
+    token_store=None,
+    interactive=True,
+    refresh_margin=REFRESH_MARGIN_S,
+):
+    """Connects to Tidal's API using third party tidalapi package.
+
+    Args:
+        transport (playlistjockey.transport.Transport object): HTTP transport used by the session.
+        token_store (object): Where tokens are loaded from and saved to: a FileTokenStore, an EnvTokenStore, or any object implementing
+            `load()` and `save(tokens)`. Defaults to `default_token_store()`.
+        interactive (bool): Open a browser login when no valid tokens are available. If False, a ConnectionError is raised instead.
+        refresh_margin (int): Renew access tokens that expire within this many seconds.
+
+    Returns:
+        td (tidalapi.session.Session object): Tidal API client used to connect to your account.
+    """
+    if token_store is None:
+        token_store = default_token_store()
+    key = (_store_key(token_store), id(transport))
+
+    # Reuse a session already logged in by this process, unless its token is about to expire
+    with _cache_lock:
+        td = _session_cache.get(key)
+        if td is not None and not _needs_refresh(_session_tokens(td), refresh_margin):
+            return td
+        tokens = _token_cache.get(key[0])
+
+    td = _new_session(transport)
+    if tokens is None:
+        tokens = token_store.load()
+
+    # Renew tokens that are about to expire, re-reading them first in case another worker already did
+    if tokens is not None and _needs_refresh(tokens, refresh_margin):
+        with _store_lock(token_store):
+            tokens = token_store.load() or tokens
+            if _needs_refresh(tokens, refresh_margin):
+                tokens = _refresh(td, tokens, token_store) or tokens
+
+    logged_in = tokens is not None and _load_session(td, tokens)
+
+    if not logged_in:
+        with _store_lock(token_store):
+            # Another worker may have logged in while this one waited for the lock
+            stored = token_store.load()
+            if stored is not None and stored != tokens:
+                tokens = stored
+                logged_in = _load_session(td, tokens)
+            if not logged_in and tokens is not None and tokens["refresh_token"]:
+                tokens = _refresh(td, tokens, token_store)
+                logged_in = tokens is not None and _load_session(td, tokens)
+            if not logged_in:
+                if not interactive:
+                    raise ConnectionError(
+                        "No valid Tidal tokens found. Log in once interactively, or supply tokens through a token store."
+                    )
+                print("Tidal session requires refresh:")
+                td.login_oauth_simple()
+                tokens = _session_tokens(td)
+                token_store.save(tokens)
+
+    with _cache_lock:
+        _token_cache[key[0]] = _session_tokens(td)
+        _session_cache[key] = td
+
     return td
@@ -2,39 +2,91 @@
 
 """Functions responsible for identify Tidal songs in Spotify, and extracting required features from tracks."""
 
-import logging
+import contextvars
+import functools
+import requests
+import tidalapi
 
 from playlistjockey import utils
+from playlistjockey.spotify import extract as sp_extract
 
+# Errors raised by tidalapi when a media ID doesn't belong to the requested media type
+NOT_FOUND_ERRORS = (tidalapi.exceptions.ObjectNotFound, requests.HTTPError)
+PAGE_SIZE = 100
 
-# Supress 404 error messages when a media ID is not a video
-logging.disable(logging.ERROR)
 
+def get_playlist_id(playlist_id):
+    """Strips a Tidal playlist ID out of a shared link."""
+    if playlist_id[:6] == "https:":
+        playlist_id = playlist_id.split("/")[5]
+    return playlist_id
 
-def search_by_isrc(sp, isrc):
-    # Establish the search query and
-    query = "isrc:" + isrc
 
-    # Establish output
-    result = None
+def get_playlist_media(playlist):
+    """Collects all media items in a playlist, tracks and videos alike, in a single pass over its pages."""
+    total = playlist.num_tracks + max(playlist.num_videos, 0)
 
-    # Search via ISRC, look through resulting tracks for a match
-    results = sp.search(query)["tracks"]["items"]
-    # Break if no results are returned
-    if len(results) != 0:
-        # Go through the results, looking for a matching ISRC
-        for i in results:
-            if i["external_ids"]["isrc"] is None:
-                pass
-            elif i["external_ids"]["isrc"] == isrc:
-                result = i["id"]
-                break
+    media = []
+    for offset in range(0, total, PAGE_SIZE):
+        media.extend(playlist.items(limit=PAGE_SIZE, offset=offset))
 
-    return result
+    return media
 
 
-def search_by_title_artist(sp, title, artist):
-    # Establish possible search queries
+def get_media(td, td_media_id):
+    """Fetches a media item by its ID, trying it as a track before trying it as a video."""
+    try:
+        return td.track(td_media_id)
+    except NOT_FOUND_ERRORS:
+        return td.video(td_media_id)
+
+
+def get_popularity(td, media_ids):
+    """Fetches the current popularity of the given media, skipping media that can no longer be found."""
+    popularity = {}
+    for i in media_ids:
+        try:
+            popularity[i] = round(get_media(td, i).popularity / 10)
+        except NOT_FOUND_ERRORS:
+            pass
+
+    return popularity
+
+
+def _match_isrc(results, isrc):
+    """Helper function to look through search results for a matching ISRC."""
+    # Go through the results, looking for a matching ISRC
+    for i in results:
+        if i["external_ids"]["isrc"] is None:
+            pass
+        elif i["external_ids"]["isrc"] == isrc:
+            return i["id"]
+
+    return None
+
+
+def _match_title_artist(results, title, artist):
+    """Helper function to look through search results for a matching title and artist."""
+    # Go through the results, looking for a matching title and artist
+    for i in results:
+        result_title = i["name"]
+        result_artist = i["artists"][0]["name"]
+        if utils.text_similarity(title, result_title) and utils.text_similarity(
+            artist, result_artist
+        ):
+            return i["id"]
+        elif utils.text_similarity(
+            utils.clean_title(title), utils.clean_title(result_title)
+        ) and utils.text_similarity(
+            utils.clean_artist(artist), utils.clean_artist(result_artist)
+        ):
+            return i["id"]
+
+    return None
+
+
+def _title_artist_searches(title, artist):
+    """Helper function to establish the title and artist search queries, in order of precedence, along with how to match their results."""
     queries = [
         "track:{}, artist:{}".format(title, artist),
         "track:{}, artist:{}".format(
@@ -43,113 +95,152 @@ def search_by_title_artist(sp, title, artist):
         "track:" + title,
         "track:" + utils.clean_title(title),
     ]
+    match = functools.partial(_match_title_artist, title=title, artist=artist)
 
-    # Establish query counter
-    query_no = 0
-
-    # Establish output
-    result = None
-
-    # Try to find the song in Spotify using the queries, matching on ISRC or song name and artist
-    while query_no != 4:
-        results = sp.search(queries[query_no])["tracks"]["items"]
-        # Break if no results are returned
-        if len(results) != 0:
-            # Go through the results, looking for a matching title and artist
-            for i in results:
-                result_title = i["name"]
-                result_artist = i["artists"][0]["name"]
-                if utils.text_similarity(title, result_title) and utils.text_similarity(
-                    artist, result_artist
-                ):
-                    result = i["id"]
-                    break
-                elif utils.text_similarity(
-                    utils.clean_title(title), utils.clean_title(result_title)
-                ) and utils.text_similarity(
-                    utils.clean_artist(artist), utils.clean_artist(result_artist)
-                ):
-                    result = i["id"]
-                    break
-        if result:
-            break
-        else:
-            query_no += 1
+    return [(query, match) for query in queries]
 
-    return result
 
+def _search(sp, query, match):
+    """Helper function to run a search query and match its results."""
+    results = sp.search(query)["tracks"]["items"]
+    return match(results)
 
-def get_spotify_id(sp, isrc, title, artist):
-    """Identifies the same Tidal song in Spotify, so that its features can be extracted."""
-    # Establish the output
-    result = None
 
-    # First try to find the song utilizing its ISRC
-    if isrc is not None:
-        result = search_by_isrc(sp, isrc)
+def _search_parallel(sp, searches, executor):
+    """Helper function to run all searches concurrently on the given executor, returning the match of the highest precedence search as soon as
+    it is known.
 
-    # If unsuccessful, try searching using its song title and artist text
-    if not result:
-        result = search_by_title_artist(sp, title, artist)
+    Searches of lower precedence that are still queued on the executor are cancelled, but those already running are left to finish, as a
+    request in flight can't be withdrawn. Bound the executor by the Spotify transport's pool size, so searches don't outnumber its
+    connections.
+    """
+    futures = [
+        executor.submit(contextvars.copy_context().run, _search, sp, query, match)
+        for query, match in searches
+    ]
+    try:
+        # Wait on the searches in order of precedence, so a match is only returned once every search above it has failed
+        for future in futures:
+            result = future.result()
+            if result:
+                return result
+    finally:
+        for future in futures:
+            future.cancel()
 
-    return result
+    return None
 
 
-def get_song_features(sp, td, td_media_id, genres=False):
-    """Acquires all necessary song features for the mixing algorithms to consider."""
-    # First see if the media ID belongs to a video
-    try:
-        td_media = td.video(td_media_id)
-        isrc = None
+def search_by_isrc(sp, isrc):
+    """Searches Spotify for a song by its ISRC."""
+    return _search(sp, "isrc:" + isrc, functools.partial(_match_isrc, isrc=isrc))
 
-    # If unsuccessful, extract as audio
-    except:
-        td_media = td.track(td_media_id)
-        isrc = td_media.isrc
 
-    # Pull in basic name and artist information
-    title = td_media.name
-    artist = td_media.artist.name
+def search_by_title_artist(sp, title, artist, executor=None):
+    """Searches Spotify for a song by its title and artist, trying looser queries until one matches. If an executor is given, all queries are
+    issued concurrently on it and the match of the strictest successful query is returned.
+    """
+    searches = _title_artist_searches(title, artist)
+    if executor is not None:
+        return _search_parallel(sp, searches, executor)
 
-    # Pull in all artists
-    artists = []
-    for i in td_media.artists:
-        artists.append(i.name)
+    # Try to find the song in Spotify using the queries, matching on song name and artist
+    for query, match in searches:
+        result = _search(sp, query, match)
+        if result:
+            return result
 
-    # Pull in Spotify track object
-    sp_track_id = get_spotify_id(sp, isrc, title, artist)
-    audio_info = sp.audio_features(sp_track_id)[0]
+    return None
+
+
+def spotify_id_searches(isrc, title, artist):
+    """Establishes the searches used to identify a Tidal song in Spotify, in order of precedence, along with how to match their results."""
+    # Search by ISRC first, then by song title and artist text
+    searches = []
+    if isrc is not None:
+        searches.append(("isrc:" + isrc, functools.partial(_match_isrc, isrc=isrc)))
+    searches.extend(_title_artist_searches(title, artist))
 
+    return searches
+
+
+def get_spotify_id(sp, isrc, title, artist, executor=None):
+    """Identifies the same Tidal song in Spotify, so that its features can be extracted. If an executor is given, the ISRC and title and
+    artist searches are issued concurrently on it, and the match with the highest precedence wins.
+    """
+    searches = spotify_id_searches(isrc, title, artist)
+    if executor is not None:
+        return _search_parallel(sp, searches, executor)
+
+    for query, match in searches:
+        result = _search(sp, query, match)
+        if result:
+            return result
+
+    return None
+
+
+def song_features_from(
+    td_media_id, sp_track_id, title, artists, isrc, duration, popularity, audio_info
+):
+    """Packages the details of a Tidal song and the audio features object of its Spotify match into the song features the mixing algorithms
+    consider."""
     # Pull in song key information and remaining features
     camelot = utils.spotify_key_to_camelot(audio_info["key"], audio_info["mode"])
 
-    song_features = {
-        "track_id": td_media.id,
+    return {
+        "track_id": td_media_id,
         "sp_track_id": sp_track_id,
         "title": title,
         "artists": artists,
-        "duration_s": round(td_media.duration, 1),
+        "isrc": isrc,
+        "duration_s": round(duration, 1),
         "key": camelot,
         "bpm": round(audio_info["tempo"]),
         "energy": round(audio_info["energy"] * 10),
         "danceability": round(audio_info["danceability"] * 10),
-        "popularity": round(td_media.popularity / 10),
+        "popularity": round(popularity / 10),
     }
 
+
+def get_song_features(sp, td, td_media, genres=False, search_executor=None):
+    """Acquires all necessary song features for the mixing algorithms to consider. td_media is either a track or video object already paged
+    in from a playlist, or a media ID to fetch. If a search_executor is given, the Spotify search queries are issued concurrently on it.
+    """
+    # Media objects from the playlist already carry their type and metadata
+    if not isinstance(td_media, tidalapi.media.Media):
+        td_media = get_media(td, td_media)
+
+    # Videos don't have an ISRC to search Spotify with
+    isrc = None
+    if isinstance(td_media, tidalapi.media.Track):
+        isrc = td_media.isrc
+
+    # Pull in basic name and artist information
+    title = td_media.name
+    artist = td_media.artist.name
+
+    # Pull in all artists
+    artists = []
+    for i in td_media.artists:
+        artists.append(i.name)
+
+    # Pull in Spotify track object
+    sp_track_id = get_spotify_id(sp, isrc, title, artist, search_executor)
+    audio_info = sp.audio_features(sp_track_id)[0]
+
+    song_features = song_features_from(
+        td_media.id,
+        sp_track_id,
+        title,
+        artists,
+        isrc,
+        td_media.duration,
+        td_media.popularity,
+        audio_info,
+    )
+
     if genres:
-        # Get basic Spotify track object
-        basic_info = sp.track(sp_track_id)
-
-        # Collect the genres the track's artists, and their related artists
-        genres = []
-        for i in basic_info["artists"]:
-            genres.append(sp.artist(i["id"])["genres"])
-            for j in sp.artist_related_artists(i["id"])["artists"]:
-                genres.append(j["genres"])
-        genres = [i for sublist in genres for i in sublist]  # flatten genres
-        genres = list(set(genres))  # remove duplicates
-
-        # Attach to dict
-        song_features.update({"genres": genres})
+        song_features.update({"genres": sp_extract.get_track_genres(sp, sp_track_id)})
 
     return song_features
@@ -0,0 +1,298 @@
+# playlistjockey/tracing.py
+
+"""Module containing the tracing used to see where playlist load time goes.
+
+A `Tracer` records a span for every provider call made through a traced Spotify or Tidal client, with its endpoint, latency, the bytes
+of response body received (after decompression), and how many times its HTTP requests were retried. HTTP requests made outside of a traced call, such as those made by tidalapi
+playlist objects, are recorded as spans of their own. Spans are grouped into runs, one per playlist loaded or updated.
+
+The module contains the following classes and functions:
+
+- `Tracer()`: Records the spans of provider calls.
+    - `instrument(self, transport)`: Attribute the bytes and retries of requests sent through a playlistjockey.transport.Transport to the spans.
+    - `summary(self, run=None)`: Aggregate the recorded spans per provider and endpoint.
+    - `to_json(self, path)`: Write the recorded spans and their summary to a JSON file.
+    - `export(self, url="http://localhost:4318/v1/traces")`: Send the recorded spans to a local OpenTelemetry collector.
+- `traced(client, tracer, provider)`: Wraps a Spotify or Tidal API client so that each of its calls is recorded as a span.
+- `traced_run(provider)`: Decorator grouping the spans of a Spotify or Tidal method into a run named after the playlist.
+"""
+
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+
+import pandas as pd
+import requests
+
+# Span of the provider call currently running, and the run it belongs to
+_current_span = contextvars.ContextVar("playlistjockey_span", default=None)
+_current_run = contextvars.ContextVar("playlistjockey_run", default=None)
+
+
+class Tracer:
+    """Records the spans of provider calls.
+
+    Attributes:
+        spans (list): Recorded spans, each a dict with the "run", "provider", "endpoint", "start", "latency_s", "bytes", "retries", "requests"
+            and "error" of a call.
+    """
+
+    def __init__(self):
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def _new_span(self, provider, endpoint):
+        """Helper function to create a span starting now."""
+        return {
+            "span_id": os.urandom(8).hex(),
+            "run": _current_run.get(),
+            "provider": provider,
+            "endpoint": endpoint,
+            "start": time.time(),
+            "latency_s": None,
+            "bytes": 0,
+            "retries": 0,
+            "requests": 0,
+            "error": None,
+        }
+
+    def _record(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    @contextlib.contextmanager
+    def span(self, provider, endpoint):
+        """Context manager recording a provider call as a span."""
+        span = self._new_span(provider, endpoint)
+        token = _current_span.set(span)
+        started = time.perf_counter()
+        try:
+            yield span
+        except Exception as e:
+            span["error"] = repr(e)
+            raise
+        finally:
+            span["latency_s"] = time.perf_counter() - started
+            _current_span.reset(token)
+            self._record(span)
+
+    def _on_response(self, response, *args, **kwargs):
+        """Response hook adding a request's size and retries to the current span."""
+        span = _current_span.get()
+        if span is None:
+            # Requests made outside of a traced call get a span of their own
+            span = self._new_span(
+                _provider_from_host(response.url), "HTTP " + response.request.method
+            )
+            span["endpoint"] += " " + requests.utils.urlparse(response.url).path
+            span["latency_s"] = response.elapsed.total_seconds()
+            span["start"] -= span["latency_s"]
+            self._record(span)
+
+        # Count decompressed body bytes, as Content-Length is missing from chunked responses and is the compressed size of gzipped ones
+        size = len(response.content)
+        retries = getattr(getattr(response.raw, "retries", None), "history", ())
+
+        span["bytes"] += int(size)
+        span["retries"] += len(retries)
+        span["requests"] += 1
+
+    def instrument(self, transport):
+        """Attribute the bytes and retries of requests sent through a playlistjockey.transport.Transport to the spans."""
+        hooks = transport.session.hooks["response"]
+        if self._on_response not in hooks:
+            hooks.append(self._on_response)
+
+    def summary(self, run=None):
+        """Aggregate the recorded spans per provider and endpoint.
+
+        Args:
+            run (str): Only summarize the spans of this run, such as "spotify:<playlist ID>".
+
+        Returns:
+            summary_df (pd.DataFrame): DataFrame with the number of calls, errors, retries and bytes, and the total, mean and 95th percentile
+                latency of each provider and endpoint.
+        """
+        with self._lock:
+            spans_df = pd.DataFrame(self.spans)
+        columns = [
+            "provider",
+            "endpoint",
+            "calls",
+            "errors",
+            "retries",
+            "bytes",
+            "total_s",
+            "mean_s",
+            "p95_s",
+        ]
+        if len(spans_df) == 0:
+            return pd.DataFrame(columns=columns)
+        if run is not None:
+            spans_df = spans_df[spans_df["run"] == run]
+
+        summary_df = spans_df.groupby(["provider", "endpoint"]).agg(
+            calls=("span_id", "count"),
+            errors=("error", "count"),
+            retries=("retries", "sum"),
+            bytes=("bytes", "sum"),
+            total_s=("latency_s", "sum"),
+            mean_s=("latency_s", "mean"),
+            p95_s=("latency_s", lambda x: x.quantile(0.95)),
+        )
+        summary_df = summary_df.reset_index().sort_values(by="total_s", ascending=False)
+
+        return summary_df[columns]
+
+    def to_json(self, path):
+        """Write the recorded spans and their summary to a JSON file."""
+        with self._lock:
+            spans = list(self.spans)
+        output = {
+            "spans": spans,
+            "summary": self.summary().to_dict(orient="records"),
+        }
+        with open(path, "w") as json_file:
+            json.dump(output, json_file, indent=2, default=str)
+
+    def export(self, url="http://localhost:4318/v1/traces"):
+        """Send the recorded spans to a local OpenTelemetry collector, using the OTLP/HTTP JSON protocol."""
+        with self._lock:
+            spans = list(self.spans)
+
+        # Spans of the same run share a trace ID
+        trace_ids = {}
+        otlp_spans = []
+        for span in spans:
+            trace_id = trace_ids.setdefault(span["run"], os.urandom(16).hex())
+            start_ns = int(span["start"] * 1e9)
+            attributes = {
+                "playlistjockey.provider": span["provider"],
+                "playlistjockey.run": span["run"] or "",
+                "http.response.body.size": span["bytes"],
+                "http.request.resend_count": span["retries"],
+                "http.requests": span["requests"],
+            }
+            otlp_spans.append(
+                {
+                    "traceId": trace_id,
+                    "spanId": span["span_id"],
+                    "name": span["endpoint"],
+                    "kind": 3,
+                    "startTimeUnixNano": str(start_ns),
+                    "endTimeUnixNano": str(
+                        start_ns + int((span["latency_s"] or 0) * 1e9)
+                    ),
+                    "attributes": [
+                        {"key": k, "value": _otlp_value(v)}
+                        for k, v in attributes.items()
+                    ],
+                    "status": (
+                        {"code": 2, "message": span["error"]}
+                        if span["error"]
+                        else {"code": 1}
+                    ),
+                }
+            )
+
+        payload = {
+            "resourceSpans": [
+                {
+                    "resource": {
+                        "attributes": [
+                            {
+                                "key": "service.name",
+                                "value": {"stringValue": "playlistjockey"},
+                            }
+                        ]
+                    },
+                    "scopeSpans": [
+                        {"scope": {"name": "playlistjockey"}, "spans": otlp_spans}
+                    ],
+                }
+            ]
+        }
+        response = requests.post(url, json=payload, timeout=10)
+        response.raise_for_status()
+
+
+def _otlp_value(value):
+    """Helper function to convert an attribute value to its OTLP representation."""
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    return {"stringValue": str(value)}
+
+
+def _provider_from_host(url):
+    """Helper function to name the provider of an untraced request from its host."""
+    host = requests.utils.urlparse(url).hostname or ""
+    if "spotify" in host:
+        return "spotify"
+    if "tidal" in host:
+        return "tidal"
+    return host
+
+
+class _TracedClient:
+    """Proxy of a Spotify or Tidal API client that records each public method call as a span."""
+
+    def __init__(self, client, tracer, provider):
+        self.__dict__["_client"] = client
+        self.__dict__["_tracer"] = tracer
+        self.__dict__["_provider"] = provider
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith("_") or not callable(attribute):
+            return attribute
+
+        @functools.wraps(attribute)
+        def call(*args, **kwargs):
+            with self._tracer.span(self._provider, name):
+                return attribute(*args, **kwargs)
+
+        return call
+
+    def __setattr__(self, name, value):
+        setattr(self._client, name, value)
+
+
+def traced(client, tracer, provider):
+    """Wraps a Spotify or Tidal API client so that each of its calls is recorded as a span. Returns the client unchanged if tracer is None."""
+    if tracer is None:
+        return client
+    return _TracedClient(client, tracer, provider)
+
+
+def traced_run(provider):
+    """Decorator grouping the spans of a Spotify or Tidal method, or coroutine method, whose first argument is a playlist ID, into a run named after the playlist."""
+
+    def decorator(method):
+        if inspect.iscoroutinefunction(method):
+
+            @functools.wraps(method)
+            async def async_wrapper(self, playlist_id, *args, **kwargs):
+                token = _current_run.set("{}:{}".format(provider, playlist_id))
+                try:
+                    return await method(self, playlist_id, *args, **kwargs)
+                finally:
+                    _current_run.reset(token)
+
+            return async_wrapper
+
+        @functools.wraps(method)
+        def wrapper(self, playlist_id, *args, **kwargs):
+            token = _current_run.set("{}:{}".format(provider, playlist_id))
+            try:
+                return method(self, playlist_id, *args, **kwargs)
+            finally:
+                _current_run.reset(token)
+
+        return wrapper
+
+    return decorator
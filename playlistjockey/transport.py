@@ -0,0 +1,91 @@
+# playlistjockey/transport.py
+
+"""Module containing the HTTP transport shared by the Spotify and Tidal clients.
+
+The module contains the following classes:
+
+- `Transport(pool_size=16, timeout=(3.05, 27), retries=3, backoff_factor=0.3)`: Pooled HTTP transport with keep-alive, compression, timeouts and retries.
+    - `stats(self)`: Report how many requests and connections have been made to each host, and how many requests reused a connection.
+"""
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Throttled and failed responses that are worth retrying
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class _TimeoutSession(requests.Session):
+    """Requests session that applies a default timeout to every request, including those made by tidalapi."""
+
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get("timeout") is None:
+            kwargs["timeout"] = self.timeout
+        return super().request(method, url, **kwargs)
+
+
+class Transport:
+    """Pooled HTTP transport with keep-alive, compression, timeouts and retries, shared by the Spotify and Tidal clients.
+
+    Args:
+        pool_size (int): Maximum number of connections kept alive per host. Set this to at least the number of concurrent workers loading songs.
+        timeout (tuple): Connect and read timeouts in seconds.
+        retries (int): Number of times a failed connection or throttled request (429/5xx) is retried.
+        backoff_factor (float): Backoff factor between retries, in seconds.
+
+    Attributes:
+        session (requests.Session object): Session passed to the Spotify and Tidal clients.
+    """
+
+    def __init__(self, pool_size=16, timeout=(3.05, 27), retries=3, backoff_factor=0.3):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff_factor = backoff_factor
+
+        retry = Retry(
+            total=retries,
+            read=False,
+            status=retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            respect_retry_after_header=True,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+        )
+
+        self.session = _TimeoutSession(timeout)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(
+            {"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"}
+        )
+
+    def stats(self):
+        """Report how many requests and connections have been made to each host, and how many requests reused a connection.
+
+        Returns:
+            stats (dict): Dict keyed by host, containing the "requests", "connections" and "reused" counts.
+        """
+        stats = {}
+        for adapter in set(self.session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                try:
+                    pool = pools[key]
+                except KeyError:
+                    continue
+                host = stats.setdefault(
+                    pool.host, {"requests": 0, "connections": 0, "reused": 0}
+                )
+                host["requests"] += pool.num_requests
+                host["connections"] += pool.num_connections
+                host["reused"] += max(pool.num_requests - pool.num_connections, 0)
+
+        return stats
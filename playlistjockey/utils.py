@@ -3,9 +3,14 @@
 """Module containing helper functions to assist various functions in `playlistjockey`.
 
 The module contains the following functions:
+- `cache_dir(*parts)`: Returns a directory inside the user's playlistjockey cache directory, creating it if necessary.
+- `seeded_random(seed)`: Context manager that seeds the random module for a block, restoring the caller's random state afterwards.
 - `show_tracks(results, results_array)`: Helper function to ensure the all songs are extracted from a Spotify playlist with more than 100 songs.
 - `show_playlists(results, results_array)`: Helper function to ensure all playlists are extracted from a Spotify user with more than 100 playlists.
 - `spotify_key_to_camelot(spotify_key, spotify_mode)`: Converts Spotipy's key and mode notation to camelot notation.
+- `camelot_code(camelot_key)`: Converts a camelot key to its integer code.
+- `camelot_codes(keys)`: Converts a column of camelot keys to an int8 array of codes.
+- `compact_playlist(playlist_df)`: Converts a playlist df to a compact dtype layout that uses a fraction of the memory.
 - `move_song(donor_df, recipient_df, next_song_index, select_type=None)`: Helper function that moves a song from the donor_df to the recipient_df, given its index.
 - `clean_title(string)`: Helper function to remove any aspects of a song title that may hinder searching for it.
 - `clean_artist(string)`: Helper function to remove any aspects of a artist title that may hinder searching for it.
@@ -14,9 +19,108 @@ The module contains the following functions:
 """
 
 import pandas as pd
+import numpy as np
+import contextlib
+import os
+import random
 import re
+import sys
+import threading
 from difflib import SequenceMatcher as sm
 
+# Camelot keys ordered by wheel position, then mode
+CAMELOT_KEYS = ["{}{}".format(i, mode) for i in range(1, 13) for mode in "AB"]
+
+# Integer code of each camelot key: (wheel position - 1) * 2 + mode, where A is 0 and B is 1
+CAMELOT_CODES = {key: code for code, key in enumerate(CAMELOT_KEYS)}
+
+# Spotipy's (key, mode) notation mapped to camelot notation
+SPOTIFY_TO_CAMELOT = {
+    (0, 1): "8B",
+    (1, 1): "3B",
+    (2, 1): "10B",
+    (3, 1): "5B",
+    (4, 1): "12B",
+    (5, 1): "7B",
+    (6, 1): "2B",
+    (7, 1): "9B",
+    (8, 1): "4B",
+    (9, 1): "11B",
+    (10, 1): "6B",
+    (11, 1): "1B",
+    (0, 0): "5A",
+    (1, 0): "12A",
+    (2, 0): "7A",
+    (3, 0): "2A",
+    (4, 0): "9A",
+    (5, 0): "4A",
+    (6, 0): "11A",
+    (7, 0): "6A",
+    (8, 0): "1A",
+    (9, 0): "8A",
+    (10, 0): "3A",
+    (11, 0): "10A",
+}
+
+
+def _key_compatibility():
+    """Helper function to build the key compatibility matrix: a key mixes with itself, the other mode at the same wheel position, and its
+    neighbours on the wheel in the same mode."""
+    matrix = np.zeros((len(CAMELOT_KEYS), len(CAMELOT_KEYS)), dtype=bool)
+    for code in range(len(CAMELOT_KEYS)):
+        position, mode = divmod(code, 2)
+        for neighbour in [
+            code,
+            position * 2 + (1 - mode),
+            (position + 1) % 12 * 2 + mode,
+            (position - 1) % 12 * 2 + mode,
+        ]:
+            matrix[code, neighbour] = True
+    return matrix
+
+
+# KEY_COMPATIBILITY[a, b] is True if a song in camelot key code b can follow a song in key code a
+KEY_COMPATIBILITY = _key_compatibility()
+
+# Columns of a compact playlist df that hold 0-10 scores
+SCORE_COLUMNS = ["energy", "danceability", "popularity", "artist_similarity"]
+
+
+def cache_dir(*parts):
+    """Returns a directory inside the user's playlistjockey cache directory, creating it if necessary. The location can be overridden with the
+    PLAYLISTJOCKEY_CACHE_DIR environment variable."""
+    base = os.environ.get("PLAYLISTJOCKEY_CACHE_DIR")
+    if not base:
+        xdg = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+            os.path.expanduser("~"), ".cache"
+        )
+        base = os.path.join(xdg, "playlistjockey")
+
+    path = os.path.join(base, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# Held while the random module is seeded, so concurrent seeded mixes don't draw from each other's state
+_random_lock = threading.RLock()
+
+
+@contextlib.contextmanager
+def seeded_random(seed):
+    """Context manager that seeds the random module for a block, restoring the caller's random state afterwards. Does nothing if seed is
+    None."""
+    if seed is None:
+        yield
+        return
+
+    with _random_lock:
+        state = random.getstate()
+        random.seed(seed)
+        try:
+            yield
+        finally:
+            random.setstate(state)
+
 
 def show_tracks(results, results_array):
     """Helper function to ensure the all songs are extracted from a Spotify playlist with more than 100 songs."""
@@ -36,37 +140,64 @@ def show_playlists(results, results_array):
 
 def spotify_key_to_camelot(spotify_key, spotify_mode):
     """Converts Spotipy's key and mode notation to camelot notation."""
-    camelot_dict = {
-        (0, 1): "8B",
-        (1, 1): "3B",
-        (2, 1): "10B",
-        (3, 1): "5B",
-        (4, 1): "12B",
-        (5, 1): "7B",
-        (6, 1): "2B",
-        (7, 1): "9B",
-        (8, 1): "4B",
-        (9, 1): "11B",
-        (10, 1): "6B",
-        (11, 1): "1B",
-        (0, 0): "5A",
-        (1, 0): "12A",
-        (2, 0): "7A",
-        (3, 0): "2A",
-        (4, 0): "9A",
-        (5, 0): "4A",
-        (6, 0): "11A",
-        (7, 0): "6A",
-        (8, 0): "1A",
-        (9, 0): "8A",
-        (10, 0): "3A",
-        (11, 0): "10A",
-    }
-
-    camelot_key = camelot_dict[(spotify_key, spotify_mode)]
+    camelot_key = SPOTIFY_TO_CAMELOT[(spotify_key, spotify_mode)]
     return camelot_key
 
 
+def camelot_code(camelot_key):
+    """Converts a camelot key to its integer code, its index in CAMELOT_KEYS. Integer codes are returned unchanged."""
+    if isinstance(camelot_key, str):
+        return CAMELOT_CODES[camelot_key]
+    return int(camelot_key)
+
+
+def camelot_codes(keys):
+    """Converts a column of camelot keys, stored as strings, a compact categorical, or integer codes, to an int8 array of codes. Missing and
+    unknown keys are coded as -1."""
+    if (
+        isinstance(keys.dtype, pd.CategoricalDtype)
+        and list(keys.cat.categories) == CAMELOT_KEYS
+    ):
+        return keys.cat.codes.to_numpy()
+    if pd.api.types.is_integer_dtype(keys):
+        return keys.to_numpy(dtype=np.int8)
+    return keys.map(CAMELOT_CODES).fillna(-1).to_numpy(dtype=np.int8)
+
+
+def compact_playlist(playlist_df):
+    """Converts a playlist df to a compact dtype layout that uses a fraction of the memory.
+
+    Scores are stored as int8, bpm as uint8, keys as a categorical over the 24 camelot keys, and artist names are interned so each name is
+    only stored once. Score and bpm columns with missing values, such as the artist similarity of songs merged in from a playlist without
+    genres, are kept as floats, since integer dtypes can't hold NaN. The filters and selects operate on this layout directly.
+    """
+    df = playlist_df.copy()
+
+    # 0-10 scores fit in a signed byte, leaving room for the +-1 filters
+    for column in SCORE_COLUMNS:
+        if column in df and df[column].notna().all():
+            df[column] = df[column].astype(np.int8)
+
+    # Tempos are kept in a byte unless the playlist has something exceptionally fast
+    if "bpm" in df and df["bpm"].notna().all():
+        if df["bpm"].max() < 256:
+            df["bpm"] = df["bpm"].astype(np.uint8)
+        else:
+            df["bpm"] = df["bpm"].astype(np.uint16)
+
+    if "duration_s" in df:
+        df["duration_s"] = df["duration_s"].astype(np.float32)
+
+    if "key" in df:
+        df["key"] = pd.Categorical(df["key"], categories=CAMELOT_KEYS)
+
+    # Dictionary-encode artist names by sharing one string object per artist
+    if "artists" in df:
+        df["artists"] = [[sys.intern(i) for i in j] for j in df["artists"]]
+
+    return df
+
+
 def move_song(donor_df, recipient_df, next_song_index, select_type=None):
     """Helper function that moves a song from the donor_df to the recipient_df, given its index."""
     # Establish the select_type column in the donor df
@@ -18,10 +18,16 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     install_requires=[
         "pandas",
+        "requests",
         "scikit-learn",
+        "scipy",
         "spotipy",
-        "tidalapi"
+        "tidalapi>=0.7.5"
     ],
+    extras_require={
+        "storage": ["pyarrow"],
+        "async": ["httpx"],
+    },
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent"
@@ -0,0 +1,70 @@
+import datetime
+import urllib.parse
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from playlistjockey.tidal import connect
+
+
+class _RejectingAdapter(BaseAdapter):
+    """Answers every request with a 401, like Tidal does for an expired or revoked access token."""
+
+    def __init__(self):
+        super().__init__()
+        self.urls = []
+
+    def send(self, request, **kwargs):
+        self.urls.append(urllib.parse.urlsplit(request.url).path)
+        response = requests.Response()
+        response.status_code = 401
+        response._content = (
+            b'{"error": "invalid_grant", "error_description": "Token revoked"}'
+        )
+        response.url = request.url
+        response.request = request
+        return response
+
+    def close(self):
+        pass
+
+
+class _Transport:
+    def __init__(self, adapter):
+        self.session = requests.Session()
+        self.session.mount("https://", adapter)
+
+
+class _MemoryTokenStore:
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def load(self):
+        return self.tokens
+
+    def save(self, tokens):
+        self.tokens = tokens
+
+
+def test_rejected_token_falls_back_to_refresh_and_login():
+    connect._token_cache.clear()
+    connect._session_cache.clear()
+    adapter = _RejectingAdapter()
+    token_store = _MemoryTokenStore(
+        {
+            "token_type": "Bearer",
+            "access_token": "revoked",
+            "refresh_token": "refresh",
+            "expiry_time": datetime.datetime(2100, 1, 1),
+        }
+    )
+
+    # A 401 from the sessions endpoint must not crash connect, but go on to the refresh and then the login
+    with pytest.raises(ConnectionError, match="No valid Tidal tokens"):
+        connect.connect(
+            transport=_Transport(adapter), token_store=token_store, interactive=False
+        )
+
+    assert any(path.endswith("/sessions") for path in adapter.urls)
+    assert any(path.endswith("/oauth2/token") for path in adapter.urls)